@@ -1,32 +1,35 @@
 from apscheduler.triggers.cron import CronTrigger
-import requests
 import json
 import logging
-from app.config import RAGConfig
 import os
 logging.basicConfig(level=logging.INFO)
 
-def setup_cron_jobs(scheduler):
+def setup_cron_jobs(scheduler, actions: dict):
     """
-    Setup cron jobs based on the provided API configuration.
+    Setup cron jobs from cron_config.json. actions maps each configured job
+    name to the coroutine function that starts it in-process.
     """
     config_path = os.path.join(os.path.dirname(__file__), "data", "cron_config.json")
     with open(config_path, 'r') as file:
         api_config = json.load(file)
     for api in api_config:
-        schedule_api_call(scheduler, api)
+        schedule_api_call(scheduler, api, actions)
     
     # scheduler.start()
     logging.info("Cron jobs have been set up and started.")
     
     return scheduler
 
-def schedule_api_call(scheduler, api):
+def schedule_api_call(scheduler, api, actions: dict):
     """
-    Schedule an API call based on the cron configuration.
+    Schedule a job based on the cron configuration.
     """
-    url = RAGConfig().api_base_url + "/" + api["url"]
-    method = api["method"].upper()
+    # Older configs name the endpoint the job used to be triggered through.
+    name = api.get("job") or api.get("url")
+    action = actions.get(name)
+    if action is None:
+        logging.error(f"Unknown cron job: {name}")
+        return
     cron_str = api["cron"]  # e.g., "*/10 * * * * *"
 
     # Split the cron string into fields
@@ -53,25 +56,10 @@ def schedule_api_call(scheduler, api):
         raise ValueError(f"Invalid cron expression: {cron_str}")
 
     scheduler.add_job(
-        func=call_api,
+        func=action,
         trigger=trigger,
-        kwargs={"url": url, "method": method}
-    )    
-    logging.info(f"Scheduled {method} {url} with cron: {cron_str}")
-    
-def call_api(url, method):
-    """
-    Function to make an API call.
-    """
-    try:
-        if method == "POST":
-            response = requests.post(url)
-        elif method == "GET":
-            response = requests.get(url)
-        else:
-            logging.error(f"Unsupported HTTP method: {method}")
-            return
-
-        logging.info(f"API call to {url} completed with status code {response.status_code}")
-    except Exception as e:
-        logging.error(f"Error calling {url}: {e}")
+        id=name,
+        max_instances=1,
+        coalesce=True
+    )
+    logging.info(f"Scheduled {name} with cron: {cron_str}")
@@ -0,0 +1,45 @@
+from fastapi import Request, HTTPException
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.db.file_fingerprints_DAO import FileFingerprintsDAO
+from app.db.index_shards_DAO import IndexShardsDAO
+from app.rag.faiss.shard_manager import ShardManager
+from app.rag.vector_embedding import VectorEmbedding
+from app.rag.search_coalescer import SearchCoalescer
+from app.core.JobManager import JobManager
+from app.core.IndexingJobs import IndexingJobs
+
+# Application-scoped services, created once in the lifespan handler (see app.main)
+# and handed to routes through Depends.
+
+def get_tree_sitter_dao(request: Request) -> TreeSitterChunksDAO:
+    return request.app.state.tree_sitter_dao
+
+def get_file_fingerprints_dao(request: Request) -> FileFingerprintsDAO:
+    return request.app.state.file_fingerprints_dao
+
+def get_vector_embedding(request: Request) -> VectorEmbedding:
+    return request.app.state.vector_embedding
+
+def get_search_coalescer(request: Request) -> SearchCoalescer:
+    return request.app.state.search_coalescer
+
+def get_job_manager(request: Request) -> JobManager:
+    return request.app.state.job_manager
+
+def get_indexing_jobs(request: Request) -> IndexingJobs:
+    return request.app.state.indexing_jobs
+
+def get_index_shards_dao(request: Request) -> IndexShardsDAO:
+    return request.app.state.index_shards_dao
+
+def get_shard_manager(request: Request) -> ShardManager:
+    return request.app.state.shards
+
+def get_repository(request: Request, repository: str | None = None) -> str:
+    """
+    The repository named by the repository query parameter, or the default one.
+    """
+    try:
+        return request.app.state.shards.resolve(repository)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown repository: {repository}")
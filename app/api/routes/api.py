@@ -1,21 +1,22 @@
-
 from app.api.routes.parse_codebase import router as parse_codebase_router
 from app.api.routes.rag_api import router as rag_api_router
-from fastapi import APIRouter
-from app.config import RAGConfig 
-import time
-import requests
+from app.api.routes.jobs import router as jobs_router
+from app.api.routes.shards import router as shards_router
+from app.core.IndexingJobs import IndexingJobs
+from app.api.dependencies import get_indexing_jobs, get_repository
+from fastapi import APIRouter, Depends
 router = APIRouter()
 router.include_router(parse_codebase_router)
 router.include_router(rag_api_router)
-
-base_url = RAGConfig().api_base_url
+router.include_router(jobs_router)
+router.include_router(shards_router)
 
 @router.post("/refresh-vectors")
-def refresh_vectors():
-    requests.delete(base_url + "/delete-all-vectors")
-    requests.delete(base_url + "/delete-all-chunks")
-    requests.post(base_url + "/parse")
-    time.sleep(10)
-    requests.post(base_url + "/create-vectors",json={})
-    return {"message": "Vectors refreshed"}
\ No newline at end of file
+async def refresh_vectors(repository: str = Depends(get_repository), indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
+    """
+    Re-index only the files of a repository that changed since the last
+    refresh. Runs as a background job; a refresh of the same repository
+    already queued or running is reused.
+    """
+    job = await indexing_jobs.refresh(repository)
+    return {"message": "Vectors refresh triggered", "job_id": job.job_id}
\ No newline at end of file
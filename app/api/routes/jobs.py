@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.core.JobManager import JobManager
+from app.api.dependencies import get_job_manager
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/jobs")
+async def list_jobs(job_manager: JobManager = Depends(get_job_manager)):
+    """
+    List background jobs, newest first.
+    """
+    return {"jobs": [job.get_job_info() for job in job_manager.list()]}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    """
+    Status, stage progress and throughput of one job.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.get_job_info()
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    """
+    Cancel a queued or running job.
+    """
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"No active job: {job_id}")
+    logger.info(f"Cancellation requested for job {job_id}")
+    return {"message": "Job cancellation requested", "job_id": job_id}
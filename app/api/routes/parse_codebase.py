@@ -1,6 +1,7 @@
-from fastapi import APIRouter
-from app.core.CodeBaseParser import CodeBaseParser
-from app.config import RAGConfig
+from fastapi import APIRouter, Depends, HTTPException
+from app.core.IndexingJobs import IndexingJobs
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.api.dependencies import get_tree_sitter_dao, get_indexing_jobs, get_repository
 import asyncio
 import logging
 
@@ -10,38 +11,45 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/parse")
-async def parse_codebase():
-    asyncio.create_task(CodeBaseParser(RAGConfig().codebase_path).parse_code())
-    # Process the data
-    logger.info("Codebase parsed successfully")
-    return {"message": "Codebase parsed successfully"}
+async def parse_codebase(repository: str = Depends(get_repository), indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
+    """
+    Start parsing a repository (the default one unless ?repository= names
+    another) as a background job; poll /jobs/{job_id} for progress.
+    """
+    job = await indexing_jobs.parse(repository)
+    logger.info(f"Parse of {repository} started as job {job.job_id}")
+    return {"message": "Codebase parse started", "job_id": job.job_id}
 
 @router.get("/get-chunks-by-filename")
-async def get_chunks_by_filename(file_path: str):
+async def get_chunks_by_filename(file_path: str, tree_sitter_dao: TreeSitterChunksDAO = Depends(get_tree_sitter_dao)):
     """
     Get all chunks for a specific file.
     """
-    code_base_parser = CodeBaseParser(RAGConfig().codebase_path)
-    chunks = await code_base_parser.tree_sitter_chunks_dao.get_chunks_by_file(file_path)
+    chunks = await tree_sitter_dao.get_chunks_by_file(file_path)
     logger.info(f"Retrieved {len(chunks)} chunks for file: {file_path}")
     return {"chunks": [chunk.get_chunk_info() for chunk in chunks]}
 
 @router.delete("/delete-chunks-by-filename")
-async def delete_chunks_by_filename(file_path: str):
+async def delete_chunks_by_filename(file_path: str, indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
     """
-    Delete all chunks for a specific file.
+    Delete all chunks for a specific file. Runs as a job so it is serialized
+    with other writers, and returns once it has finished.
     """
-    code_base_parser = CodeBaseParser(RAGConfig().codebase_path)
-    await code_base_parser.tree_sitter_chunks_dao.delete_chunks_by_file(file_path)
+    job = await indexing_jobs.delete_file(file_path)
+    await asyncio.shield(job.task)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=500, detail=job.error or f"Job {job.status}")
     logger.info(f"Deleted chunks for file: {file_path}")
-    return {"message": "Chunks deleted successfully"}
+    return {"message": "Chunks deleted successfully", "job_id": job.job_id}
 
 @router.delete("/delete-all-chunks")
-async def delete_all_chunks():
+async def delete_all_chunks(repository: str | None = None, indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
     """
-    Delete all chunks from the MongoDB collection.
+    Delete all chunks from the MongoDB collection, or only one repository's.
     """
-    code_base_parser = CodeBaseParser(RAGConfig().codebase_path)
-    asyncio.create_task(code_base_parser.tree_sitter_chunks_dao.delete_all_chunks())
-    logger.info("All chunks deleted successfully")
-    return {"message": "All chunks deleted successfully"}
\ No newline at end of file
+    try:
+        job = await indexing_jobs.delete_all_chunks(repository)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown repository: {repository}")
+    logger.info(f"Deleting all chunks as job {job.job_id}")
+    return {"message": "All chunks deletion started", "job_id": job.job_id}
\ No newline at end of file
@@ -1,6 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException
 from app.rag.vector_embedding import VectorEmbedding
-import asyncio
+from app.rag.query_cache import QueryCache
+from app.rag.lexical_index import LexicalIndex
+from app.helpers.syntax_tree_cache import SyntaxTreeCache
+from app.rag.search_coalescer import SearchCoalescer
+from app.core.IndexingJobs import IndexingJobs
+from app.api.dependencies import get_vector_embedding, get_search_coalescer, get_indexing_jobs, get_repository
+from app.config import RAGConfig
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -8,27 +14,60 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _result_count(k) -> int:
+    # k as requested, rejected below 1 and capped at search_max_k.
+    try:
+        k = int(k if k is not None else 5)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"k must be an integer, got {k!r}")
+    if k < 1:
+        raise HTTPException(status_code=400, detail=f"k must be at least 1, got {k}")
+    max_k = RAGConfig().search_max_k
+    if k > max_k:
+        logger.warning(f"Search k capped from {k} to {max_k}.")
+    return min(k, max_k)
+
 @router.post("/create-vectors")
-async def rag_endpoint(payload: dict):
-    
+async def rag_endpoint(payload: dict, repository: str = Depends(get_repository),
+                       indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
+    """
+    Start rebuilding a repository's FAISS shard from its chunks as a background
+    job. It waits for any running parse or refresh to finish first.
+    """
     logger.info(f"Received RAG request with payload: {payload}")
-    VectorEmbed = VectorEmbedding()
-    asyncio.create_task(VectorEmbed.create_vector_store())
-    return "vector creation triggered successfully"
+    job = await indexing_jobs.create_vectors(repository)
+    return {"message": "vector creation triggered successfully", "job_id": job.job_id}
 
 @router.post("/search-vectors")
-async def search_vectors_endpoint(payload: dict):
+async def search_vectors_endpoint(payload: dict, search_coalescer: SearchCoalescer = Depends(get_search_coalescer)):
+    """
+    Search for code similar to a query.
+    Payload: {"query": str, "k": int, "repository", "language", "path_prefix", "chunk_type"};
+    each filter takes a value or a list, and they can also be passed together as
+    "filters". Without a repository, every loaded shard is searched.
+    Results are ordered by "score"; "distance" is the inner product with the
+    query, or null for a result only the lexical index found.
+    """
     logger.info(f"Received search request with payload: {payload}")
     query = payload.get("query", "")
-    VectorEmbed = VectorEmbedding()
+    k = _result_count(payload.get("k"))
+    filters = payload.get("filters") or {
+        key: payload[key] for key in ("repository", "language", "path_prefix", "chunk_type") if key in payload
+    }
     results = []
-    op = await VectorEmbed.search(query)
+    # Concurrent searches are coalesced into one encode + FAISS search off the event loop.
+    try:
+        op = await search_coalescer.search(query, k, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if op:
         for item in op:
-            if isinstance(item, tuple) and len(item) == 2:
-                chunk, distance = item
+            if isinstance(item, tuple) and len(item) == 3:
+                chunk, score, distance = item
                 results.append({
-                    "chunk_info": chunk,
+                    "chunk_info": chunk.get_chunk_content(),
+                    "locations": chunk.locations,
+                    "score": score,
                     "distance": distance
                 })
             else:
@@ -37,11 +76,64 @@ async def search_vectors_endpoint(payload: dict):
         logger.info("No results found for the query.")
     return {"results": results}
 
+@router.post("/search-vectors-batch", operation_id="search_vectors_batch")
+async def search_vectors_batch_endpoint(payload: dict, vector_embedding: VectorEmbedding = Depends(get_vector_embedding)):
+    """
+    Search for code similar to several queries at once.
+    Payload: {"queries": [{"query": str, "k": int, "filters": {"repository", "language", "path_prefix", "chunk_type"}}]}.
+    Queries are encoded, searched and hydrated together, so this is cheaper than one request per query.
+    """
+    logger.info(f"Received batch search request with payload: {payload}")
+    queries = payload.get("queries", [])
+    max_queries = RAGConfig().search_batch_max_queries
+    if len(queries) > max_queries:
+        logger.warning(f"Batch search truncated from {len(queries)} to {max_queries} queries.")
+        queries = queries[:max_queries]
+    if not queries:
+        return {"results": []}
+    queries = [{**request, "k": _result_count(request.get("k"))} for request in queries]
+    for position, request in enumerate(queries):
+        try:
+            vector_embedding.parse_search_request(request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"queries[{position}]: {e}")
+    batch_results = await vector_embedding.search_batch(queries)
+    return {"results": [
+        {
+            "query": request.get("query", ""),
+            "results": [
+                {"chunk_info": chunk.get_chunk_info(), "score": score, "distance": distance}
+                for chunk, score, distance in hits
+            ]
+        }
+        for request, hits in zip(queries, batch_results)
+    ]}
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """
+    Returns hit/miss counters of the query embedding and search result caches,
+    the size of the lexical index, and the syntax tree cache used by re-indexing.
+    """
+    return {
+        **QueryCache.get_instance().stats(),
+        "lexical_index": LexicalIndex.get_instance().stats(),
+        "syntax_tree_cache": SyntaxTreeCache.get_instance().stats()
+    }
+
+@router.post("/compact-vectors")
+async def compact_vectors(force: bool = False, repository: str = Depends(get_repository),
+                          indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
+    """
+    Rebuilds a shard's FAISS graph without deleted vectors once enough of them have accumulated.
+    """
+    job = await indexing_jobs.compact(force=force, repository=repository)
+    return {"message": "Vector compaction triggered successfully", "job_id": job.job_id}
+
 @router.delete("/delete-all-vectors")
-async def delete_all_vectors():
+async def delete_all_vectors(repository: str = Depends(get_repository), indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
     """
-    Deletes all vectors from the FAISS index.
+    Deletes all vectors from a repository's FAISS shard.
     """
-    VectorEmbed = VectorEmbedding()
-    asyncio.create_task(VectorEmbed.clear_faiss_index())
-    return "All vectors deleted successfully"
\ No newline at end of file
+    job = await indexing_jobs.delete_all_vectors(repository)
+    return {"message": "All vectors deletion started", "job_id": job.job_id}
\ No newline at end of file
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.core.IndexingJobs import IndexingJobs
+from app.db.index_shards_DAO import IndexShardsDAO
+from app.rag.faiss.shard_manager import ShardManager
+from app.api.dependencies import get_indexing_jobs, get_index_shards_dao, get_shard_manager
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/shards")
+async def list_shards(shards: ShardManager = Depends(get_shard_manager),
+                      index_shards_dao: IndexShardsDAO = Depends(get_index_shards_dao)):
+    """
+    List the repository shards: root path, index file, whether each is loaded,
+    and the size and time of its last build.
+    """
+    metadata = {shard["name"]: shard for shard in await index_shards_dao.get_shards()}
+    return {"shards": [
+        {
+            **shards.get_shard_info(name),
+            "built_vectors": metadata.get(name, {}).get("vectors"),
+            "built_at": metadata.get(name, {}).get("built_at")
+        }
+        for name in shards.names()
+    ]}
+
+@router.post("/shards")
+async def add_shard(payload: dict, indexing_jobs: IndexingJobs = Depends(get_indexing_jobs)):
+    """
+    Register a repository as a new shard.
+    Payload: {"name": str, "root_path": str}. Build it with /parse and
+    /create-vectors, passing ?repository=<name>.
+    """
+    name = payload.get("name")
+    root_path = payload.get("root_path")
+    if not name or not root_path:
+        raise HTTPException(status_code=400, detail="name and root_path are required")
+    try:
+        await indexing_jobs.add_repository(name, root_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Repository registered", "shard": indexing_jobs.shards.get_shard_info(name)}
+
+@router.post("/shards/{name}/load")
+async def load_shard(name: str, shards: ShardManager = Depends(get_shard_manager)):
+    """
+    Load a shard's index into memory so searches include it. The least recently
+    searched shard is unloaded if max_loaded_shards would be exceeded.
+    """
+    try:
+        await shards.load(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown repository: {name}")
+    logger.info(f"Loaded shard {name}")
+    return {"message": "Shard loaded", "shard": shards.get_shard_info(name)}
+
+@router.post("/shards/{name}/unload")
+async def unload_shard(name: str, shards: ShardManager = Depends(get_shard_manager)):
+    """
+    Drop a shard's index from memory. Its index file is kept and is still
+    updated by refreshes; searches skip it until it is loaded again.
+    """
+    try:
+        unloaded = shards.unload(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown repository: {name}")
+    logger.info(f"Unloaded shard {name}")
+    return {"message": "Shard unloaded" if unloaded else "Shard was not loaded", "shard": shards.get_shard_info(name)}
@@ -1,3 +1,5 @@
+import hashlib
+
 class Chunks:
     
     def __init__(self, chunk=None, **kwargs):
@@ -11,6 +13,10 @@ class Chunks:
             self.name = chunk.get('name', None)
             self.hash = chunk.get('hash', None)
             self.vector_id = chunk.get('vector_id', None)
+            self.identifiers = chunk.get('identifiers', None)
+            self.occurrence_id = chunk.get('occurrence_id', None)
+            self.locations = chunk.get('locations', None)
+            self.repository = chunk.get('repository', None)
         else:
             # Initialize from keyword arguments
             self.type = kwargs.get('type', None)
@@ -21,6 +27,17 @@ class Chunks:
             self.name = kwargs.get('name', None)
             self.hash = kwargs.get('hash', None)
             self.vector_id = kwargs.get('vector_id', None)
+            self.identifiers = kwargs.get('identifiers', None)
+            self.occurrence_id = kwargs.get('occurrence_id', None)
+            self.locations = kwargs.get('locations', None)
+            self.repository = kwargs.get('repository', None)
+
+    @staticmethod
+    def compute_hash(content: str) -> str:
+        """
+        Returns a stable digest of the chunk content, comparable across runs.
+        """
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
     def get_chunk_info(self):
         """
@@ -33,7 +50,21 @@ class Chunks:
             "start_point": self.start_point,
             "end_point": self.end_point,
             "name": self.name,
-            "hash": self.hash
+            "hash": self.hash,
+            "repository": self.repository,
+            "locations": self.locations
+        }
+
+    def get_location(self):
+        """
+        Returns where this occurrence of the chunk's body sits.
+        """
+        return {
+            "repository": self.repository,
+            "file_path": self.file_path,
+            "start_point": self.start_point,
+            "end_point": self.end_point,
+            "name": self.name
         }
     def get_chunk_metadata(self):
         """
@@ -46,7 +77,9 @@ class Chunks:
             "end_point": self.end_point,
             "name": self.name,
             "hash": self.hash,
-            "vector_id": self.vector_id
+            "vector_id": self.vector_id,
+            "identifiers": self.identifiers,
+            "repository": self.repository
         }
 
     def get_chunk_content(self):
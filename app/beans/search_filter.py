@@ -0,0 +1,86 @@
+import os
+
+LANGUAGE_BY_EXTENSION = {
+    ".py": "python",
+    ".cpp": "cpp",
+    ".java": "java",
+    ".js": "javascript",
+    ".csv": "csv",
+    ".json": "json"
+}
+
+def language_of(file_path: str | None) -> str | None:
+    """
+    Returns the language name of a file from its extension.
+    """
+    if not file_path:
+        return None
+    _, ext = os.path.splitext(file_path)
+    return LANGUAGE_BY_EXTENSION.get(ext)
+
+class SearchFilter:
+    """
+    Restricts a search by repository, language, file path prefix and chunk
+    type. Each field accepts a single value or a list of alternatives; unset
+    fields match anything. The repository field also selects the index shards
+    searched.
+    """
+    def __init__(self, filters=None, **kwargs):
+        if filters and isinstance(filters, dict):
+            kwargs = filters
+        self.language = self._as_set(kwargs.get('language', None))
+        self.path_prefix = self._as_tuple(kwargs.get('path_prefix', None))
+        self.chunk_type = self._as_set(kwargs.get('chunk_type', None))
+        self.repository = self._as_set(kwargs.get('repository', None))
+
+    @staticmethod
+    def _as_tuple(value) -> tuple | None:
+        if value is None or value == [] or value == "":
+            return None
+        return tuple(value) if isinstance(value, (list, tuple, set)) else (value,)
+
+    @classmethod
+    def _as_set(cls, value) -> frozenset | None:
+        value = cls._as_tuple(value)
+        return frozenset(value) if value is not None else None
+
+    def is_empty(self) -> bool:
+        return self.language is None and self.path_prefix is None and self.chunk_type is None and self.repository is None
+
+    def matches_path(self, file_path: str | None) -> bool:
+        """
+        Returns True if the file satisfies the language and path prefix fields.
+        """
+        if self.language is not None and language_of(file_path) not in self.language:
+            return False
+        if self.path_prefix is not None:
+            normalized = (file_path or "").replace("\\", "/")
+            if not any(normalized.startswith(prefix.replace("\\", "/")) for prefix in self.path_prefix):
+                return False
+        return True
+
+    def matches_type(self, chunk_type: str | None) -> bool:
+        return self.chunk_type is None or chunk_type in self.chunk_type
+
+    def matches_repository(self, repository: str | None) -> bool:
+        return self.repository is None or repository in self.repository
+
+    def matches_attributes(self, file_path: str | None, chunk_type: str | None, repository: str | None = None) -> bool:
+        return self.matches_repository(repository) and self.matches_type(chunk_type) and self.matches_path(file_path)
+
+    def matches(self, chunk) -> bool:
+        """
+        Returns True if the chunk satisfies every set field.
+        """
+        return self.matches_attributes(chunk.file_path, chunk.type, chunk.repository)
+
+    def get_filter_info(self) -> dict:
+        """
+        Returns a dictionary representation of the filter.
+        """
+        return {
+            "language": sorted(self.language) if self.language is not None else None,
+            "path_prefix": list(self.path_prefix) if self.path_prefix is not None else None,
+            "chunk_type": sorted(self.chunk_type) if self.chunk_type is not None else None,
+            "repository": sorted(self.repository) if self.repository is not None else None
+        }
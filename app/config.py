@@ -1,3 +1,5 @@
+import os
+
 class RAGConfig:
     def __init__(self):
         
@@ -8,6 +10,14 @@ class RAGConfig:
         self.api_base_url = "http://127.0.0.1:8000"
         self.mongo_uri = "mongodb://localhost:27017"
         self.db_name = "rag_db"
+        # One client, and so one connection pool, is shared by the whole process.
+        self.mongo_max_pool_size = 100
+        self.mongo_min_pool_size = 0
+        self.mongo_max_idle_time_ms = 60000
+        self.mongo_connect_timeout_ms = 5000
+        self.mongo_server_selection_timeout_ms = 5000
+        # None waits indefinitely, which long bulk writes may need.
+        self.mongo_socket_timeout_ms = None
         self.collection_name = "documents"
         
         self.accepted_file_types = [
@@ -19,8 +29,105 @@ class RAGConfig:
             ".json"
         ]
         self.codebase_path = "codebase"
+        # Repositories indexed as separate shards, by name. Each has its own FAISS index
+        # file and is parsed, embedded and refreshed on its own; more can be registered
+        # at runtime through /shards.
+        self.default_repository = "codebase"
+        self.repositories = {self.default_repository: self.codebase_path}
+        # Re-index files as they change. The backend is "auto" (watchdog if installed,
+        # else polling), "watchdog" or "poll".
+        self.file_watch_enabled = True
+        self.file_watch_backend = "auto"
+        self.file_watch_poll_interval_seconds = 2.0
+        self.file_watch_debounce_ms = 500
+        self.file_watch_max_delay_ms = 5000
+        # Chunks buffered per bulk insert while parsing.
+        self.chunk_write_batch_size = 500
+        # CSV rows and JSON members are grouped into chunks of up to this many characters.
+        self.data_chunk_max_bytes = 4096
+        # Chunk bodies are stored inline; larger ones are compressed ("zlib" or None),
+        # and the rare body still over the inline limit goes to GridFS.
+        self.chunk_compression = "zlib"
+        self.chunk_compression_min_bytes = 4096
+        self.chunk_inline_max_bytes = 4 * 1024 * 1024
+        # Worker processes used to parse the codebase; 1 parses on the event loop.
+        self.parse_workers = os.cpu_count() or 1
+        self.parse_files_per_task = 16
+        # Previous source and syntax tree of recently re-indexed files, so edits re-parse incrementally.
+        self.syntax_tree_cache_size = 256
+        self.syntax_tree_cache_max_bytes = 64 * 1024 * 1024
 
         self.embedding_model = "all-MiniLM-L6-v2"
+        # Chunks read from Mongo per pipeline batch, and batches buffered between stages.
+        self.embedding_batch_size = 512
+        self.embedding_queue_depth = 4
+        # Encode batches are sized by padded tokens (longest length x count), not item count.
+        self.embedding_max_tokens_per_batch = 16384
+        self.embedding_max_batch_size = 256
+        # Embeddings are cached on disk by content hash so unchanged chunks are never re-encoded.
+        self.embedding_cache_dir = "app/rag/faiss/data/embedding_cache"
+        self.embedding_cache_max_entries = 1_000_000
+        # FAISS index type, one of faiss_index_factories: flat suits small repos, hnsw_sq8
+        # quarters HNSW memory, ivf_pq compresses large corpora with trained codebooks.
+        self.faiss_index_type = "hnsw_flat"
+        self.faiss_index_factories = {
+            "flat": "IDMap2,Flat",
+            "hnsw_flat": "IDMap2,HNSW{hnsw_m},Flat",
+            "hnsw_sq8": "IDMap2,HNSW{hnsw_m},SQ8",
+            "ivf_pq": "IVF{ivf_nlist},PQ{pq_m}"
+        }
+        self.hnsw_m = 32
         self.hnsw_ef_construction = 200
         self.hnsw_ef_search = 100
-        self.faiss_filepath = "app/rag/faiss/data/code_index.faiss"
\ No newline at end of file
+        self.ivf_nlist = 1024
+        self.ivf_nprobe = 16
+        self.ivf_min_train_points = 10000
+        self.pq_m = 16
+        # Vectors sampled to train index types that need it.
+        self.faiss_train_size = 50000
+        # Map the served index read-only instead of reading it into memory, so every
+        # uvicorn worker serving the same index generation shares its pages.
+        self.faiss_mmap = True
+        self.faiss_filepath = "app/rag/faiss/data/code_index.faiss"
+        # Index saves write a new immutable generation file next to faiss_filepath and
+        # switch a generation marker to it. Older generations kept for readers still on them:
+        self.faiss_keep_generations = 3
+        # How often each worker checks for a newly published generation.
+        self.faiss_generation_poll_seconds = 2.0
+        # Lock files shared by the uvicorn workers. One worker is elected writer and runs the
+        # cron jobs and file watchers; write jobs from any worker run one at a time across all.
+        self.process_lock_dir = "app/rag/faiss/data/locks"
+        # How often other workers check whether the writer has exited, and for repositories
+        # registered through another worker.
+        self.writer_poll_seconds = 5.0
+        # Index files of shards other than the default repository's, as <name>.faiss.
+        self.faiss_shard_dir = "app/rag/faiss/data/shards"
+        # Shards kept in memory at once; loading another unloads the least recently searched.
+        self.max_loaded_shards = 8
+        # Threads a search fans out on, one shard per task.
+        self.shard_search_threads = 4
+        # In-process caches for repeated queries; results are dropped when the index or chunks change.
+        self.query_embedding_cache_size = 1024
+        self.query_result_cache_size = 512
+        self.query_cache_ttl_seconds = 600
+        self.search_batch_max_queries = 64
+        # Largest number of results a search may ask for; larger k is capped.
+        self.search_max_k = 100
+        # Concurrent /search-vectors requests arriving within the window are searched as one batch.
+        self.search_batch_window_ms = 5
+        self.search_max_batch_size = 32
+        self.search_executor_threads = 1
+        # Fuse vector hits with BM25 hits over code tokens by reciprocal rank.
+        self.hybrid_search = True
+        self.hybrid_candidates = 20
+        self.rrf_k = 60
+        self.bm25_k1 = 1.2
+        self.bm25_b = 0.75
+        # Chunk writes are logged to a capped collection of this size, from which every other
+        # worker applies them to its lexical index and attribute map every poll interval.
+        self.chunk_change_log_max_bytes = 64 * 1024 * 1024
+        self.chunk_change_poll_seconds = 2.0
+        # Finished background jobs kept for GET /jobs.
+        self.job_history_size = 100
+        # Rebuild the HNSW graph once this share of its vectors is tombstoned.
+        self.faiss_compaction_threshold = 0.2
\ No newline at end of file
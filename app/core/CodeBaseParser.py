@@ -1,28 +1,141 @@
 import os
+import time
 import asyncio
-from app.helpers.file_parser import FileParser
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from app.helpers.file_parser import FileParser, DATA_FILE_TYPES, init_parser_worker, parse_files
 from app.config import RAGConfig
 from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.db.chunk_write_buffer import ChunkWriteBuffer
 import logging
 class CodeBaseParser:
-    def __init__(self, RootPath):
+    def __init__(self, RootPath, tree_sitter_chunks_dao: TreeSitterChunksDAO | None = None, repository: str | None = None):
         logging.basicConfig(level=logging.INFO)
+        config = RAGConfig()
         self.RootPath = RootPath
-        self.accepted_file_types = tuple(RAGConfig().accepted_file_types)
-        self.tree_sitter_chunks_dao = TreeSitterChunksDAO()
-        self.codebase_path = RAGConfig().codebase_path
+        # The repository, and so the index shard, the parsed chunks belong to.
+        self.repository = repository or config.default_repository
+        self.accepted_file_types = tuple(config.accepted_file_types)
+        self.tree_sitter_chunks_dao = tree_sitter_chunks_dao or TreeSitterChunksDAO()
+        self.codebase_path = config.codebase_path
+        self.chunk_write_batch_size = config.chunk_write_batch_size
+        self.parse_workers = config.parse_workers
+        self.parse_files_per_task = config.parse_files_per_task
 
-    async def parse_code(self):
+    def iter_files(self):
         for (root, dirs, files) in os.walk(self.RootPath):
             for file in files:
                 if file.endswith(self.accepted_file_types):
-                    file_path = os.path.join(root, file)
-                    logging.info(f"Parsing file: {file_path}")
+                    yield os.path.join(root, file)
+
+    async def parse_code(self, job=None):
+        """
+        Parse every accepted file and store its chunks. Progress is reported
+        to job, a JobManager Job, when given.
+        """
+        start_time = time.perf_counter()
+        write_buffer = ChunkWriteBuffer(self.tree_sitter_chunks_dao, max_chunks=self.chunk_write_batch_size, repository=self.repository)
+        if job is not None:
+            job.start_stage("parse", unit="files")
+        if self.parse_workers > 1:
+            file_count = await self._parse_parallel(write_buffer, job)
+        else:
+            file_count = 0
+            for file_path in self.iter_files():
+                logging.info(f"Parsing file: {file_path}")
+                if file_path.endswith(DATA_FILE_TYPES):
+                    chunk_count = await self._stream_data_file(file_path, write_buffer)
+                else:
                     file_parser = FileParser(file_path)
                     chunks = await file_parser.parse_file()
-                    for chunk in chunks:
-                        chunk.vector_id = await self.tree_sitter_chunks_dao.get_last_vector_id()+1
-                        await self.tree_sitter_chunks_dao.insert_chunk(chunk)
+                    await write_buffer.add(chunks)
+                    chunk_count = len(chunks)
+                file_count += 1
+                if job is not None:
+                    job.advance(1, chunks=chunk_count)
+        await write_buffer.flush()
+        elapsed = time.perf_counter() - start_time
+        throughput = write_buffer.total_written / elapsed if elapsed > 0 else 0.0
+        logging.info(f"Parsed {file_count} files into {write_buffer.total_written} chunks in {elapsed:.2f}s ({throughput:.1f} chunks/s)")
+        return {"files": file_count, "chunks": write_buffer.total_written, "seconds": round(elapsed, 2), "chunks_per_second": round(throughput, 1)}
+
+    async def _parse_parallel(self, write_buffer: ChunkWriteBuffer, job=None) -> int:
+        """
+        Parse files across a process pool. Each worker builds its parsers once and
+        returns the chunks for a batch of files; this coroutine is the only writer.
+        At most two batches per worker are in flight, which bounds memory.
+        """
+        loop = asyncio.get_running_loop()
+        max_in_flight = self.parse_workers * 2
+        file_count = 0
+        pending = set()
+        batch_sizes = {}
+
+        def submit(file_batch):
+            future = loop.run_in_executor(pool, parse_files, file_batch)
+            batch_sizes[future] = len(file_batch)
+            pending.add(future)
+
+        async def drain(return_when):
+            nonlocal pending
+            done, pending = await asyncio.wait(pending, return_when=return_when)
+            for future in done:
+                chunks = future.result()
+                await write_buffer.add(chunks)
+                if job is not None:
+                    job.advance(batch_sizes.pop(future), chunks=len(chunks))
+
+        # spawn keeps the workers free of the server's threads and open sockets.
+        with ProcessPoolExecutor(
+            max_workers=self.parse_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_parser_worker
+        ) as pool:
+            try:
+                file_batch = []
+                for file_path in self.iter_files():
+                    file_count += 1
+                    if file_path.endswith(DATA_FILE_TYPES):
+                        # Streamed here while the workers keep parsing source files.
+                        chunk_count = await self._stream_data_file(file_path, write_buffer)
+                        if job is not None:
+                            job.advance(1, chunks=chunk_count)
+                        continue
+                    file_batch.append(file_path)
+                    if len(file_batch) < self.parse_files_per_task:
+                        continue
+                    submit(file_batch)
+                    file_batch = []
+                    if len(pending) >= max_in_flight:
+                        await drain(asyncio.FIRST_COMPLETED)
+                if file_batch:
+                    submit(file_batch)
+                if pending:
+                    await drain(asyncio.ALL_COMPLETED)
+            except asyncio.CancelledError:
+                # Don't start queued batches on the way out; running ones finish.
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        logging.info(f"Parsed {file_count} files with {self.parse_workers} worker processes")
+        return file_count
+
+    async def _stream_data_file(self, file_path: str, write_buffer: ChunkWriteBuffer) -> int:
+        """
+        Write a CSV or JSON file's chunks batch by batch as they are read, so a
+        large data file never sits in memory whole. Returns the chunk count.
+        """
+        batches = FileParser(file_path).iter_chunk_batches(self.chunk_write_batch_size)
+        chunk_count = 0
+        try:
+            while True:
+                chunks = await asyncio.to_thread(next, batches, None)
+                if chunks is None:
+                    break
+                await write_buffer.add(chunks)
+                chunk_count += len(chunks)
+        except Exception as e:
+            logging.error(f"Failed to parse {file_path}: {e}")
+        return chunk_count
 
 async def code_base_parser():
     root_path = RAGConfig().codebase_path
@@ -0,0 +1,159 @@
+from app.config import RAGConfig
+import asyncio
+import logging
+import os
+import time
+
+try:
+    # watchdog uses inotify on Linux (FSEvents / ReadDirectoryChangesW elsewhere).
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class _EventHandler(FileSystemEventHandler):
+    """
+    Forwards watchdog events from its observer thread to the watcher's event loop.
+    """
+    def __init__(self, watcher: "FileWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        # A directory's mtime changes with its entries, which are reported on their own.
+        if event.is_directory and event.event_type == "modified":
+            return
+        paths = [event.src_path, getattr(event, "dest_path", None)]
+        for path in paths:
+            if path:
+                self.watcher.loop.call_soon_threadsafe(self.watcher.record, os.fsdecode(path), event.is_directory)
+
+class FileWatcher:
+    """
+    Watches the codebase and feeds changed, added and deleted paths to a
+    re-index callback, so edits become searchable within seconds.
+
+    Events come from watchdog (inotify on Linux) when it is installed, and
+    otherwise from polling the tree's mtimes and sizes. Paths are debounced:
+    a batch is queued once no new change has arrived for the debounce window,
+    or after the max delay while changes keep coming. Batches queued while a
+    re-index runs are merged into the next one.
+    """
+    def __init__(self, root_path: str, on_changes, backend: str | None = None):
+        config = RAGConfig()
+        self.root_path = root_path
+        self.root_abs = os.path.abspath(root_path)
+        self.on_changes = on_changes
+        self.backend = backend or config.file_watch_backend
+        self.accepted_file_types = tuple(config.accepted_file_types)
+        self.poll_interval = config.file_watch_poll_interval_seconds
+        self.debounce = config.file_watch_debounce_ms / 1000
+        self.max_delay = config.file_watch_max_delay_ms / 1000
+        self.loop = None
+        self.queue = None
+        self._pending = set()
+        self._first_pending_at = None
+        self._flush_handle = None
+        self._observer = None
+        self._tasks = []
+
+    def start(self) -> None:
+        """
+        Start watching on the running event loop.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        if self.backend == "watchdog" and Observer is None:
+            raise RuntimeError("file_watch_backend is 'watchdog' but watchdog is not installed")
+        if self.backend in ("auto", "watchdog") and Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.root_abs, recursive=True)
+            self._observer.start()
+            logger.info(f"Watching {self.root_path} for changes with watchdog.")
+        else:
+            self._tasks.append(asyncio.create_task(self._poll()))
+            logger.info(f"Watching {self.root_path} for changes by polling every {self.poll_interval}s.")
+        self._tasks.append(asyncio.create_task(self._consume()))
+
+    async def stop(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            await asyncio.to_thread(self._observer.join)
+            self._observer = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def record(self, path: str, is_directory: bool = False) -> None:
+        """
+        Note a changed path and (re)arm the debounce timer. Must run on the loop.
+        """
+        path = self._to_root_relative(path)
+        if path is None or not (is_directory or path.endswith(self.accepted_file_types)):
+            return
+        self._pending.add(path)
+        now = time.monotonic()
+        if self._first_pending_at is None:
+            self._first_pending_at = now
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        delay = min(self.debounce, max(self._first_pending_at + self.max_delay - now, 0))
+        self._flush_handle = self.loop.call_later(delay, self._flush)
+
+    def _to_root_relative(self, path: str) -> str | None:
+        # Paths are keyed as os.walk(root_path) produces them, matching the stored fingerprints.
+        relative = os.path.relpath(os.path.abspath(path), self.root_abs)
+        if relative == os.curdir or relative.startswith(os.pardir):
+            return None
+        return os.path.join(self.root_path, relative)
+
+    def _flush(self):
+        self._flush_handle = None
+        self._first_pending_at = None
+        if self._pending:
+            self.queue.put_nowait(self._pending)
+            self._pending = set()
+
+    async def _consume(self):
+        while True:
+            paths = await self.queue.get()
+            while not self.queue.empty():
+                paths |= self.queue.get_nowait()
+            try:
+                await self.on_changes(sorted(paths))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Re-indexing {len(paths)} changed paths failed: {e}")
+
+    def _snapshot(self) -> dict:
+        snapshot = {}
+        for (root, dirs, files) in os.walk(self.root_path):
+            for file in files:
+                if file.endswith(self.accepted_file_types):
+                    file_path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    async def _poll(self):
+        previous = await asyncio.to_thread(self._snapshot)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await asyncio.to_thread(self._snapshot)
+            for file_path in previous.keys() | current.keys():
+                if previous.get(file_path) != current.get(file_path):
+                    self.record(file_path)
+            previous = current
@@ -0,0 +1,227 @@
+import os
+import time
+import hashlib
+import logging
+from app.helpers.file_parser import FileParser
+from app.helpers.syntax_tree_cache import SyntaxTreeCache
+from app.config import RAGConfig
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.db.file_fingerprints_DAO import FileFingerprintsDAO
+from app.rag.vector_embedding import VectorEmbedding
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def file_digest(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    Returns the sha256 digest of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IncrementalIndexer:
+    """
+    Brings the chunk store and the FAISS index in line with the codebase by
+    re-parsing only files whose fingerprint changed and applying the chunk
+    add/remove delta, instead of rebuilding everything. Works on one
+    repository and its index shard.
+    """
+    def __init__(self, RootPath, tree_sitter_chunks_dao: TreeSitterChunksDAO | None = None,
+                 file_fingerprints_dao: FileFingerprintsDAO | None = None,
+                 vector_embedding: VectorEmbedding | None = None,
+                 repository: str | None = None):
+        self.RootPath = RootPath
+        self.repository = repository or RAGConfig().default_repository
+        self.accepted_file_types = tuple(RAGConfig().accepted_file_types)
+        self.chunk_write_batch_size = RAGConfig().chunk_write_batch_size
+        self.tree_sitter_chunks_dao = tree_sitter_chunks_dao or TreeSitterChunksDAO()
+        self.file_fingerprints_dao = file_fingerprints_dao or FileFingerprintsDAO()
+        self.vector_embedding = vector_embedding or VectorEmbedding(self.tree_sitter_chunks_dao)
+
+    def iter_files(self, path=None):
+        for (root, dirs, files) in os.walk(path or self.RootPath):
+            for file in files:
+                if file.endswith(self.accepted_file_types):
+                    yield os.path.join(root, file)
+
+    async def refresh(self, job=None) -> dict:
+        """
+        Re-index changed files and apply the vector delta. Progress is reported
+        to job, a JobManager Job, when given.
+        """
+        start_time = time.perf_counter()
+        if job is not None:
+            job.start_stage("scan", unit="files")
+        known_fingerprints = await self.file_fingerprints_dao.get_all_fingerprints(self.repository)
+        stats = {"unchanged_files": 0, "changed_files": 0, "deleted_files": 0, "added_chunks": 0, "removed_chunks": 0}
+        seen_files = set()
+        new_fingerprints = []
+        added_chunks = []
+        removed_vector_ids = []
+        file_vector_ids = []
+
+        for file_path in self.iter_files():
+            if job is not None:
+                job.advance(1, chunks=0)
+            seen_files.add(file_path)
+            await self._refresh_file(file_path, known_fingerprints.get(file_path), stats, new_fingerprints,
+                                     added_chunks, removed_vector_ids, file_vector_ids)
+
+        for file_path in known_fingerprints.keys() - seen_files:
+            logger.info(f"File deleted, removing its chunks: {file_path}")
+            removed_vector_ids.extend(await self.tree_sitter_chunks_dao.delete_chunks_by_file(file_path))
+            await self.file_fingerprints_dao.delete_fingerprint(file_path)
+            stats["deleted_files"] += 1
+
+        await self.vector_embedding.apply_delta(added_chunks, removed_vector_ids, job, self.repository, file_vector_ids)
+        # Fingerprints are written last. Chunks are stored before the index is
+        # saved, so after an interruption the same files are diffed again and
+        # apply_delta embeds whichever of their chunks the index still lacks.
+        await self.file_fingerprints_dao.upsert_fingerprints(new_fingerprints)
+
+        stats["added_chunks"] = len(added_chunks)
+        stats["removed_chunks"] = len(removed_vector_ids)
+        stats["seconds"] = round(time.perf_counter() - start_time, 2)
+        logger.info(f"Incremental refresh finished: {stats}")
+        return stats
+
+    async def refresh_paths(self, paths, job=None) -> dict:
+        """
+        Re-index only the given paths, as reported by the FileWatcher. A directory
+        stands for every file under it; paths that no longer exist have their
+        chunks removed.
+        """
+        start_time = time.perf_counter()
+        paths = set(paths)
+        if job is not None:
+            job.start_stage("scan", total=len(paths), unit="paths")
+        known_fingerprints = await self.file_fingerprints_dao.get_fingerprints_under(list(paths))
+        stats = {"unchanged_files": 0, "changed_files": 0, "deleted_files": 0, "added_chunks": 0, "removed_chunks": 0}
+        seen_files = set()
+        new_fingerprints = []
+        added_chunks = []
+        removed_vector_ids = []
+        file_vector_ids = []
+
+        for path in paths:
+            if job is not None:
+                job.advance(1, chunks=0)
+            if os.path.isdir(path):
+                file_paths = list(self.iter_files(path))
+            elif os.path.isfile(path) and path.endswith(self.accepted_file_types):
+                file_paths = [path]
+            else:
+                file_paths = []
+            for file_path in file_paths:
+                if file_path in seen_files:
+                    continue
+                seen_files.add(file_path)
+                await self._refresh_file(file_path, known_fingerprints.get(file_path), stats, new_fingerprints,
+                                         added_chunks, removed_vector_ids, file_vector_ids)
+
+        for file_path in known_fingerprints.keys() - seen_files:
+            if os.path.isfile(file_path):
+                continue
+            logger.info(f"File deleted, removing its chunks: {file_path}")
+            removed_vector_ids.extend(await self.tree_sitter_chunks_dao.delete_chunks_by_file(file_path))
+            await self.file_fingerprints_dao.delete_fingerprint(file_path)
+            stats["deleted_files"] += 1
+
+        await self.vector_embedding.apply_delta(added_chunks, removed_vector_ids, job, self.repository, file_vector_ids)
+        await self.file_fingerprints_dao.upsert_fingerprints(new_fingerprints)
+
+        stats["added_chunks"] = len(added_chunks)
+        stats["removed_chunks"] = len(removed_vector_ids)
+        stats["seconds"] = round(time.perf_counter() - start_time, 2)
+        logger.info(f"Re-indexed {len(paths)} changed paths: {stats}")
+        return stats
+
+    async def _refresh_file(self, file_path: str, previous: dict | None, stats: dict,
+                            new_fingerprints: list, added_chunks: list, removed_vector_ids: list,
+                            file_vector_ids: list):
+        # Compares one file against its stored fingerprint and re-indexes it if its content changed.
+        try:
+            stat = os.stat(file_path)
+            if previous and previous.get("mtime") == stat.st_mtime and previous.get("size") == stat.st_size:
+                stats["unchanged_files"] += 1
+                return
+            digest = file_digest(file_path)
+        except OSError as e:
+            # Deleted or renamed since it was listed or reported.
+            logger.info(f"File gone, removing its chunks: {file_path} ({e})")
+            removed_vector_ids.extend(await self.tree_sitter_chunks_dao.delete_chunks_by_file(file_path))
+            if previous:
+                await self.file_fingerprints_dao.delete_fingerprint(file_path)
+            stats["deleted_files"] += 1
+            return
+        fingerprint = {
+            "file_path": file_path,
+            "repository": self.repository,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "digest": digest
+        }
+        if previous and previous.get("digest") == fingerprint["digest"]:
+            # Touched but not modified: only the stored mtime needs updating.
+            stats["unchanged_files"] += 1
+            new_fingerprints.append(fingerprint)
+            return
+        try:
+            file_added, file_removed, file_vectors = await self.reindex_file(file_path)
+        except Exception as e:
+            logger.error(f"Failed to re-index {file_path}: {e}")
+            return
+        stats["changed_files"] += 1
+        added_chunks.extend(file_added)
+        removed_vector_ids.extend(file_removed)
+        file_vector_ids.extend(file_vectors)
+        new_fingerprints.append(fingerprint)
+
+    async def reindex_file(self, file_path: str) -> tuple[list, list[int], list[int]]:
+        """
+        Re-parse one file and diff its chunks against the stored ones by content hash.
+        Returns the chunks whose bodies are new and the vector IDs of the bodies
+        no chunk uses anymore, i.e. the vector delta, and the vector IDs of all
+        the file's chunks, which the shard should hold.
+        """
+        existing_by_hash = {}
+        for metadata in await self.tree_sitter_chunks_dao.get_chunk_metadata_by_file(file_path):
+            existing_by_hash.setdefault(metadata.get("hash"), []).append(metadata)
+
+        added_chunks = []
+        added_count = 0
+        moved_positions = []
+        vector_ids = set()
+        # Chunks are diffed batch by batch so large data files are never held whole.
+        for chunks in FileParser(file_path).iter_chunk_batches(self.chunk_write_batch_size, SyntaxTreeCache.get_instance()):
+            batch_added = []
+            for chunk in chunks:
+                chunk.repository = self.repository
+                candidates = existing_by_hash.get(chunk.hash)
+                if candidates:
+                    kept = candidates.pop()
+                    if kept.get("vector_id") is not None:
+                        vector_ids.add(int(kept["vector_id"]))
+                    start_point = list(chunk.start_point) if chunk.start_point is not None else None
+                    end_point = list(chunk.end_point) if chunk.end_point is not None else None
+                    if kept.get("start_point") != start_point or kept.get("end_point") != end_point:
+                        moved_positions.append((kept["_id"], start_point, end_point))
+                    continue
+                batch_added.append(chunk)
+            if batch_added:
+                # Chunks whose body is already stored elsewhere need no new vector.
+                added_chunks.extend(await self.tree_sitter_chunks_dao.insert_chunks(batch_added))
+                added_count += len(batch_added)
+                vector_ids.update(int(chunk.vector_id) for chunk in batch_added)
+
+        removed_ids = [metadata["_id"] for remaining in existing_by_hash.values() for metadata in remaining]
+        removed_vector_ids = await self.tree_sitter_chunks_dao.delete_chunks_by_ids(removed_ids)
+        await self.tree_sitter_chunks_dao.update_chunk_positions(moved_positions)
+        logger.info(
+            f"Re-indexed {file_path}: +{added_count} / -{len(removed_ids)} chunks, "
+            f"+{len(added_chunks)} / -{len(removed_vector_ids)} bodies"
+        )
+        return added_chunks, removed_vector_ids, list(vector_ids)
@@ -0,0 +1,227 @@
+from app.core.JobManager import JobManager, Job
+from app.core.CodeBaseParser import CodeBaseParser
+from app.core.IncrementalIndexer import IncrementalIndexer
+from app.core.FileWatcher import FileWatcher
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.db.file_fingerprints_DAO import FileFingerprintsDAO
+from app.db.index_shards_DAO import IndexShardsDAO
+from app.rag.vector_embedding import VectorEmbedding
+from app.rag.faiss import index_files
+from app.config import RAGConfig
+import functools
+import re
+import asyncio
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class IndexingJobs:
+    """
+    The indexing pipelines, run in-process as JobManager jobs. Shared by the
+    API routes, the cron scheduler and the file watchers so all go through
+    the same single-writer lock. Each job works on one repository and its
+    index shard: the named one, or the default repository.
+
+    Every worker process can submit jobs, but only the one elected writer
+    (see start_watching) watches files for changes.
+    """
+    def __init__(self, job_manager: JobManager, tree_sitter_dao: TreeSitterChunksDAO,
+                 file_fingerprints_dao: FileFingerprintsDAO, vector_embedding: VectorEmbedding,
+                 index_shards_dao: IndexShardsDAO | None = None):
+        self.job_manager = job_manager
+        self.tree_sitter_dao = tree_sitter_dao
+        self.file_fingerprints_dao = file_fingerprints_dao
+        self.vector_embedding = vector_embedding
+        self.index_shards_dao = index_shards_dao or IndexShardsDAO()
+        self.shards = vector_embedding.shards
+        self.file_watchers = {}
+        self.watching = False
+
+    def _indexer(self, repository: str) -> IncrementalIndexer:
+        return IncrementalIndexer(
+            self.shards.repositories[repository], self.tree_sitter_dao,
+            self.file_fingerprints_dao, self.vector_embedding, repository
+        )
+
+    async def parse(self, repository: str | None = None) -> Job:
+        repository = self.shards.resolve(repository)
+        parser = CodeBaseParser(self.shards.repositories[repository], self.tree_sitter_dao, repository)
+        return self.job_manager.submit("parse", parser.parse_code, dedupe=True, repository=repository)
+
+    async def create_vectors(self, repository: str | None = None) -> Job:
+        repository = self.shards.resolve(repository)
+        async def pipeline(job: Job) -> None:
+            await self.vector_embedding.create_vector_store(job, repository)
+        return self.job_manager.submit("create-vectors", pipeline, dedupe=True, repository=repository)
+
+    async def refresh(self, repository: str | None = None) -> Job:
+        repository = self.shards.resolve(repository)
+        indexer = self._indexer(repository)
+        return self.job_manager.submit("refresh-vectors", indexer.refresh, dedupe=True, repository=repository)
+
+    async def refresh_all(self) -> list[Job]:
+        """
+        Refresh every repository, one job per shard.
+        """
+        return [await self.refresh(repository) for repository in self.shards.names()]
+
+    async def reindex_paths(self, paths: list[str], repository: str | None = None) -> Job:
+        """
+        Re-index changed paths and wait for the job, so the FileWatcher merges
+        whatever changes arrive meanwhile into its next batch.
+        """
+        repository = self.shards.resolve(repository)
+        indexer = self._indexer(repository)
+        job = self.job_manager.submit("reindex-files", lambda job: indexer.refresh_paths(paths, job), repository=repository)
+        await asyncio.shield(job.task)
+        return job
+
+    async def compact(self, force: bool = False, repository: str | None = None) -> Job:
+        repository = self.shards.resolve(repository)
+        async def pipeline(job: Job) -> dict:
+            return {"dropped": await self.vector_embedding.compact_faiss_index(force=force, repository=repository)}
+        return self.job_manager.submit("compact-vectors", pipeline, dedupe=True, repository=repository)
+
+    async def compact_all(self) -> list[Job]:
+        """
+        Compact every repository's shard that is past the compaction threshold.
+        """
+        return [await self.compact(repository=repository) for repository in self.shards.names()]
+
+    async def delete_file(self, file_path: str) -> Job:
+        repository = self.shards.repository_for_path(file_path) or self.shards.default_repository
+        async def pipeline(job: Job) -> dict:
+            vector_ids = await self.tree_sitter_dao.delete_chunks_by_file(file_path)
+            await self.file_fingerprints_dao.delete_fingerprint(file_path)
+            await self.vector_embedding.remove_vectors(vector_ids, repository)
+            return {"file_path": file_path, "removed_chunks": len(vector_ids)}
+        return self.job_manager.submit("delete-file", pipeline, repository=repository)
+
+    async def delete_all_chunks(self, repository: str | None = None) -> Job:
+        """
+        Delete the chunks and fingerprints of one repository, or of all of them
+        when none is named.
+        """
+        if repository is not None:
+            repository = self.shards.resolve(repository)
+        async def pipeline(job: Job) -> None:
+            if repository is None:
+                await self.tree_sitter_dao.delete_all_chunks()
+            else:
+                await self.tree_sitter_dao.delete_chunks_by_repository(repository)
+            await self.file_fingerprints_dao.delete_all_fingerprints(repository)
+        return self.job_manager.submit("delete-all-chunks", pipeline, repository=repository)
+
+    async def delete_all_vectors(self, repository: str | None = None) -> Job:
+        repository = self.shards.resolve(repository)
+        async def pipeline(job: Job) -> None:
+            await self.vector_embedding.clear_faiss_index(repository)
+        return self.job_manager.submit("delete-all-vectors", pipeline, repository=repository)
+
+    async def migrate(self) -> Job:
+        """
+        Move chunks written by earlier versions to the current layout: GridFS
+        files, then inline bodies. Duplicates now share one vector, so theirs
+        are dropped. Data from before repositories were sharded belongs to the
+        default one. Each step is a no-op once done, so every worker can run it.
+        """
+        repository = self.shards.default_repository
+        async def pipeline(job: Job) -> dict:
+            obsolete_vector_ids = await self.tree_sitter_dao.migrate_legacy_chunks()
+            obsolete_vector_ids += await self.tree_sitter_dao.migrate_inline_chunks()
+            await self.tree_sitter_dao.assign_repository(repository)
+            await self.file_fingerprints_dao.assign_repository(repository)
+            if obsolete_vector_ids and index_files.current_generation(self.shards.index_path(repository)) is not None:
+                await self.vector_embedding.remove_vectors(obsolete_vector_ids, repository)
+            return {"removed_vectors": len(obsolete_vector_ids)}
+        return self.job_manager.submit("migrate", pipeline, dedupe=True, repository=repository)
+
+    async def add_repository(self, name: str, root_path: str) -> None:
+        """
+        Register a repository as a new shard and start watching it. Its index
+        is built by parsing it and creating its vectors. Other workers pick
+        it up from the shard collection (see sync_repositories).
+        """
+        # The name becomes the shard's index file name.
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", name) or name.startswith("."):
+            raise ValueError(f"Invalid repository name: {name}")
+        overlapping = self.shards.overlapping(name, root_path)
+        if overlapping is not None:
+            raise ValueError(f"{root_path} overlaps the root of repository {overlapping}")
+        await self.index_shards_dao.upsert_shard(name, root_path)
+        await self.stop_watching(name)
+        self.shards.register(name, root_path)
+        self.watch(name)
+
+    async def sync_repositories(self) -> list[str]:
+        """
+        Register the repositories recorded in the shard collection that this
+        process doesn't know yet or knows under another root, e.g. ones added
+        through another worker, and watch them. Returns their names.
+        """
+        added = []
+        for shard in await self.index_shards_dao.get_shards():
+            name, root_path = shard["name"], shard.get("root_path")
+            if not root_path or self.shards.repositories.get(name) == root_path:
+                continue
+            await self.stop_watching(name)
+            self.shards.register(name, root_path)
+            self.watch(name)
+            added.append(name)
+        return added
+
+    async def follow_repositories(self, interval: float) -> None:
+        """
+        Pick up repositories registered by other workers every interval seconds.
+        Runs until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                added = await self.sync_repositories()
+                if added:
+                    logger.info(f"Registered repositories added by another worker: {', '.join(added)}")
+            except Exception as e:
+                logger.warning(f"Could not sync repositories: {e}")
+
+    def start_watching(self) -> None:
+        """
+        Watch every repository's files, now and as repositories are added.
+        Called in the writer process only, so each change is re-indexed once.
+        """
+        self.watching = True
+        for repository in self.shards.names():
+            self.watch(repository)
+
+    def watch(self, repository: str) -> None:
+        """
+        Re-index a repository's files as they change, if file watching is on
+        and this process is the writer.
+        """
+        root_path = self.shards.repositories[repository]
+        if not self.watching or not RAGConfig().file_watch_enabled or not os.path.isdir(root_path) or repository in self.file_watchers:
+            return
+        file_watcher = FileWatcher(root_path, functools.partial(self.reindex_paths, repository=repository))
+        file_watcher.start()
+        self.file_watchers[repository] = file_watcher
+
+    async def stop_watching(self, repository: str | None = None) -> None:
+        """
+        Stop one repository's file watcher, or all of them.
+        """
+        repositories = list(self.file_watchers) if repository is None else [repository]
+        for name in repositories:
+            file_watcher = self.file_watchers.pop(name, None)
+            if file_watcher is not None:
+                await file_watcher.stop()
+
+    def cron_actions(self) -> dict:
+        """
+        Jobs that cron_config.json can schedule, by name. They run on every repository.
+        """
+        return {
+            "refresh-vectors": self.refresh_all,
+            "compact-vectors": self.compact_all
+        }
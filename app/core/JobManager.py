@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from app.config import RAGConfig
+from app.core.ProcessLock import ProcessLock
+import asyncio
+import logging
+import time
+import uuid
+import os
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class Job:
+    """
+    One run of a background pipeline: its status, the progress of its current
+    stage, and chunk throughput over the whole run.
+    """
+    def __init__(self, kind: str, writes: bool, repository: str | None = None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.repository = repository
+        self.writes = writes
+        self.status = "queued"
+        self.stage = None
+        self.stages = {}
+        self.chunks = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def start_stage(self, name: str, total: int | None = None, unit: str = "chunks") -> None:
+        self.stage = name
+        self.stages[name] = {"done": 0, "total": total, "unit": unit}
+
+    def advance(self, done: int = 1, chunks: int | None = None) -> None:
+        """
+        Record progress in the current stage. Chunks count toward throughput;
+        they default to done when the stage counts chunks.
+        """
+        if self.stage is not None:
+            stage = self.stages[self.stage]
+            stage["done"] += done
+            if chunks is None and stage["unit"] == "chunks":
+                chunks = done
+        self.chunks += chunks or 0
+
+    @property
+    def chunks_per_second(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return round(self.chunks / elapsed, 1) if elapsed > 0 else 0.0
+
+    def get_job_info(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "repository": self.repository,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "chunks": self.chunks,
+            "chunks_per_second": self.chunks_per_second,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class JobManager:
+    """
+    Runs background pipelines as tracked asyncio tasks. Jobs that write chunks
+    or the index hold a single-writer lock, so a refresh never overlaps a parse
+    and embedding never starts before a running parse has finished. The lock
+    is also held across the worker processes through a lock file, so a write
+    job always starts from the index generation the previous one published,
+    whichever worker ran it. Finished jobs are kept for inspection up to
+    job_history_size.
+    """
+    def __init__(self, history_size: int | None = None):
+        config = RAGConfig()
+        self.history_size = history_size or config.job_history_size
+        self.jobs = OrderedDict()
+        self._write_lock = asyncio.Lock()
+        self._process_write_lock = ProcessLock(os.path.join(config.process_lock_dir, "write.lock"))
+
+    def submit(self, kind: str, pipeline, writes: bool = True, dedupe: bool = False, repository: str | None = None) -> Job:
+        """
+        Start pipeline(job), a coroutine function, as a job on repository. With
+        dedupe, an active job of the same kind on the same repository is
+        returned instead of starting another.
+        """
+        if dedupe:
+            for job in self.jobs.values():
+                if job.kind == kind and job.repository == repository and job.active:
+                    logger.info(f"Job {kind} already {job.status} as {job.job_id}, not starting another.")
+                    return job
+        job = Job(kind, writes, repository)
+        job.task = asyncio.create_task(self._run(job, pipeline))
+        job.task.add_done_callback(lambda task: self._on_done(job, task))
+        self.jobs[job.job_id] = job
+        self._trim()
+        logger.info(f"Submitted job {kind} as {job.job_id}.")
+        return job
+
+    async def _run(self, job: Job, pipeline):
+        try:
+            if job.writes:
+                async with self._write_lock:
+                    await self._process_write_lock.acquire()
+                    try:
+                        await self._execute(job, pipeline)
+                    finally:
+                        self._process_write_lock.release()
+            else:
+                await self._execute(job, pipeline)
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            logger.info(f"Job {job.kind} {job.job_id} cancelled.")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.exception(f"Job {job.kind} {job.job_id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    @staticmethod
+    def _on_done(job: Job, task: asyncio.Task):
+        # A task cancelled before it first ran never reaches _run's handlers.
+        if task.cancelled() and job.active:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+
+    async def _execute(self, job: Job, pipeline):
+        job.status = "running"
+        job.started_at = time.time()
+        job.result = await pipeline(job)
+        job.status = "succeeded"
+        logger.info(f"Job {job.kind} {job.job_id} succeeded ({job.chunks_per_second} chunks/s).")
+
+    def _trim(self):
+        # Drop the oldest finished jobs past the history size; active ones are kept.
+        excess = len(self.jobs) - self.history_size
+        for job_id in [job_id for job_id, job in self.jobs.items() if not job.active][:max(excess, 0)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        return list(reversed(self.jobs.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Request cancellation. Returns False if the job is unknown or already finished.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.task.cancel()
+        return True
+
+    async def shutdown(self):
+        """
+        Cancel active jobs and wait for them to unwind.
+        """
+        tasks = [job.task for job in self.jobs.values() if job.active]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._process_write_lock.close()
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where only a single worker process is supported.
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ProcessLock:
+    """
+    An exclusive lock shared by the worker processes on one host: a flock on
+    a lock file, which the OS releases if the holding process exits. It is
+    only ever tried without blocking, so waiting for it never ties up a
+    thread, and a cancelled wait never takes it.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.held = False
+        self._file = None
+        if fcntl is None:
+            logger.warning(f"File locks aren't supported here; {path} doesn't exclude other processes, so run a single worker.")
+
+    def try_acquire(self) -> bool:
+        """
+        Take the lock if no other process holds it. Returns True if it is now held.
+        """
+        if self.held:
+            return True
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        self.held = True
+        return True
+
+    async def acquire(self, poll_seconds: float = 0.1) -> None:
+        """
+        Wait until the lock is free and take it, retrying every poll_seconds.
+        """
+        while not self.try_acquire():
+            await asyncio.sleep(poll_seconds)
+
+    def release(self) -> None:
+        if not self.held:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self.held = False
+
+    def close(self) -> None:
+        self.release()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
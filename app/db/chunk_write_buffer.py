@@ -0,0 +1,44 @@
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.beans.chunks import Chunks
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ChunkWriteBuffer:
+    """
+    Bounded buffer in front of TreeSitterChunksDAO.insert_chunks. Chunks are
+    collected until max_chunks is reached, then written in one bulk insert,
+    which reserves the vector IDs of their new bodies in one counter update.
+    Chunks are assigned to repository as they are buffered.
+    """
+    def __init__(self, tree_sitter_chunks_dao: TreeSitterChunksDAO, max_chunks: int = 500, repository: str | None = None):
+        self.tree_sitter_chunks_dao = tree_sitter_chunks_dao
+        self.repository = repository
+        self.max_chunks = max_chunks
+        self.buffer = []
+        self.total_written = 0
+        self.total_new_bodies = 0
+
+    async def add(self, chunks: list[Chunks]) -> None:
+        """
+        Buffer chunks, flushing whenever the buffer is full.
+        """
+        for chunk in chunks:
+            if self.repository is not None:
+                chunk.repository = self.repository
+            self.buffer.append(chunk)
+            if len(self.buffer) >= self.max_chunks:
+                await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Write the buffered chunks. The DAO reserves vector IDs for their new bodies.
+        """
+        if not self.buffer:
+            return
+        chunks, self.buffer = self.buffer, []
+        new_bodies = await self.tree_sitter_chunks_dao.insert_chunks(chunks)
+        self.total_written += len(chunks)
+        self.total_new_bodies += len(new_bodies)
+        logger.info(f"Wrote {len(chunks)} chunks, {len(new_bodies)} new bodies ({self.total_written} total).")
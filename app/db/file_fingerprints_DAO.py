@@ -0,0 +1,74 @@
+from app.db.mongodb import MongoDBAsync
+from pymongo import ReplaceOne
+import logging
+import os
+import re
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FileFingerprintsDAO(MongoDBAsync):
+    """
+    Stores the (mtime, size, digest) fingerprint of every indexed file so a
+    refresh can tell which files changed since the previous run.
+    """
+    def __init__(self):
+        self.collection_name = "file_fingerprints"
+        super().__init__(collection_name=self.collection_name)
+
+    async def get_all_fingerprints(self, repository: str | None = None) -> dict:
+        """
+        Get all stored fingerprints keyed by file path, or only those of one repository.
+        """
+        query = {} if repository is None else {"repository": repository}
+        fingerprints = {}
+        async for doc in self.collection.find(query, projection={"_id": 0}):
+            fingerprints[doc["file_path"]] = doc
+        return fingerprints
+
+    async def get_fingerprints_under(self, paths: list[str]) -> dict:
+        """
+        Get the fingerprints of the given files and of every file under the given
+        directories, keyed by file path.
+        """
+        if not paths:
+            return {}
+        query = {"$or": [
+            {"file_path": {"$in": paths}},
+            *({"file_path": {"$regex": "^" + re.escape(path.rstrip(os.sep) + os.sep)}} for path in paths)
+        ]}
+        fingerprints = {}
+        async for doc in self.collection.find(query, projection={"_id": 0}):
+            fingerprints[doc["file_path"]] = doc
+        return fingerprints
+
+    async def upsert_fingerprints(self, fingerprints: list[dict]) -> None:
+        """
+        Insert or replace fingerprints, one document per file path.
+        """
+        if not fingerprints:
+            return
+        await self.collection.create_index("file_path", unique=True)
+        await self.collection.bulk_write([
+            ReplaceOne({"file_path": fingerprint["file_path"]}, fingerprint, upsert=True)
+            for fingerprint in fingerprints
+        ], ordered=False)
+
+    async def delete_fingerprint(self, file_path: str) -> None:
+        """
+        Delete the fingerprint for a specific file.
+        """
+        await self.collection.delete_one({"file_path": file_path})
+
+    async def assign_repository(self, repository: str) -> None:
+        """
+        Assign fingerprints stored before files belonged to repositories to repository.
+        """
+        await self.collection.update_many({"repository": None}, {"$set": {"repository": repository}})
+
+    async def delete_all_fingerprints(self, repository: str | None = None) -> None:
+        """
+        Delete all fingerprints, or one repository's, forcing the next refresh to
+        re-check every file.
+        """
+        await self.collection.delete_many({} if repository is None else {"repository": repository})
@@ -0,0 +1,43 @@
+from app.db.mongodb import MongoDBAsync
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class IndexShardsDAO(MongoDBAsync):
+    """
+    Metadata of every index shard, one document per repository: the root path
+    of shards registered at runtime, so they survive a restart, and the size
+    and time of the shard's last index build.
+    """
+    def __init__(self):
+        self.collection_name = "index_shards"
+        super().__init__(collection_name=self.collection_name)
+
+    async def get_shards(self) -> list[dict]:
+        """
+        Get the metadata of every shard.
+        """
+        return await self.collection.find({}, projection={"_id": 0}).to_list(None)
+
+    async def upsert_shard(self, name: str, root_path: str) -> None:
+        """
+        Register a repository as a shard, or move an existing one to a new root path.
+        """
+        await self.collection.create_index("name", unique=True)
+        await self.collection.update_one(
+            {"name": name},
+            {"$set": {"root_path": root_path}, "$setOnInsert": {"created_at": time.time()}},
+            upsert=True
+        )
+
+    async def record_build(self, name: str, vectors: int) -> None:
+        """
+        Record that a shard's index was written with the given number of vectors.
+        """
+        await self.collection.update_one(
+            {"name": name},
+            {"$set": {"vectors": vectors, "built_at": time.time()}},
+            upsert=True
+        )
@@ -1,10 +1,56 @@
 import pymongo
 import gridfs
+import threading
+import logging
 from app.config import RAGConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class MongoClientPool:
+    """
+    Process-wide AsyncMongoClient. Every DAO shares its connection pool, so
+    constructing a DAO costs no connection setup.
+    """
+    _client = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls) -> pymongo.AsyncMongoClient:
+        if cls._client is None:
+            with cls._lock:
+                if cls._client is None:
+                    config = RAGConfig()
+                    cls._client = pymongo.AsyncMongoClient(
+                        config.mongo_uri,
+                        maxPoolSize=config.mongo_max_pool_size,
+                        minPoolSize=config.mongo_min_pool_size,
+                        maxIdleTimeMS=config.mongo_max_idle_time_ms,
+                        connectTimeoutMS=config.mongo_connect_timeout_ms,
+                        serverSelectionTimeoutMS=config.mongo_server_selection_timeout_ms,
+                        socketTimeoutMS=config.mongo_socket_timeout_ms
+                    )
+                    logger.info(f"Created MongoDB client with a pool of up to {config.mongo_max_pool_size} connections.")
+        return cls._client
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        Close the shared client; the next get_client creates a new one.
+        """
+        with cls._lock:
+            client, cls._client = cls._client, None
+        if client is not None:
+            await client.close()
+            logger.info("Closed MongoDB client.")
+
 class MongoDBAsync:
     def __init__(self, collection_name="test"):
         self.db_name = RAGConfig().db_name
-        self.client = pymongo.AsyncMongoClient(RAGConfig().mongo_uri)
+        self.client = MongoClientPool.get_client()
         self.db = self.client[self.db_name]
         self.collection = self.db[collection_name]
         self.gridfs = gridfs.AsyncGridFSBucket(self.db, bucket_name=collection_name+"_gridfs")
+        # Raw bucket collections, for bulk queries the GridFS API can't express.
+        self.gridfs_files = self.db[collection_name+"_gridfs.files"]
+        self.gridfs_chunks = self.db[collection_name+"_gridfs.chunks"]
@@ -1,152 +1,746 @@
 from app.db.mongodb import MongoDBAsync
 from app.beans.chunks import Chunks
+from app.config import RAGConfig
+from pymongo import UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from bson import Binary, ObjectId
+import asyncio
 import logging
+import uuid
+import zlib
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+GRIDFS_CHUNK_SIZE = 1024 * 1024 * 12
+VECTOR_ID_COUNTER = "vector_id"
+BODIES_COLLECTION_NAME = "chunk_bodies"
+# Capped log of chunk writes, replayed by the worker processes that didn't make them.
+CHANGES_COLLECTION_NAME = "chunk_changes"
+CHANGE_COUNTER = "chunk_change"
+# Occurrences per change log entry, keeping entries far below the document size limit.
+CHANGE_BATCH_SIZE = 1000
+# Where chunks lived before they were stored as plain documents; read only by the migration.
+LEGACY_COLLECTION_NAME = "tree_sitter_chunks"
+# Body fields, present on occurrences only in data written before bodies were shared.
+BODY_FIELDS = ("content", "compression", "gridfs_id")
+# Everything but the body, for lookups that don't need content.
+METADATA_PROJECTION = {field: 0 for field in BODY_FIELDS}
+
 class TreeSitterChunksDAO(MongoDBAsync):
+    """
+    Chunks are content-addressed. Each distinct body is stored once in
+    chunk_bodies, keyed by its digest (the chunk hash), and owns the vector ID
+    it is embedded under. code_chunks holds one occurrence document per place
+    a chunk appears, with its metadata and the vector ID of its body, so
+    identical chunks across files share one body and one vector.
+
+    Bodies are inline (zlib-compressed above chunk_compression_min_bytes), or
+    in GridFS, referenced by gridfs_id, when too large for a document. A body
+    is deleted with its last occurrence.
+
+    Every occurrence belongs to a repository, whose index shard holds a vector
+    for each body occurring in it. Writes therefore report bodies per
+    repository: the ones a shard gains and the ones it loses.
+    """
+    _indexes_ensured = False
+    # Bumped on every write so caches over chunk data can tell when it changed.
+    generation = 0
+    # In-memory indexes over chunk data, told about every write as it happens. Each
+    # provides chunks_added(chunks), chunks_removed(chunks) and chunks_cleared(),
+    # called with occurrences; removed ones carry metadata but no content. Writes
+    # made by other worker processes are replayed from the change log (see
+    # follow_changes); chunks_reset(dao) asks for a rebuild when some were missed.
+    listeners = []
+    # Marks this process's change log entries, whose writes it has applied already.
+    process_id = uuid.uuid4().hex
+    _change_log_ensured = False
+
     def __init__(self):
-        self.collection_name = "tree_sitter_chunks"
+        self.collection_name = "code_chunks"
         super().__init__(collection_name=self.collection_name)
-        
+        self.bodies = self.db[BODIES_COLLECTION_NAME]
+        self.changes = self.db[CHANGES_COLLECTION_NAME]
+        config = RAGConfig()
+        self.change_log_max_bytes = config.chunk_change_log_max_bytes
+        self.compression = config.chunk_compression
+        self.compression_min_bytes = config.chunk_compression_min_bytes
+        self.inline_max_bytes = config.chunk_inline_max_bytes
+
+    @classmethod
+    def _notify(cls, event: str, *args) -> None:
+        for listener in cls.listeners:
+            try:
+                getattr(listener, event)(*args)
+            except Exception as e:
+                logger.error(f"Chunk listener {type(listener).__name__}.{event} failed: {e}")
+
+    async def ensure_indexes(self) -> None:
+        """
+        Create the indexes used by the bulk lookups. Runs once per process.
+        """
+        if TreeSitterChunksDAO._indexes_ensured:
+            return
+        # Occurrences of one body share its vector ID; only bodies hold it uniquely.
+        for name, info in (await self.collection.index_information()).items():
+            if info.get("unique") and info.get("key") == [("vector_id", 1)]:
+                await self.collection.drop_index(name)
+        await self.collection.create_index("vector_id")
+        await self.collection.create_index("file_path")
+        await self.collection.create_index("hash")
+        await self.collection.create_index([("repository", ASCENDING), ("hash", ASCENDING)])
+        await self.bodies.create_index("vector_id", unique=True)
+        TreeSitterChunksDAO._indexes_ensured = True
+
+    async def _ensure_change_log(self) -> None:
+        if TreeSitterChunksDAO._change_log_ensured:
+            return
+        if CHANGES_COLLECTION_NAME not in await self.db.list_collection_names():
+            try:
+                await self.db.create_collection(CHANGES_COLLECTION_NAME, capped=True, size=self.change_log_max_bytes)
+            except CollectionInvalid:
+                # Another worker created it first.
+                pass
+        await self.changes.create_index("seq")
+        TreeSitterChunksDAO._change_log_ensured = True
+
+    async def _log_change(self, event: str, **fields) -> None:
+        """
+        Append a write, already made and reported to this process's listeners,
+        to the change log for the other worker processes. Large writes are
+        logged in several entries. A failure is logged rather than raised,
+        since the write itself succeeded; the other workers catch up on the
+        next rebuild.
+        """
+        items = next(iter(fields.values()), [None])
+        try:
+            await self._ensure_change_log()
+            for start in range(0, max(len(items), 1), CHANGE_BATCH_SIZE):
+                counter = await self.db["counters"].find_one_and_update(
+                    {"_id": CHANGE_COUNTER},
+                    {"$inc": {"next": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                entry = {"seq": counter["next"], "process": self.process_id, "event": event}
+                entry.update({name: value[start:start + CHANGE_BATCH_SIZE] for name, value in fields.items()})
+                await self.changes.insert_one(entry)
+        except Exception as e:
+            logger.error(f"Could not log {event} to the chunk change log: {e}")
+
+    async def latest_change(self) -> int:
+        """
+        Sequence number of the last logged write, to follow the log from.
+        """
+        counter = await self.db["counters"].find_one({"_id": CHANGE_COUNTER})
+        return counter["next"] if counter is not None else 0
+
+    async def apply_changes(self, since: int) -> int:
+        """
+        Report the writes other processes logged after since to this process's
+        listeners, in order. If the capped log has already dropped some of
+        them, the listeners are told to rebuild instead. Returns the sequence
+        number to continue from.
+        """
+        entries = await self.changes.find({"seq": {"$gt": since}}, sort=[("seq", ASCENDING)]).to_list(None)
+        if not entries:
+            return since
+        if entries[0]["seq"] != since + 1:
+            logger.warning(f"Chunk change log no longer holds the changes after {since}, rebuilding in-memory indexes.")
+            TreeSitterChunksDAO.generation += 1
+            self._notify("chunks_reset", self)
+            return entries[-1]["seq"]
+        for entry in entries:
+            if entry["process"] == self.process_id:
+                continue
+            event = entry["event"]
+            if event == "chunks_added":
+                # Occurrences deleted since are skipped; their removal follows in the log.
+                documents = await self.collection.find({"_id": {"$in": entry["occurrence_ids"]}}).to_list(None)
+                args = (await self._hydrate(documents),)
+            elif event == "chunks_removed":
+                args = ([self._to_chunk(document) for document in entry["occurrences"]],)
+            else:
+                args = ()
+            TreeSitterChunksDAO.generation += 1
+            self._notify(event, *args)
+        return entries[-1]["seq"]
+
+    async def follow_changes(self, since: int, interval: float) -> None:
+        """
+        Apply writes made by other worker processes, checking the change log
+        every interval seconds, starting after change since. Runs until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                since = await self.apply_changes(since)
+            except Exception as e:
+                logger.warning(f"Could not read the chunk change log: {e}")
+
+    async def reserve_vector_ids(self, count: int) -> int:
+        """
+        Atomically reserve a range of count vector IDs and return the first one.
+        IDs are never handed out twice, even after the chunks using them are deleted.
+        """
+        counters = self.db["counters"]
+        if await counters.find_one({"_id": VECTOR_ID_COUNTER}) is None:
+            # Seed from existing data; $max keeps this safe against a concurrent seed.
+            await counters.update_one(
+                {"_id": VECTOR_ID_COUNTER},
+                {"$max": {"next": await self.get_last_vector_id() + 1}},
+                upsert=True
+            )
+        counter = await counters.find_one_and_update(
+            {"_id": VECTOR_ID_COUNTER},
+            {"$inc": {"next": count}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        return counter["next"]
+
+    async def _to_body_document(self, chunk: Chunks) -> dict:
+        document = {"_id": chunk.hash, "vector_id": chunk.vector_id}
+        data = chunk.content.encode('utf-8')
+        if self.compression == "zlib" and len(data) >= self.compression_min_bytes:
+            compressed = zlib.compress(data)
+            if len(compressed) < len(data):
+                document["compression"] = "zlib"
+                data = compressed
+        if len(data) > self.inline_max_bytes:
+            document["gridfs_id"] = await self.gridfs.upload_from_stream(
+                chunk.hash, data, chunk_size_bytes=GRIDFS_CHUNK_SIZE
+            )
+        elif "compression" in document:
+            document["content"] = Binary(data)
+        else:
+            document["content"] = chunk.content
+        return document
+
+    async def _read_content(self, document: dict) -> str:
+        if "gridfs_id" in document:
+            stream = await self.gridfs.open_download_stream(document["gridfs_id"])
+            data = await stream.read()
+        else:
+            data = document.get("content", "")
+            if isinstance(data, str):
+                return data
+            data = bytes(data)
+        if document.get("compression") == "zlib":
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    @staticmethod
+    def _to_chunk(document: dict) -> Chunks:
+        chunk = Chunks(document)
+        chunk.occurrence_id = str(document["_id"]) if "_id" in document else None
+        return chunk
+
+    async def _hydrate(self, documents: list[dict]) -> list[Chunks]:
+        # Reads each distinct body once, however many occurrences share it.
+        hashes = list({document.get("hash") for document in documents if document.get("hash") is not None})
+        contents = {}
+        if hashes:
+            async for body in self.bodies.find({"_id": {"$in": hashes}}):
+                contents[body["_id"]] = await self._read_content(body)
+        chunks = []
+        for document in documents:
+            chunk = self._to_chunk(document)
+            chunk.content = contents.get(document.get("hash"))
+            chunks.append(chunk)
+        return chunks
+
+    async def _body_vector_ids(self, hashes: list[str]) -> dict:
+        if not hashes:
+            return {}
+        return {
+            body["_id"]: int(body["vector_id"])
+            async for body in self.bodies.find({"_id": {"$in": hashes}}, projection={"vector_id": 1})
+        }
+
+    async def insert_chunks(self, chunks: list[Chunks]) -> list[Chunks]:
+        """
+        Insert chunk occurrences, storing each distinct body once. A chunk whose
+        body is already stored takes that body's vector ID. A new body keeps its
+        first chunk's vector ID, or gets a fresh one if it has none. Returns one
+        chunk per body new to the chunk's repository: the ones its shard still
+        needs a vector for.
+        """
+        if not chunks:
+            return []
+        await self.ensure_indexes()
+        first_by_hash = {}
+        for chunk in chunks:
+            if chunk.hash is None:
+                chunk.hash = Chunks.compute_hash(chunk.content)
+            first_by_hash.setdefault(chunk.hash, chunk)
+        body_ids = await self._body_vector_ids(list(first_by_hash))
+        stored_hashes = set(body_ids)
+        new_bodies = [chunk for content_hash, chunk in first_by_hash.items() if content_hash not in body_ids]
+        unnumbered = [chunk for chunk in new_bodies if chunk.vector_id is None]
+        if unnumbered:
+            next_vector_id = await self.reserve_vector_ids(len(unnumbered))
+            for offset, chunk in enumerate(unnumbered):
+                chunk.vector_id = next_vector_id + offset
+        if new_bodies:
+            documents = [await self._to_body_document(chunk) for chunk in new_bodies]
+            try:
+                await self.bodies.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Another writer stored some of these bodies first; defer to its vector IDs.
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+                stored = await self._body_vector_ids([chunk.hash for chunk in new_bodies])
+                new_bodies = [chunk for chunk in new_bodies if stored.get(chunk.hash) == chunk.vector_id]
+            body_ids.update({chunk.hash: int(chunk.vector_id) for chunk in new_bodies})
+            body_ids.update(await self._body_vector_ids([content_hash for content_hash in first_by_hash if content_hash not in body_ids]))
+        for chunk in chunks:
+            chunk.vector_id = body_ids[chunk.hash]
+        new_to_shards = await self._new_to_repositories(chunks, stored_hashes)
+        documents = [chunk.get_chunk_metadata() for chunk in chunks]
+        await self.collection.insert_many(documents, ordered=False)
+        for chunk, document in zip(chunks, documents):
+            chunk.occurrence_id = str(document["_id"])
+        TreeSitterChunksDAO.generation += 1
+        self._notify("chunks_added", chunks)
+        await self._log_change("chunks_added", occurrence_ids=[document["_id"] for document in documents])
+        return new_to_shards
+
+    async def _new_to_repositories(self, chunks: list[Chunks], stored_hashes: set) -> list[Chunks]:
+        # One chunk per (repository, body) without a stored occurrence yet. Only
+        # bodies stored before this write can already occur in a repository.
+        by_repository = {}
+        for chunk in chunks:
+            by_repository.setdefault(chunk.repository, {}).setdefault(chunk.hash, chunk)
+        new_to_shards = []
+        for repository, first_by_hash in by_repository.items():
+            known = [content_hash for content_hash in first_by_hash if content_hash in stored_hashes]
+            present = set()
+            if known:
+                present = set(await self.collection.distinct("hash", {"repository": repository, "hash": {"$in": known}}))
+            new_to_shards.extend(chunk for content_hash, chunk in first_by_hash.items() if content_hash not in present)
+        return new_to_shards
+
     async def insert_chunk(self, chunk: Chunks) -> None:
         """
-        Insert a chunk into the MongoDB collection.
+        Insert a single chunk.
         """
-        chunk_dict = chunk.get_chunk_info()
-        metadata = chunk.get_chunk_metadata()
-        async with self.gridfs.open_upload_stream(chunk.file_path, chunk_size_bytes=1024 * 1024 * 12, metadata=metadata) as stream:
-            await stream.write(chunk.content.encode('utf-8'))
-            
-        await self.collection.insert_one(chunk_dict)
-        
+        await self.insert_chunks([chunk])
+
+    async def _delete_occurrences(self, query: dict) -> list[int]:
+        """
+        Delete the occurrences matching query, then the bodies no occurrence
+        refers to anymore. Returns the vector IDs of the bodies left without an
+        occurrence in the deleted occurrences' repositories, whose shards should
+        drop them.
+        """
+        await self.ensure_indexes()
+        documents = await self.collection.find(query, projection=METADATA_PROJECTION).to_list(None)
+        if not documents:
+            return []
+        await self.collection.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+        hashes = list({document.get("hash") for document in documents if document.get("hash") is not None})
+        still_used = set(await self.collection.distinct("hash", {"hash": {"$in": hashes}}))
+        orphaned = [content_hash for content_hash in hashes if content_hash not in still_used]
+        if orphaned:
+            async for body in self.bodies.find({"_id": {"$in": orphaned}, "gridfs_id": {"$exists": True}}, projection={"gridfs_id": 1}):
+                await self.gridfs.delete(body["gridfs_id"])
+            await self.bodies.delete_many({"_id": {"$in": orphaned}})
+        by_repository = {}
+        for document in documents:
+            if document.get("hash") is not None and document.get("vector_id") is not None:
+                by_repository.setdefault(document.get("repository"), {})[document["hash"]] = int(document["vector_id"])
+        vector_ids = []
+        for repository, vector_id_by_hash in by_repository.items():
+            shared = [content_hash for content_hash in vector_id_by_hash if content_hash in still_used]
+            remaining = set()
+            if shared:
+                remaining = set(await self.collection.distinct("hash", {"repository": repository, "hash": {"$in": shared}}))
+            vector_ids.extend(vector_id for content_hash, vector_id in vector_id_by_hash.items() if content_hash not in remaining)
+        TreeSitterChunksDAO.generation += 1
+        self._notify("chunks_removed", [self._to_chunk(document) for document in documents])
+        await self._log_change("chunks_removed", occurrences=[
+            {field: document.get(field) for field in ("_id", "vector_id", "file_path", "type", "repository", "start_point")}
+            for document in documents
+        ])
+        return list(dict.fromkeys(vector_ids))
+
     async def get_chunks_by_file(self, file_path: str) -> list:
         """
         Get all chunks for a specific file and return as Chunks objects.
         """
-        chunks = []
-        async for file_doc in self.gridfs.find({"filename": file_path}):
-            content = await file_doc.read()
-            content_str = content.decode('utf-8')
-            metadata = file_doc.metadata or {}
-            chunk = Chunks(
-                type=metadata.get('type'),
-                content=content_str,
-                file_path=metadata.get('file_path'),
-                start_point=metadata.get('start_point'),
-                end_point=metadata.get('end_point'),
-                name=metadata.get('name'),
-                hash=metadata.get('hash'),
-                vector_id=metadata.get('vector_id')
+        await self.ensure_indexes()
+        documents = await self.collection.find({"file_path": file_path}).to_list(None)
+        return await self._hydrate(documents)
+
+    async def delete_chunk(self, vector_id: int) -> list[int]:
+        """
+        Delete every occurrence of the body with the given vector ID.
+        """
+        return await self.delete_chunks_by_vector_ids([vector_id])
+
+    async def delete_chunks_by_file(self, file_path: str) -> list[int]:
+        """
+        Delete all chunks for a specific file. Returns the vector IDs of the bodies
+        that no other file in its repository uses, whose vectors should be removed
+        from the repository's shard.
+        """
+        return await self._delete_occurrences({"file_path": file_path})
+
+    async def delete_chunks_by_ids(self, occurrence_ids: list) -> list[int]:
+        """
+        Delete the given occurrences (document _ids). Returns the vector IDs of
+        the bodies left without occurrences in their repositories.
+        """
+        if not occurrence_ids:
+            return []
+        return await self._delete_occurrences({"_id": {"$in": [ObjectId(occurrence_id) for occurrence_id in occurrence_ids]}})
+
+    async def get_chunk_metadata_by_file(self, file_path: str) -> list[dict]:
+        """
+        Get the metadata of all chunks for a specific file without reading their
+        content. Each includes its occurrence _id.
+        """
+        await self.ensure_indexes()
+        return await self.collection.find({"file_path": file_path}, projection=METADATA_PROJECTION).to_list(None)
+
+    async def get_chunk_attributes(self, batch_size: int = 10000):
+        """
+        Yield (occurrence _id, vector_id, file_path, type, repository) for every
+        occurrence, without reading content.
+        """
+        cursor = self.collection.find(
+            {},
+            projection={"vector_id": 1, "file_path": 1, "type": 1, "repository": 1},
+            batch_size=batch_size
+        )
+        async for document in cursor:
+            if document.get("vector_id") is not None:
+                yield (str(document["_id"]), int(document["vector_id"]), document.get("file_path"),
+                       document.get("type"), document.get("repository"))
+
+    async def delete_chunks_by_vector_ids(self, vector_ids: list[int]) -> list[int]:
+        """
+        Delete every occurrence of the bodies with the given vector IDs, and the
+        bodies. Every repository they occurred in loses their vectors.
+        """
+        if not vector_ids:
+            return []
+        return await self._delete_occurrences({"vector_id": {"$in": [int(vector_id) for vector_id in vector_ids]}})
+
+    async def update_chunk_positions(self, positions: list[tuple]) -> None:
+        """
+        Update start and end points of existing occurrences, given (occurrence _id,
+        start_point, end_point). Used when a chunk's content is unchanged but it
+        moved within its file.
+        """
+        if not positions:
+            return
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"_id": ObjectId(occurrence_id)},
+                {"$set": {"start_point": start_point, "end_point": end_point}}
             )
-            chunks.append(chunk)
-        return chunks
-    async def delete_chunk(self, chunk_id: str) -> None:
+            for occurrence_id, start_point, end_point in positions
+        ], ordered=False)
+        TreeSitterChunksDAO.generation += 1
+
+    async def count_chunks(self) -> int:
         """
-        Delete a chunk from the MongoDB collection.
+        Count the stored chunk occurrences.
         """
-        await self.gridfs.delete(chunk_id)
-        
-        # await self.collection.delete_one({"_id": chunk_id})
-    async def delete_chunks_by_file(self, file_path: str) -> None:
+        return await self.collection.count_documents({})
+
+    async def count_bodies(self, repository: str | None = None) -> int:
         """
-        Delete all chunks for a specific file.
+        Count the distinct chunk bodies, i.e. the vectors the index should hold.
+        With repository, count only the bodies occurring in it: its shard's vectors.
         """
-        async for file_doc in self.gridfs.find({"filename": file_path}):
-            await self.gridfs.delete(file_doc._id)
+        if repository is None:
+            return await self.bodies.count_documents({})
+        cursor = await self.collection.aggregate([
+            {"$match": {"repository": repository}},
+            {"$group": {"_id": "$hash"}},
+            {"$count": "bodies"}
+        ], allowDiskUse=True)
+        result = await cursor.to_list(None)
+        return result[0]["bodies"] if result else 0
 
-        # await self.collection.delete_many({"file_path": file_path})
-        
     async def get_chunks_by_batch(self, batch_size: int):
         """
-        Get chunks from GridFS in batches, including vector_id from metadata.
-        """
-        cursor = self.gridfs.find({})
-        batch = []
-        async for file_doc in cursor:
-            content = await file_doc.read()
-            content_str = content.decode('utf-8')
-            metadata = file_doc.metadata or {}
-            chunk = Chunks(
-                type=metadata.get('type'),
-                content=content_str,
-                file_path=metadata.get('file_path'),
-                start_point=metadata.get('start_point'),
-                end_point=metadata.get('end_point'),
-                name=metadata.get('name'),
-                hash=metadata.get('hash'),
-                vector_id=metadata.get('vector_id')
-            )
-            batch.append(chunk)
-            if len(batch) == batch_size:
-                yield batch
-                batch = []
-        if batch:
-            yield batch
-            
-                
+        Get all chunk occurrences in batches of batch_size, in vector_id order.
+        """
+        await self.ensure_indexes()
+        cursor = self.collection.find({}, sort=[("vector_id", ASCENDING)], batch_size=batch_size)
+        documents = []
+        async for document in cursor:
+            documents.append(document)
+            if len(documents) == batch_size:
+                yield await self._hydrate(documents)
+                documents = []
+        if documents:
+            yield await self._hydrate(documents)
+
+    async def get_bodies_by_batch(self, batch_size: int, repository: str | None = None):
+        """
+        Get every distinct body as a Chunks with vector_id, hash and content, in
+        batches of batch_size, in vector_id order. With repository, only the
+        bodies occurring in it.
+        """
+        await self.ensure_indexes()
+        if repository is not None:
+            async for chunks in self._get_repository_bodies_by_batch(batch_size, repository):
+                yield chunks
+            return
+        cursor = self.bodies.find({}, sort=[("vector_id", ASCENDING)], batch_size=batch_size)
+        chunks = []
+        async for body in cursor:
+            chunks.append(await self._to_body_chunk(body))
+            if len(chunks) == batch_size:
+                yield chunks
+                chunks = []
+        if chunks:
+            yield chunks
+
+    async def _get_repository_bodies_by_batch(self, batch_size: int, repository: str):
+        cursor = await self.collection.aggregate([
+            {"$match": {"repository": repository, "hash": {"$ne": None}}},
+            {"$group": {"_id": "$hash", "vector_id": {"$first": "$vector_id"}}},
+            {"$sort": {"vector_id": 1}}
+        ], allowDiskUse=True, batchSize=batch_size)
+        hashes = []
+        async for document in cursor:
+            hashes.append(document["_id"])
+            if len(hashes) == batch_size:
+                yield await self._get_bodies(hashes)
+                hashes = []
+        if hashes:
+            yield await self._get_bodies(hashes)
+
+    async def _get_bodies(self, hashes: list[str]) -> list[Chunks]:
+        cursor = self.bodies.find({"_id": {"$in": hashes}}, sort=[("vector_id", ASCENDING)])
+        return [await self._to_body_chunk(body) async for body in cursor]
+
+    async def get_bodies_by_vector_ids(self, vector_ids: list[int]) -> list[Chunks]:
+        """
+        Get the bodies with the given vector IDs as Chunks with vector_id, hash and content.
+        """
+        if not vector_ids:
+            return []
+        cursor = self.bodies.find({"vector_id": {"$in": [int(vector_id) for vector_id in vector_ids]}}, sort=[("vector_id", ASCENDING)])
+        return [await self._to_body_chunk(body) async for body in cursor]
+
+    async def _to_body_chunk(self, body: dict) -> Chunks:
+        return Chunks(vector_id=int(body["vector_id"]), hash=body["_id"], content=await self._read_content(body))
+
     async def get_all_chunks(self) -> list:
         """
         Get all chunks from the MongoDB collection.
         """
-        chunks = []
-        async for file_doc in self.gridfs.find({}):
-            content = await file_doc.read()
-            content_str = content.decode('utf-8')
-            metadata = file_doc.metadata or {}
-            chunk = Chunks(
-                type=metadata.get('type'),
-                content=content_str,
-                file_path=metadata.get('file_path'),
-                start_point=metadata.get('start_point'),
-                end_point=metadata.get('end_point'),
-                name=metadata.get('name'),
-                hash=metadata.get('hash'),
-                vector_id=metadata.get('vector_id')
-            )
-            chunks.append(chunk)
-        return chunks
-    
+        documents = await self.collection.find({}).to_list(None)
+        return await self._hydrate(documents)
+
+    async def delete_chunks_by_repository(self, repository: str) -> list[int]:
+        """
+        Delete every chunk of one repository, and the bodies no other repository uses.
+        """
+        return await self._delete_occurrences({"repository": repository})
+
+    async def assign_repository(self, repository: str) -> int:
+        """
+        Assign the occurrences written before chunks belonged to repositories to
+        repository. Returns how many were assigned.
+        """
+        result = await self.collection.update_many({"repository": None}, {"$set": {"repository": repository}})
+        if result.modified_count:
+            TreeSitterChunksDAO.generation += 1
+            logger.info(f"Assigned {result.modified_count} chunks to repository {repository}.")
+        return result.modified_count
+
     async def delete_all_chunks(self) -> None:
         """
-        Delete all chunks from the MongoDB collection.
+        Delete all chunks and bodies.
         """
-        async for file_doc in self.gridfs.find({}):
-            await self.gridfs.delete(file_doc._id)
-    
+        await self.collection.delete_many({})
+        await self.bodies.delete_many({})
+        await self.gridfs_files.delete_many({})
+        await self.gridfs_chunks.delete_many({})
+        TreeSitterChunksDAO.generation += 1
+        self._notify("chunks_cleared")
+        await self._log_change("chunks_cleared")
+
     async def get_chunk_by_vector_id(self, vector_id: int) -> Chunks | None:
         """
         Get a chunk by its vector ID.
         """
-        async for file_doc in self.gridfs.find({"metadata.vector_id": vector_id}):
-            content = await file_doc.read()
-            content_str = content.decode('utf-8')
-            metadata = file_doc.metadata or {}
-            return Chunks(
-                type=metadata.get('type'),
-                content=content_str,
-                file_path=metadata.get('file_path'),
-                start_point=metadata.get('start_point'),
-                end_point=metadata.get('end_point'),
-                name=metadata.get('name'),
-                hash=metadata.get('hash'),
-                vector_id=metadata.get('vector_id')
+        return (await self.get_chunks_by_vector_ids([vector_id]))[0]
+
+    async def get_chunks_by_vector_ids(self, vector_ids: list[int]) -> list[Chunks | None]:
+        """
+        Get one chunk for each of many vector IDs in one query. The result is
+        aligned with vector_ids, with None where no chunk exists.
+        """
+        occurrences = await self.get_occurrences_by_vector_ids(vector_ids)
+        return [occurrences[int(vector_id)][0] if int(vector_id) in occurrences else None for vector_id in vector_ids]
+
+    async def get_occurrences_by_vector_ids(self, vector_ids: list[int]) -> dict:
+        """
+        Get every occurrence of the bodies with the given vector IDs in one query,
+        as {vector_id: [Chunks, ...]} in file order.
+        """
+        unique_ids = list(dict.fromkeys(int(vector_id) for vector_id in vector_ids))
+        if not unique_ids:
+            return {}
+        await self.ensure_indexes()
+        documents = await self.collection.find({"vector_id": {"$in": unique_ids}}).to_list(None)
+        documents.sort(key=lambda document: (document.get("file_path") or "", document.get("start_point") or []))
+        occurrences = {}
+        for chunk in await self._hydrate(documents):
+            occurrences.setdefault(int(chunk.vector_id), []).append(chunk)
+        return occurrences
+
+    async def get_last_vector_id(self) -> int:
+        """
+        Get the highest vector ID in use, or -1 if there are no chunks.
+        """
+        last_vector_id = -1
+        for collection in (self.bodies, self.collection):
+            document = await collection.find_one(
+                {"vector_id": {"$ne": None}},
+                projection={"_id": 0, "vector_id": 1},
+                sort=[("vector_id", DESCENDING)]
             )
-        return None
+            if document:
+                last_vector_id = max(last_vector_id, int(document["vector_id"]))
+        return last_vector_id
 
-    async def get_last_vector_id(self) -> int | None:
+    async def migrate_inline_chunks(self, batch_size: int = 1000) -> list[int]:
         """
-        Get the last vector ID from the MongoDB collection.
+        Split chunks stored with their body inline, one document per chunk, into
+        occurrences and shared bodies. The first chunk seen with a body keeps its
+        vector ID for it; duplicates are pointed at that body. Returns the
+        duplicates' former vector IDs, whose vectors should be removed.
         """
-        cursor = self.gridfs.find({}, sort=[("metadata.vector_id", -1)])
-        async for file_doc in cursor:
-            metadata = file_doc.metadata or {}
-            vector_id = metadata.get("vector_id")
-            if isinstance(vector_id, int):
-                return vector_id
-            try:
-                return int(vector_id)
-            except (TypeError, ValueError):
-                return -1
-        return -1
\ No newline at end of file
+        query = {"$or": [{field: {"$exists": True}} for field in BODY_FIELDS]}
+        if await self.collection.find_one(query, projection={"_id": 1}) is None:
+            return []
+        await self.ensure_indexes()
+        logger.info("Moving inline chunk bodies to the shared body collection.")
+        obsolete = []
+        migrated = 0
+        while True:
+            documents = await self.collection.find(query, sort=[("vector_id", ASCENDING)], limit=batch_size).to_list(None)
+            if not documents:
+                break
+            # A stored hash may be Python's per-process hash() of the text, which
+            # earlier versions wrote; only the content digest matches new chunks.
+            for document in documents:
+                document["hash"] = Chunks.compute_hash(await self._read_content(document))
+            hashes = list({document["hash"] for document in documents})
+            body_ids = await self._body_vector_ids(hashes)
+            # A body inserted before an interrupted run finished may hold a document's GridFS file.
+            body_files = {
+                body["_id"]: body["gridfs_id"]
+                async for body in self.bodies.find({"_id": {"$in": hashes}, "gridfs_id": {"$exists": True}}, projection={"gridfs_id": 1})
+            }
+            new_bodies = []
+            updates = []
+            for document in documents:
+                vector_id = document.get("vector_id")
+                content_hash = document["hash"]
+                if content_hash not in body_ids:
+                    if vector_id is None:
+                        vector_id = await self.reserve_vector_ids(1)
+                    body_ids[content_hash] = int(vector_id)
+                    body = {"_id": content_hash, "vector_id": int(vector_id)}
+                    body.update({field: document[field] for field in BODY_FIELDS if field in document})
+                    new_bodies.append(body)
+                else:
+                    if vector_id is not None and int(vector_id) != body_ids[content_hash]:
+                        obsolete.append(int(vector_id))
+                    if "gridfs_id" in document and body_files.get(content_hash) != document["gridfs_id"]:
+                        await self.gridfs.delete(document["gridfs_id"])
+                updates.append(UpdateOne(
+                    {"_id": document["_id"]},
+                    {"$set": {"vector_id": body_ids[content_hash], "hash": content_hash},
+                     "$unset": {field: "" for field in BODY_FIELDS}}
+                ))
+            if new_bodies:
+                await self.bodies.insert_many(new_bodies, ordered=False)
+            await self.collection.bulk_write(updates, ordered=False)
+            migrated += len(documents)
+        TreeSitterChunksDAO.generation += 1
+        logger.info(f"Moved {migrated} chunks to shared bodies; {len(obsolete)} were duplicates.")
+        return obsolete
+
+    async def migrate_legacy_chunks(self, batch_size: int = 1000) -> list[int]:
+        """
+        Move chunks stored as GridFS files by earlier versions into the document
+        collection, keeping their vector IDs so the FAISS index stays valid.
+        Each batch is deleted from GridFS once written, so an interrupted
+        migration resumes where it stopped. Returns the former vector IDs of
+        duplicate chunks, which now share another chunk's body and vector.
+        """
+        legacy_files = self.db[LEGACY_COLLECTION_NAME + "_gridfs.files"]
+        legacy_chunks = self.db[LEGACY_COLLECTION_NAME + "_gridfs.chunks"]
+        if await legacy_files.find_one({}, projection={"_id": 1}) is None:
+            return []
+        await self.ensure_indexes()
+        logger.info("Migrating chunks from GridFS to the document collection.")
+        # Legacy vector IDs are only in the GridFS metadata, which reserve_vector_ids
+        # doesn't seed from; keep the IDs it hands out clear of them.
+        last_legacy = await legacy_files.find_one(
+            {"metadata.vector_id": {"$ne": None}},
+            projection={"metadata.vector_id": 1},
+            sort=[("metadata.vector_id", DESCENDING)]
+        )
+        if last_legacy is not None:
+            await self.db["counters"].update_one(
+                {"_id": VECTOR_ID_COUNTER},
+                {"$max": {"next": max(int(last_legacy["metadata"]["vector_id"]), await self.get_last_vector_id()) + 1}},
+                upsert=True
+            )
+        moved = 0
+        obsolete = []
+        while True:
+            file_docs = await legacy_files.find({}, projection={"_id": 1, "metadata": 1}, limit=batch_size).to_list(None)
+            if not file_docs:
+                break
+            file_ids = [file_doc["_id"] for file_doc in file_docs]
+            parts = {}
+            cursor = legacy_chunks.find(
+                {"files_id": {"$in": file_ids}},
+                projection={"_id": 0, "files_id": 1, "n": 1, "data": 1},
+                sort=[("files_id", ASCENDING), ("n", ASCENDING)]
+            )
+            async for chunk_doc in cursor:
+                parts.setdefault(chunk_doc["files_id"], []).append(bytes(chunk_doc["data"]))
+            chunks = {}
+            unnumbered = []
+            for file_doc in file_docs:
+                chunk = Chunks(file_doc.get("metadata") or {})
+                chunk.content = b"".join(parts.get(file_doc["_id"], [])).decode('utf-8')
+                # The stored hash is Python's per-process hash() of the text, not a digest.
+                chunk.hash = Chunks.compute_hash(chunk.content)
+                if chunk.vector_id is None:
+                    unnumbered.append(chunk)
+                else:
+                    chunks.setdefault(int(chunk.vector_id), chunk)
+            # Chunks without a vector ID were never indexed; give them fresh ones.
+            if unnumbered:
+                next_vector_id = await self.reserve_vector_ids(len(unnumbered))
+                for offset, chunk in enumerate(unnumbered):
+                    chunk.vector_id = next_vector_id + offset
+                    chunks[chunk.vector_id] = chunk
+            existing = set(await self.collection.distinct("vector_id", {"vector_id": {"$in": list(chunks)}}))
+            to_insert = [chunk for vector_id, chunk in chunks.items() if vector_id not in existing]
+            await self.insert_chunks(to_insert)
+            obsolete.extend(vector_id for vector_id, chunk in chunks.items() if vector_id not in existing and chunk.vector_id != vector_id)
+            await legacy_chunks.delete_many({"files_id": {"$in": file_ids}})
+            await legacy_files.delete_many({"_id": {"$in": file_ids}})
+            moved += len(to_insert)
+            logger.info(f"Migrated {moved} chunks so far.")
+        # The old duplicate write target, which nothing reads.
+        await self.db.drop_collection(LEGACY_COLLECTION_NAME)
+        logger.info(f"Migrated {moved} chunks from GridFS; {len(obsolete)} were duplicates.")
+        return obsolete
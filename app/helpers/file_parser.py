@@ -5,96 +5,524 @@ import tree_sitter_java as ts_java
 import tree_sitter_javascript as ts_javascript
 import os
 import csv
+import copy
 import json
+import re
+import bisect
+import logging
 from app.beans.chunks import Chunks
+from app.helpers.syntax_tree_cache import SyntaxTreeCache, CachedTree
+from app.config import RAGConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Node types holding names, collected per chunk for the lexical index.
+IDENTIFIER_NODE_TYPES = {"identifier", "type_identifier", "field_identifier", "property_identifier", "namespace_identifier"}
+
+# Per language, the node types extracted as chunks and the field holding each one's
+# name. A JS variable_declarator is a chunk only when it binds a function or class,
+# and a C++ function's name is found at the end of its declarator chain.
+CHUNK_NODE_TYPES = {
+    ".py": {"function_definition": "name", "class_definition": "name"},
+    ".java": {
+        "class_declaration": "name", "interface_declaration": "name", "enum_declaration": "name",
+        "record_declaration": "name", "method_declaration": "name", "constructor_declaration": "name"
+    },
+    ".js": {
+        "function_declaration": "name", "generator_function_declaration": "name",
+        "class_declaration": "name", "method_definition": "name", "variable_declarator": "name"
+    },
+    ".cpp": {"function_definition": "declarator", "class_specifier": "name", "struct_specifier": "name"}
+}
+# Values that make a JS variable_declarator a chunk, as in "const handler = async () => {...}".
+FUNCTION_VALUE_TYPES = {"arrow_function", "function_expression", "function", "generator_function", "class"}
+# Node types ending a C++ declarator chain with the declared name.
+DECLARATOR_NAME_TYPES = {"identifier", "field_identifier", "qualified_identifier", "destructor_name", "operator_name", "template_function"}
+
+# Data files, streamed into size-bounded windows rather than parsed whole.
+DATA_FILE_TYPES = (".csv", ".json")
+
+# Languages and parsers are built once per process and shared by every FileParser.
+_LANGUAGES = None
+_PARSERS = {}
+
+def get_languages() -> dict:
+    global _LANGUAGES
+    if _LANGUAGES is None:
+        _LANGUAGES = {
+            ".py": Language(ts_python.language()),
+            ".cpp": Language(ts_cpp.language()),
+            ".java": Language(ts_java.language()),
+            ".js": Language(ts_javascript.language()),
+        }
+    return _LANGUAGES
+
+def get_parser(ext: str) -> Parser:
+    if ext not in _PARSERS:
+        _PARSERS[ext] = Parser(get_languages()[ext])
+    return _PARSERS[ext]
+
+def init_parser_worker():
+    """
+    Process pool initializer: build the language and parser table up front.
+    """
+    for ext in get_languages():
+        get_parser(ext)
+
+def parse_files(file_paths: list[str]) -> list[Chunks]:
+    """
+    Parse a batch of files in a worker process. A file that fails to parse is
+    logged and skipped so it doesn't lose the rest of the batch.
+    """
+    chunks = []
+    for file_path in file_paths:
+        try:
+            chunks.extend(FileParser(file_path).parse_file_sync())
+        except Exception as e:
+            logger.error(f"Failed to parse {file_path}: {e}")
+    return chunks
+
+def iter_nodes(root):
+    """
+    Yield root and its descendants in document order. Walks a TreeCursor
+    rather than recursing, so deeply nested files can't hit the recursion limit.
+    """
+    cursor = root.walk()
+    while True:
+        yield cursor.node
+        if cursor.goto_first_child():
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return
+
+def _common_prefix_length(a: bytes, b: bytes, block_size: int = 4096) -> int:
+    # Compares block-wise first so long equal runs are checked at memcmp speed.
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i:i + block_size] == b[i:i + block_size]:
+        i += block_size
+    i = min(i, limit)
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+def _point_at(source: bytes, offset: int) -> tuple[int, int]:
+    # tree-sitter points are (row, byte column).
+    return (source.count(b"\n", 0, offset), offset - (source.rfind(b"\n", 0, offset) + 1))
+
+def compute_edit(old_source: bytes, new_source: bytes) -> dict:
+    """
+    The single edit turning old_source into new_source, spanning everything
+    between their common prefix and common suffix, as Tree.edit arguments.
+    """
+    prefix = _common_prefix_length(old_source, new_source)
+    suffix = _common_prefix_length(old_source[prefix:][::-1], new_source[prefix:][::-1])
+    old_end_byte = len(old_source) - suffix
+    new_end_byte = len(new_source) - suffix
+    return {
+        "start_byte": prefix,
+        "old_end_byte": old_end_byte,
+        "new_end_byte": new_end_byte,
+        "start_point": _point_at(old_source, prefix),
+        "old_end_point": _point_at(old_source, old_end_byte),
+        "new_end_point": _point_at(new_source, new_end_byte)
+    }
+
+def _shift_point(point, edit: dict) -> tuple[int, int]:
+    # Moves a point that lies after the edit the way tree-sitter does.
+    row, column = point
+    old_end_row, old_end_column = edit["old_end_point"]
+    new_end_row, new_end_column = edit["new_end_point"]
+    if row == old_end_row:
+        column += new_end_column - old_end_column
+    return (row + new_end_row - old_end_row, column)
+
+# A string, closed or running to the end of the scanned text, or a bracket.
+_JSON_STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*(?:(")|\\?\Z)|[\[\]{}]')
+# Characters a JSON number starts with or continues with.
+_JSON_NUMBER_CHARS = frozenset("-+.eE0123456789")
+
+class _JsonStream:
+    """
+    Reads JSON from a text file incrementally: values are decoded from a
+    buffer that is refilled, and compacted, as the document is consumed.
+    """
+    def __init__(self, file, read_size: int = 1 << 16):
+        self.file = file
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _read_more(self, size: int) -> bool:
+        if self.eof:
+            return False
+        data = self.file.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        The next non-whitespace character, or "" at the end of the document.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read_more(self.read_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.position} of the JSON buffer")
+        self.position += 1
+
+    def container_fits(self, limit: int) -> bool:
+        """
+        True if the object or array starting at the next character ends within
+        limit characters. Reads ahead at most that far.
+        """
+        self.peek()
+        while True:
+            end = min(len(self.buffer), self.position + limit)
+            depth = 0
+            for match in _JSON_STRUCTURE.finditer(self.buffer, self.position, end):
+                token = match.group()
+                if token[0] == '"':
+                    if match.group(1) is None:
+                        # A string running past what was scanned.
+                        break
+                elif token in "[{":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return True
+            if end == self.position + limit:
+                return False
+            # Malformed input is left for decode to report.
+            if not self._read_more(self.read_size):
+                return True
+
+    def decode(self):
+        """
+        Decode the next value, reading more while it is incomplete. Each retry
+        at least doubles the buffered text, so large values stay linear.
+        """
+        is_number = self.peek() in _JSON_NUMBER_CHARS
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number is only complete once a character that can't continue it
+                # follows: "1." or "1e" at the end of a read decode as 1.
+                if self.eof or (end < len(self.buffer) and not (is_number and self.buffer[end] in _JSON_NUMBER_CHARS)):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read_more(max(len(self.buffer) - self.position, self.read_size))
+
+def iter_json_lines(file, max_bytes: int, read_size: int = 1 << 16):
+    """
+    Yield the "path: value" lines of a JSON document (see json_lines), reading
+    it incrementally, read_size characters at a time. Members of the top-level
+    object or array, and of any container too large to decode whole, are
+    visited one at a time, so memory stays bounded by the largest small value
+    rather than the document.
+    """
+    stream = _JsonStream(file, read_size)
+    opening = stream.peek()
+    if opening in ("{", "["):
+        yield from _stream_json_members(stream, None, max_bytes)
+    elif opening:
+        yield from json_lines("$", stream.decode(), max_bytes)
+
+def _stream_json_members(stream: _JsonStream, path: str | None, max_bytes: int):
+    # Lines of the container at the stream's position, whose key path is path
+    # (None at the top level). Members spanning more than a few chunks of text
+    # are descended into rather than decoded.
+    opening = stream.peek()
+    closing = "}" if opening == "{" else "]"
+    stream.expect(opening)
+    if stream.peek() == closing:
+        stream.expect(closing)
+        return
+    index = 0
+    while True:
+        if opening == "{":
+            key = stream.decode()
+            stream.expect(":")
+            child_path = key if path is None else f"{path}.{key}"
+        else:
+            child_path = f"[{index}]" if path is None else f"{path}[{index}]"
+        if stream.peek() in ("{", "[") and not stream.container_fits(4 * max_bytes):
+            yield from _stream_json_members(stream, child_path, max_bytes)
+        else:
+            yield from json_lines(child_path, stream.decode(), max_bytes)
+        index += 1
+        if stream.peek() == ",":
+            stream.expect(",")
+            continue
+        stream.expect(closing)
+        return
+
+def json_lines(path: str, value, max_bytes: int):
+    """
+    "path: value" lines for a JSON value. A container whose line would exceed
+    max_bytes is split into lines for its members, with the key path extended.
+    """
+    line = f"{path}: {json.dumps(value, ensure_ascii=False)}"
+    if len(line) <= max_bytes or not isinstance(value, (dict, list)) or not value:
+        yield line
+        return
+    members = value.items() if isinstance(value, dict) else enumerate(value)
+    for key, member in members:
+        child_path = f"{path}[{key}]" if isinstance(value, list) else f"{path}.{key}"
+        yield from json_lines(child_path, member, max_bytes)
 
 class FileParser:
     def __init__(self, file_path):
         self.file_path = file_path
+        self.LANGUAGE_PARSERS = get_languages()
+        _, self.ext = os.path.splitext(file_path)
+        self.chunk_node_types = CHUNK_NODE_TYPES.get(self.ext, {})
 
-        PY_LANGUAGE = Language(ts_python.language())
-        CPP_LANGUAGE = Language(ts_cpp.language())
-        JAVA_LANGUAGE = Language(ts_java.language())
-        JAVASCRIPT_LANGUAGE = Language(ts_javascript.language())
-        
-        self.LANGUAGE_PARSERS = {
-                ".py": PY_LANGUAGE,
-                ".cpp": CPP_LANGUAGE,
-                ".java": JAVA_LANGUAGE,
-                ".js": JAVASCRIPT_LANGUAGE,
-            }
-        self.parser = Parser()
-
-    async def parse_file(self):
+    async def parse_file(self, tree_cache: SyntaxTreeCache | None = None):
         """
     Parse a file based on its extension and extract meaningful chunks.
     """
-        _, ext = os.path.splitext(self.file_path)
-        if ext in self.LANGUAGE_PARSERS:
-            # Tree-sitter parsing for supported languages
-            parser = Parser(self.LANGUAGE_PARSERS[ext])
-            with open(self.file_path, "r", encoding="utf-8") as file:
-                code = file.read()
-            tree = parser.parse(bytes(code, "utf8"))
-            root_node = tree.root_node
-            return self.extract_chunks(node=root_node, code=code)
-        elif ext == ".csv":
-            return self.parse_csv(self.file_path)
-        elif ext == ".json":
-            return self.parse_json(self.file_path)
+        return self.parse_file_sync(tree_cache)
+
+    def parse_file_sync(self, tree_cache: SyntaxTreeCache | None = None):
+        """
+        Synchronous implementation of parse_file, usable from worker processes.
+        With a tree_cache, source files are re-parsed incrementally.
+        """
+        if self.ext in self.LANGUAGE_PARSERS:
+            return list(self.parse_source(tree_cache))
+        elif self.ext == ".csv":
+            return list(self.parse_csv())
+        elif self.ext == ".json":
+            return list(self.parse_json())
         else:
-            print(f"Unsupported file type: {ext}")
+            print(f"Unsupported file type: {self.ext}")
             return []
 
-    def extract_chunks(self, node, code, chunks=None):
+    def iter_chunk_batches(self, batch_size: int, tree_cache: SyntaxTreeCache | None = None):
         """
-        Recursively extract meaningful chunks from the AST.
+        Yield the file's chunks in lists of at most batch_size. CSV and JSON files
+        are streamed, so memory stays flat however large they are.
         """
-        if chunks is None:
+        if self.ext == ".csv":
+            chunks = self.parse_csv()
+        elif self.ext == ".json":
+            chunks = self.parse_json()
+        elif self.ext in self.LANGUAGE_PARSERS:
+            chunks = self.parse_source(tree_cache)
+        else:
             chunks = []
-        if node.type in ["function_definition", "class_definition"]:
-            chunk = Chunks(
-                type=node.type,
-                content=node.text.decode('utf-8'),
-                file_path=self.file_path,
-                start_point=node.start_point,
-                end_point=node.end_point,
-                name=node.child_by_field_name("name").text.decode('utf-8') if node.child_by_field_name("name") else None,
-                hash=hash(node.text.decode('utf-8'))
-            )
-            chunks.append(chunk)
-        for child in node.children:
-            self.extract_chunks(child, code, chunks)
-        return chunks
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def parse_source(self, tree_cache: SyntaxTreeCache | None = None):
+        """
+        Parse a source file with tree-sitter and return an iterator over its chunks.
+        """
+        parser = get_parser(self.ext)
+        with open(self.file_path, "r", encoding="utf-8") as file:
+            source = bytes(file.read(), "utf8")
+        if tree_cache is not None:
+            return iter(self.parse_incremental(parser, source, tree_cache))
+        tree = parser.parse(source)
+        return self.extract_chunks(tree.root_node, source)
+
+    def extract_chunks(self, root, source: bytes):
+        """
+        Lazily yield a chunk for each of the language's chunk nodes under root,
+        in document order.
+        """
+        for node in iter_nodes(root):
+            if self.is_chunk_node(node):
+                yield self.make_chunk(node, source)
+
+    def is_chunk_node(self, node) -> bool:
+        if node.type not in self.chunk_node_types:
+            return False
+        if node.type == "variable_declarator":
+            value = node.child_by_field_name("value")
+            return value is not None and value.type in FUNCTION_VALUE_TYPES
+        if node.type in ("class_specifier", "struct_specifier"):
+            # Forward declarations and uses like "struct stat st;" have no body.
+            return node.child_by_field_name("body") is not None
+        return True
+
+    def node_name(self, node):
+        name = node.child_by_field_name(self.chunk_node_types[node.type])
+        if self.chunk_node_types[node.type] == "declarator":
+            # e.g. function_definition -> pointer_declarator -> function_declarator -> identifier
+            while name is not None and name.type not in DECLARATOR_NAME_TYPES:
+                name = name.child_by_field_name("declarator")
+        return name
+
+    def make_chunk(self, node, source: bytes) -> Chunks:
+        """
+        Build the chunk for a node, slicing its text out of the source once.
+        """
+        content = source[node.start_byte:node.end_byte].decode('utf-8')
+        name = self.node_name(node)
+        return Chunks(
+            type=node.type,
+            content=content,
+            file_path=self.file_path,
+            start_point=tuple(node.start_point),
+            end_point=tuple(node.end_point),
+            name=source[name.start_byte:name.end_byte].decode('utf-8') if name is not None else None,
+            hash=Chunks.compute_hash(content),
+            identifiers=self.collect_identifiers(node, source)
+        )
+
+    def parse_incremental(self, parser, source: bytes, tree_cache: SyntaxTreeCache) -> list[Chunks]:
+        """
+        Parse source reusing the cached tree of the file's previous version.
+        The old tree is edited to match, tree-sitter re-parses only what the edit
+        affects, and only chunks overlapping the edit or the tree's changed ranges
+        are re-extracted; the rest are carried over with shifted positions.
+        """
+        cached = tree_cache.pop(self.file_path)
+        if cached is None:
+            tree = parser.parse(source)
+            spans = [
+                (node.start_byte, node.end_byte, self.make_chunk(node, source))
+                for node in iter_nodes(tree.root_node) if self.is_chunk_node(node)
+            ]
+        elif cached.source == source:
+            tree, spans = cached.tree, cached.spans
+        else:
+            edit = compute_edit(cached.source, source)
+            cached.tree.edit(**edit)
+            tree = parser.parse(source, cached.tree)
+            dirty = [(edit["start_byte"], edit["new_end_byte"])]
+            dirty.extend((changed.start_byte, changed.end_byte) for changed in cached.tree.changed_ranges(tree))
+            spans = self._reextract_spans(tree.root_node, source, cached.spans, edit, dirty)
+        tree_cache.put(self.file_path, CachedTree(source, tree, spans))
+        # Callers may set vector ids on what they get; the cached chunks stay untouched.
+        return [copy.copy(chunk) for _, _, chunk in spans]
+
+    def _reextract_spans(self, root, source: bytes, old_spans: list, edit: dict, dirty: list) -> list:
+        # Walks the new tree, descending only into subtrees that overlap a dirty range.
+        delta = edit["new_end_byte"] - edit["old_end_byte"]
+        old_starts = [start for start, _, _ in old_spans]
+        spans = []
+        cursor = root.walk()
+        while True:
+            node = cursor.node
+            start, end = node.start_byte, node.end_byte
+            if any(start <= dirty_end and end >= dirty_start for dirty_start, dirty_end in dirty):
+                if self.is_chunk_node(node):
+                    spans.append((start, end, self.make_chunk(node, source)))
+                if cursor.goto_first_child():
+                    continue
+            else:
+                # The subtree lies wholly before or after the edit: reuse its old chunks.
+                after_edit = start >= edit["new_end_byte"]
+                old_start, old_end = (start - delta, end - delta) if after_edit else (start, end)
+                for index in range(bisect.bisect_left(old_starts, old_start), len(old_spans)):
+                    span_start, span_end, chunk = old_spans[index]
+                    if span_start >= old_end:
+                        break
+                    if span_end > old_end:
+                        continue
+                    if after_edit:
+                        chunk = copy.copy(chunk)
+                        chunk.start_point = _shift_point(chunk.start_point, edit)
+                        chunk.end_point = _shift_point(chunk.end_point, edit)
+                        span_start, span_end = span_start + delta, span_end + delta
+                    spans.append((span_start, span_end, chunk))
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return spans
+
+    @staticmethod
+    def collect_identifiers(node, source: bytes) -> list[str]:
+        """
+        Distinct identifiers under a node, in order of first appearance.
+        """
+        identifiers = {}
+        for current in iter_nodes(node):
+            if current.type in IDENTIFIER_NODE_TYPES:
+                identifiers.setdefault(source[current.start_byte:current.end_byte].decode('utf-8'), None)
+        return list(identifiers)
 
     def parse_csv(self):
         """
-        Parse CSV files and extract rows as chunks.
+        Stream CSV rows as windows of consecutive rows up to data_chunk_max_bytes.
+        Each window repeats the header row so it reads on its own.
         """
-        chunks = []
-        with open(self.file_path, "r") as file:
+        max_bytes = RAGConfig().data_chunk_max_bytes
+        with open(self.file_path, "r", encoding="utf-8", newline="") as file:
             reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+            header_line = ", ".join(header)
+            lines = []
+            size = len(header_line)
+            # Zero-based file lines; a quoted field may span several.
+            start_row = next_row = reader.line_num
             for row in reader:
-                chunk = Chunks(
-                    type="csv_row",
-                    content=", ".join(row),
-                    file_path=self.file_path
-                )
-                chunks.append(chunk)
-        return chunks
+                line = ", ".join(row)
+                if lines and size + len(line) + 1 > max_bytes:
+                    yield self.data_chunk("csv_rows", "\n".join([header_line, *lines]), start_row, next_row - 1)
+                    lines = []
+                    size = len(header_line)
+                    start_row = next_row
+                lines.append(line)
+                size += len(line) + 1
+                next_row = reader.line_num
+            if lines:
+                yield self.data_chunk("csv_rows", "\n".join([header_line, *lines]), start_row, next_row - 1)
 
     def parse_json(self):
         """
-        Parse JSON files and extract key-value pairs as chunks.
-        """
-        chunks = []
-        with open(self.file_path, "r") as file:
-            data = json.load(file)
-            for key, value in data.items():
-                chunk = Chunks(
-                    type="json_key_value",
-                    content=f"{key}: {value}",
-                    file_path=self.file_path
-                )
-                chunks.append(chunk)
-        return chunks
+        Stream the members of a JSON document as windows of "key: value" lines up
+        to data_chunk_max_bytes. Members too large for one window are split along
+        their nested keys; large containers are streamed item by item.
+        """
+        max_bytes = RAGConfig().data_chunk_max_bytes
+        with open(self.file_path, "r", encoding="utf-8") as file:
+            lines = []
+            size = 0
+            for line in iter_json_lines(file, max_bytes):
+                if lines and size + len(line) + 1 > max_bytes:
+                    yield self.data_chunk("json_members", "\n".join(lines))
+                    lines = []
+                    size = 0
+                lines.append(line)
+                size += len(line) + 1
+            if lines:
+                yield self.data_chunk("json_members", "\n".join(lines))
+
+    def data_chunk(self, chunk_type: str, content: str, start_row: int | None = None, end_row: int | None = None) -> Chunks:
+        return Chunks(
+            type=chunk_type,
+            content=content,
+            file_path=self.file_path,
+            start_point=(start_row, 0) if start_row is not None else None,
+            end_point=(end_row, 0) if end_row is not None else None,
+            hash=Chunks.compute_hash(content)
+        )
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from app.config import RAGConfig
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CachedTree:
+    """
+    A file's last parsed source, its tree-sitter Tree, and the chunks extracted
+    from it as (start_byte, end_byte, chunk) spans in document order.
+    """
+    __slots__ = ("source", "tree", "spans")
+
+    def __init__(self, source: bytes, tree, spans: list):
+        self.source = source
+        self.tree = tree
+        self.spans = spans
+
+class SyntaxTreeCache:
+    """
+    Bounded LRU of CachedTree per file path, so re-parsing a changed file can
+    hand tree-sitter the previous tree. Bounded by entry count and by the
+    total size of the cached sources.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, max_entries: int | None = None, max_bytes: int | None = None):
+        config = RAGConfig()
+        self.max_entries = max_entries or config.syntax_tree_cache_size
+        self.max_bytes = max_bytes or config.syntax_tree_cache_max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def pop(self, file_path: str) -> CachedTree | None:
+        """
+        Take a file's entry out of the cache. The caller edits its tree in place
+        and puts the new one back.
+        """
+        with self._lock:
+            cached = self.entries.pop(file_path, None)
+            if cached is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.total_bytes -= len(cached.source)
+            return cached
+
+    def put(self, file_path: str, cached: CachedTree) -> None:
+        with self._lock:
+            previous = self.entries.pop(file_path, None)
+            if previous is not None:
+                self.total_bytes -= len(previous.source)
+            if len(cached.source) > self.max_bytes:
+                return
+            self.entries[file_path] = cached
+            self.total_bytes += len(cached.source)
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted.source)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "source_bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
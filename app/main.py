@@ -4,14 +4,99 @@ from fastapi_mcp import FastApiMCP
 from starlette.middleware.cors import CORSMiddleware
 from app.config import RAGConfig
 import time
+import asyncio
 import logging
 import json
+import os
 from app.api.routes.api import router as api_router
 from app.api.cronjobs.add_cron_api import setup_cron_jobs
-from apscheduler.schedulers.background import BackgroundScheduler
+from app.rag.faiss.shard_manager import ShardManager
+from app.rag.lexical_index import LexicalIndex
+from app.rag.chunk_attributes import ChunkAttributeIndex
+from app.rag.vector_embedding import VectorEmbedding
+from app.rag.search_coalescer import SearchCoalescer
+from app.db.mongodb import MongoClientPool
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.db.file_fingerprints_DAO import FileFingerprintsDAO
+from app.db.index_shards_DAO import IndexShardsDAO
+from app.core.JobManager import JobManager
+from app.core.IndexingJobs import IndexingJobs
+from app.core.ProcessLock import ProcessLock
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """
+    Create the application-scoped services once, share them with routes via
+    app.state (see app.api.dependencies), and release them on shutdown.
+    """
+    state = application.state
+    state.tree_sitter_dao = TreeSitterChunksDAO()
+    state.file_fingerprints_dao = FileFingerprintsDAO()
+    state.index_shards_dao = IndexShardsDAO()
+    state.shards = ShardManager.get_instance()
+    state.vector_embedding = VectorEmbedding(state.tree_sitter_dao)
+    # The embedding cache files are shared; only the writer (below) may write them.
+    embedding_cache = state.vector_embedding.embedding_cache
+    embedding_cache.set_writable(False)
+    state.search_coalescer = SearchCoalescer(state.vector_embedding)
+    state.job_manager = JobManager()
+    state.indexing_jobs = IndexingJobs(
+        state.job_manager, state.tree_sitter_dao, state.file_fingerprints_dao,
+        state.vector_embedding, state.index_shards_dao
+    )
+    # Cron jobs run on this event loop and start pipelines in-process, in the writer only.
+    scheduler = AsyncIOScheduler()
+    setup_cron_jobs(scheduler, state.indexing_jobs.cron_actions())
+    config = RAGConfig()
+    # Repositories registered at runtime, then as many shards as may be resident.
+    shards = state.shards
+    await state.indexing_jobs.sync_repositories()
+    for repository in shards.names()[:config.max_loaded_shards]:
+        await shards.load(repository)
+    # One-time moves of chunks written by earlier versions, run as a write job so
+    # workers starting together take turns and later ones find nothing left to do.
+    migration = await state.indexing_jobs.migrate()
+    await asyncio.shield(migration.task)
+    # The in-memory chunk indexes are read once, then follow every worker's writes
+    # through the chunk change log, from the last write logged before they were read.
+    changes_since = await state.tree_sitter_dao.latest_change()
+    LexicalIndex.get_instance().build_in_background(state.tree_sitter_dao)
+    ChunkAttributeIndex.get_instance().build_in_background(state.tree_sitter_dao)
+    chunk_changes = asyncio.create_task(state.tree_sitter_dao.follow_changes(changes_since, config.chunk_change_poll_seconds))
+    # Index generations published by other workers are swapped in as they appear.
+    generation_watch = asyncio.create_task(shards.follow_generations(config.faiss_generation_poll_seconds))
+    repository_watch = asyncio.create_task(state.indexing_jobs.follow_repositories(config.writer_poll_seconds))
+    # Of all uvicorn workers, only the one holding the writer lock runs the cron jobs
+    # and the file watchers; another takes over if it exits.
+    writer_lock = ProcessLock(os.path.join(config.process_lock_dir, "writer.lock"))
+    async def run_as_writer():
+        await writer_lock.acquire(config.writer_poll_seconds)
+        logging.info(f"Process {os.getpid()} is the index writer.")
+        await asyncio.to_thread(embedding_cache.set_writable, True)
+        scheduler.start()
+        state.indexing_jobs.start_watching()
+    writer_election = asyncio.create_task(run_as_writer())
+    try:
+        yield
+    finally:
+        for task in (writer_election, repository_watch, generation_watch, chunk_changes):
+            task.cancel()
+        await state.indexing_jobs.stop_watching()
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        await state.job_manager.shutdown()
+        await state.search_coalescer.close()
+        if writer_lock.held:
+            embedding_cache.flush()
+        writer_lock.close()
+        await MongoClientPool.close()
+        logging.info("Application shut down cleanly.")
+
 def create_application() -> FastAPI:
     logging.basicConfig(level=logging.INFO)
-    application = FastAPI()
+    application = FastAPI(lifespan=lifespan)
     
     application.title = RAGConfig().app_name
     application.version = RAGConfig().app_version
@@ -35,9 +120,6 @@ def create_application() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
-    scheduler = BackgroundScheduler()
-    setup_cron_jobs(scheduler)
-    application.add_event_handler("startup", scheduler.start)
     
     mcp = FastApiMCP(application)
     mcp.mount()
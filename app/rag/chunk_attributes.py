@@ -0,0 +1,161 @@
+from app.beans.chunks import Chunks
+from app.beans.search_filter import SearchFilter
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+import numpy as np
+import asyncio
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ChunkAttributeIndex:
+    """
+    In-memory map from vector_id to the attributes searches can be filtered on:
+    repository, file path (and through it, language) and chunk type, with one
+    slot per occurrence of a body.
+
+    Repositories, paths and types are interned, so each occurrence costs one id
+    and three small codes. A filter is evaluated once per distinct value, then expanded
+    to the set of allowed vector ids with a single vectorized lookup. The map is
+    read from the chunk store once, at startup, and then follows
+    TreeSitterChunksDAO writes as they happen, including those other worker
+    processes make: added occurrences take a slot, removed ones free theirs
+    for reuse.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+                    TreeSitterChunksDAO.listeners.append(cls._instance)
+        return cls._instance
+
+    def __init__(self):
+        self.ready = False
+        self._build_task = None
+        self._clear()
+
+    def _clear(self):
+        # Free slots hold vector id -1, which no filter allows.
+        self.vector_ids = np.zeros(0, dtype=np.int64)
+        self.path_codes = np.zeros(0, dtype=np.int32)
+        self.type_codes = np.zeros(0, dtype=np.int32)
+        self.repository_codes = np.zeros(0, dtype=np.int32)
+        self.paths, self.types, self.repositories = [], [], []
+        self._path_index, self._type_index, self._repository_index = {}, {}, {}
+        # Occurrence key -> slot.
+        self.slots = {}
+        self.free_slots = []
+
+    @staticmethod
+    def _intern(index: dict, values: list, value) -> int:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+
+    def _grow(self, min_capacity: int):
+        capacity = self.vector_ids.shape[0]
+        new_capacity = max(min_capacity, capacity * 2, 1024)
+        self.vector_ids = np.concatenate([self.vector_ids, np.full(new_capacity - capacity, -1, dtype=np.int64)])
+        for name in ("path_codes", "type_codes", "repository_codes"):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(new_capacity - capacity, dtype=np.int32)]))
+        self.free_slots.extend(range(new_capacity - 1, capacity - 1, -1))
+
+    def add(self, occurrence_key, vector_id: int, file_path: str, chunk_type: str, repository: str) -> None:
+        """
+        Record one occurrence, or update it if it is already known.
+        """
+        slot = self.slots.get(occurrence_key)
+        if slot is None:
+            if not self.free_slots:
+                self._grow(len(self.slots) + 1)
+            slot = self.slots[occurrence_key] = self.free_slots.pop()
+        self.vector_ids[slot] = vector_id
+        self.path_codes[slot] = self._intern(self._path_index, self.paths, file_path)
+        self.type_codes[slot] = self._intern(self._type_index, self.types, chunk_type)
+        self.repository_codes[slot] = self._intern(self._repository_index, self.repositories, repository)
+
+    def remove(self, occurrence_key) -> None:
+        slot = self.slots.pop(occurrence_key, None)
+        if slot is not None:
+            self.vector_ids[slot] = -1
+            self.free_slots.append(slot)
+
+    @staticmethod
+    def _occurrence_key(chunk: Chunks):
+        return chunk.occurrence_id or (chunk.file_path, tuple(chunk.start_point or ()))
+
+    # TreeSitterChunksDAO listener interface, called on the event loop like searches.
+    def chunks_added(self, chunks: list[Chunks]) -> None:
+        for chunk in chunks:
+            if chunk.vector_id is not None:
+                self.add(self._occurrence_key(chunk), int(chunk.vector_id), chunk.file_path, chunk.type, chunk.repository)
+
+    def chunks_removed(self, chunks: list[Chunks]) -> None:
+        for chunk in chunks:
+            self.remove(self._occurrence_key(chunk))
+
+    def chunks_cleared(self) -> None:
+        self._clear()
+
+    def chunks_reset(self, dao: TreeSitterChunksDAO) -> None:
+        # Writes were missed: start over from the chunk store.
+        if self._build_task is not None:
+            self._build_task.cancel()
+        self.ready = False
+        self._clear()
+        self.build_in_background(dao)
+
+    async def build(self, dao: TreeSitterChunksDAO) -> None:
+        """
+        Read the attributes of every stored occurrence. Writes that land
+        meanwhile are applied as usual.
+        """
+        async for occurrence_id, vector_id, file_path, chunk_type, repository in dao.get_chunk_attributes():
+            self.add(occurrence_id, vector_id, file_path, chunk_type, repository)
+        self.ready = True
+        logger.info(f"Built chunk attribute map: {len(self.slots)} occurrences, {len(self.paths)} files, {len(self.types)} chunk types.")
+
+    def build_in_background(self, dao: TreeSitterChunksDAO) -> asyncio.Task:
+        """
+        Schedule build on the running loop. Filtered searches wait for it.
+        """
+        # Keep a reference so the task is not garbage collected mid-flight.
+        self._build_task = asyncio.create_task(self.build(dao))
+        self._build_task.add_done_callback(self._log_build_failure)
+        return self._build_task
+
+    @staticmethod
+    def _log_build_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Building the chunk attribute map failed: {task.exception()}")
+
+    async def ensure_built(self, dao: TreeSitterChunksDAO) -> None:
+        """
+        Wait for the startup build, starting it if it never ran or failed.
+        """
+        if self.ready:
+            return
+        if self._build_task is None or self._build_task.done():
+            self.build_in_background(dao)
+        await asyncio.shield(self._build_task)
+
+    def allowed_ids(self, search_filter: SearchFilter) -> np.ndarray:
+        """
+        Vector ids of the chunks that satisfy the filter.
+        """
+        path_ok = np.array([search_filter.matches_path(path) for path in self.paths], dtype=bool)
+        type_ok = np.array([search_filter.matches_type(chunk_type) for chunk_type in self.types], dtype=bool)
+        repository_ok = np.array([search_filter.matches_repository(repository) for repository in self.repositories], dtype=bool)
+        if not path_ok.any() or not type_ok.any() or not repository_ok.any():
+            return np.zeros(0, dtype=np.int64)
+        # A body shared by several occurrences is allowed if any of them matches.
+        mask = path_ok[self.path_codes] & type_ok[self.type_codes] & repository_ok[self.repository_codes] & (self.vector_ids >= 0)
+        return np.unique(self.vector_ids[mask])
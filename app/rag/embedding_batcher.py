@@ -0,0 +1,72 @@
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class TokenBudgetBatcher:
+    """
+    Schedules texts for SentenceTransformer.encode by tokenized length.
+
+    encode pads every batch to its longest member, so mixing 3-line helpers with
+    2000-line classes spends most of the compute on padding. Texts are sorted by
+    length and cut into batches whose padded size (longest length x count) stays
+    within a token budget, so short texts travel in large batches and long ones
+    in small batches. Embeddings are returned in the original order.
+    """
+    def __init__(self, model, max_tokens_per_batch: int = 16384, max_batch_size: int = 256):
+        self.model = model
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_batch_size = max_batch_size
+
+    def token_lengths(self, texts: list[str]) -> np.ndarray:
+        """
+        Tokenized length of each text, capped at the model's max_seq_length.
+        """
+        max_length = self.model.max_seq_length
+        encoded = self.model.tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=max_length,
+            return_attention_mask=False,
+            return_token_type_ids=False
+        )
+        return np.array([len(input_ids) for input_ids in encoded["input_ids"]], dtype=np.int64)
+
+    def plan_batches(self, lengths: np.ndarray) -> list[np.ndarray]:
+        """
+        Split text positions into batches, longest first, bounded by the token budget.
+        """
+        order = np.argsort(-lengths, kind="stable")
+        batches = []
+        start = 0
+        while start < order.size:
+            # The first member is the longest, so it fixes the padded width of the batch.
+            width = max(int(lengths[order[start]]), 1)
+            size = max(1, min(self.max_batch_size, self.max_tokens_per_batch // width))
+            batches.append(order[start:start + size])
+            start += size
+        return batches
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """
+        Encode texts in length-bucketed batches and return embeddings aligned with texts.
+        """
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        lengths = self.token_lengths(texts)
+        batches = self.plan_batches(lengths)
+        embeddings = None
+        for batch in batches:
+            batch_embeddings = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                convert_to_numpy=True
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[batch] = batch_embeddings
+        padded = sum(int(lengths[batch[0]]) * len(batch) for batch in batches)
+        logger.info(f"Encoded {len(texts)} texts in {len(batches)} batches, {int(lengths.sum())}/{padded} tokens non-padding.")
+        return embeddings
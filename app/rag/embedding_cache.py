@@ -0,0 +1,258 @@
+import numpy as np
+import hashlib
+import threading
+import logging
+import zlib
+import re
+import os
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings keyed by chunk content digest and model name.
+
+    Entries live in a memory-mapped file of fixed-size records, one per slot:
+    the key, a CRC32 of the vector and the float32 vector. The slot keys and
+    last-use ticks are kept in memory and saved next to it on flush. When the
+    cache holds more than max_entries, the least recently used entries are
+    evicted and their slots reused. compact() rewrites the record file without
+    free slots.
+
+    Record pages reach the disk whenever the OS writes them back, so after a
+    crash the saved keys can be older than the records. A record is only
+    returned if it holds the key asked for and its vector matches the CRC;
+    anything else is a miss.
+
+    The files are shared by every worker process, and only one may write
+    them: the others open the cache read-only (set_writable), look entries up,
+    and neither store, flush nor compact.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, cache_dir: str, model_name: str, dimension: int, max_entries: int):
+        with cls._instances_lock:
+            if model_name not in cls._instances:
+                cls._instances[model_name] = cls(cache_dir, model_name, dimension, max_entries)
+            return cls._instances[model_name]
+
+    def __init__(self, cache_dir: str, model_name: str, dimension: int, max_entries: int):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.cache_dir = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.records_path = os.path.join(self.cache_dir, "records.bin")
+        # Vectors without keys, written before records carried them.
+        self.legacy_vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self.keys_path = os.path.join(self.cache_dir, "keys.npy")
+        self.last_used_path = os.path.join(self.cache_dir, "last_used.npy")
+        self.record_dtype = np.dtype([("key", "S64"), ("crc", np.uint32), ("vector", np.float32, (dimension,))])
+        self.hits = 0
+        self.misses = 0
+        self.writable = True
+        self._lock = threading.Lock()
+        self._tick = 0
+        self._dirty = False
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self.writable and os.path.exists(self.legacy_vectors_path):
+            logger.info(f"Dropping embedding cache {self.cache_dir} written in the old layout.")
+            for path in (self.legacy_vectors_path, self.keys_path, self.last_used_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        capacity = 0
+        if all(os.path.exists(path) for path in (self.keys_path, self.last_used_path, self.records_path)):
+            keys = np.load(self.keys_path)
+            last_used = np.load(self.last_used_path)
+            capacity = keys.shape[0]
+            if os.path.getsize(self.records_path) != capacity * self.record_dtype.itemsize:
+                logger.warning(f"Embedding cache at {self.cache_dir} doesn't match dimension {self.dimension}, resetting it.")
+                capacity = 0
+        if capacity == 0:
+            keys = np.zeros(0, dtype="S64")
+            last_used = np.zeros(0, dtype=np.int64)
+            self.records = None
+        else:
+            self.records = np.memmap(self.records_path, dtype=self.record_dtype, mode="r+" if self.writable else "r", shape=(capacity,))
+        self.keys = keys
+        self.last_used = last_used
+        self.slots = {key: slot for slot, key in enumerate(keys.tolist()) if key}
+        self.free_slots = [slot for slot, key in enumerate(keys.tolist()) if not key]
+        self._tick = int(last_used.max()) if last_used.size else 0
+        logger.info(f"Opened embedding cache {self.cache_dir} with {len(self.slots)} entries.")
+
+    def set_writable(self, writable: bool) -> None:
+        """
+        Reopen the cache from its files, read-only or for writing. A process
+        becoming the writer starts from what the previous writer saved.
+        """
+        with self._lock:
+            if self.writable and self._dirty and self.records is not None:
+                self.records.flush()
+                self._save_metadata()
+            self.records = None
+            self.writable = writable
+            self._dirty = False
+            self._open()
+
+    def _key(self, content_hash: str) -> bytes:
+        # Hex keys: numpy's fixed-width bytes would strip a trailing NUL from a raw digest.
+        return hashlib.sha256(f"{self.model_name}\0{content_hash}".encode("utf-8")).hexdigest().encode("ascii")
+
+    def _grow(self, min_capacity: int):
+        capacity = self.keys.shape[0]
+        new_capacity = max(min_capacity, capacity * 2, 1024)
+        if self.records is not None:
+            self.records.flush()
+            self.records = None
+        with open(self.records_path, "ab") as file:
+            file.truncate(new_capacity * self.record_dtype.itemsize)
+        self.records = np.memmap(self.records_path, dtype=self.record_dtype, mode="r+", shape=(new_capacity,))
+        self.keys = np.concatenate([self.keys, np.zeros(new_capacity - capacity, dtype="S64")])
+        self.last_used = np.concatenate([self.last_used, np.zeros(new_capacity - capacity, dtype=np.int64)])
+        self.free_slots.extend(range(new_capacity - 1, capacity - 1, -1))
+
+    def get_many(self, content_hashes: list[str]) -> tuple[np.ndarray, list[int]]:
+        """
+        Look up embeddings. Returns an array aligned with content_hashes (rows of
+        misses are left at zero) and the positions of the misses.
+        """
+        result = np.zeros((len(content_hashes), self.dimension), dtype=np.float32)
+        missing = []
+        with self._lock:
+            self._tick += 1
+            for position, content_hash in enumerate(content_hashes):
+                key = self._key(content_hash)
+                slot = self.slots.get(key)
+                if slot is not None and not self._read_record(slot, key, result[position]):
+                    self._free(slot)
+                    slot = None
+                if slot is None:
+                    missing.append(position)
+                    continue
+                self.last_used[slot] = self._tick
+            self.hits += len(content_hashes) - len(missing)
+            self.misses += len(missing)
+            if len(missing) < len(content_hashes):
+                self._dirty = True
+        return result, missing
+
+    def put_many(self, content_hashes: list[str], embeddings: np.ndarray) -> None:
+        """
+        Store embeddings, evicting least recently used entries past max_entries.
+        A read-only cache stores nothing.
+        """
+        if not self.writable:
+            return
+        with self._lock:
+            self._tick += 1
+            for content_hash, embedding in zip(content_hashes, embeddings):
+                key = self._key(content_hash)
+                slot = self.slots.get(key)
+                if slot is None:
+                    if not self.free_slots:
+                        self._grow(len(self.slots) + 1)
+                    slot = self.free_slots.pop()
+                    self.slots[key] = slot
+                    self.keys[slot] = key
+                vector = np.asarray(embedding, dtype=np.float32)
+                self.records[slot] = (key, zlib.crc32(vector.tobytes()), vector)
+                self.last_used[slot] = self._tick
+            self._dirty = True
+            self._evict()
+
+    def _read_record(self, slot: int, key: bytes, out: np.ndarray) -> bool:
+        # Copies the slot's vector into out if the record holds key and is intact.
+        record = self.records[slot]
+        vector = np.ascontiguousarray(record["vector"])
+        if record["key"] != key or zlib.crc32(vector.tobytes()) != int(record["crc"]):
+            logger.warning(f"Embedding cache slot {slot} doesn't hold the entry its key points at, dropping it.")
+            return False
+        out[:] = vector
+        return True
+
+    def _free(self, slot: int):
+        del self.slots[bytes(self.keys[slot])]
+        self.keys[slot] = b""
+        self.last_used[slot] = 0
+        self.free_slots.append(slot)
+        self._dirty = True
+
+    def _evict(self):
+        excess = len(self.slots) - self.max_entries
+        if excess <= 0:
+            return
+        # Evict down to 90% so eviction doesn't run on every put.
+        excess += self.max_entries // 10
+        occupied = np.array(list(self.slots.values()), dtype=np.int64)
+        victims = occupied[np.argsort(self.last_used[occupied], kind="stable")[:excess]]
+        for slot in victims.tolist():
+            self._free(slot)
+        logger.info(f"Evicted {victims.size} entries from the embedding cache.")
+
+    def compact(self) -> None:
+        """
+        Rewrite the record file with live entries only, packed at the front.
+        Records carry their keys, so the file is consistent on its own until
+        the slot metadata is saved.
+        """
+        if not self.writable:
+            return
+        with self._lock:
+            occupied = np.array(sorted(self.slots.values()), dtype=np.int64)
+            capacity = max(len(occupied), 1)
+            tmp_path = self.records_path + ".tmp"
+            packed = np.memmap(tmp_path, dtype=self.record_dtype, mode="w+", shape=(capacity,))
+            if occupied.size:
+                packed[:occupied.size] = self.records[occupied]
+            packed.flush()
+            del packed
+            keys = np.zeros(capacity, dtype="S64")
+            last_used = np.zeros(capacity, dtype=np.int64)
+            keys[:occupied.size] = self.keys[occupied]
+            last_used[:occupied.size] = self.last_used[occupied]
+            self.records = None
+            os.replace(tmp_path, self.records_path)
+            self.records = np.memmap(self.records_path, dtype=self.record_dtype, mode="r+", shape=(capacity,))
+            self.keys = keys
+            self.last_used = last_used
+            self.slots = {key: slot for slot, key in enumerate(keys.tolist()) if key}
+            self.free_slots = list(range(capacity - 1, occupied.size - 1, -1))
+            self._dirty = True
+            self._save_metadata()
+        logger.info(f"Compacted embedding cache to {occupied.size} entries.")
+
+    def _save_metadata(self):
+        for path, array in ((self.keys_path, self.keys), (self.last_used_path, self.last_used)):
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+        self._dirty = False
+
+    def flush(self) -> None:
+        """
+        Persist vectors and slot metadata if anything changed, compacting first
+        if over a quarter of the file is free. A read-only cache is never written.
+        """
+        if not self.writable or not self._dirty:
+            return
+        if len(self.free_slots) > max(self.keys.shape[0] // 4, 1024):
+            self.compact()
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.records is not None:
+                self.records.flush()
+            self._save_metadata()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.slots), "capacity": int(self.keys.shape[0]),
+            "hits": self.hits, "misses": self.misses, "writable": self.writable
+        }
@@ -0,0 +1,129 @@
+import os
+import re
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# An index named code_index.faiss is written as immutable generations
+# code_index.g000001.faiss, code_index.g000002.faiss, ... each with its own
+# .tombstones.npy. code_index.faiss.generation holds the current generation's
+# number and is only ever replaced atomically, after the files it points to
+# are complete, so a reader never sees a partly written index.
+
+TOMBSTONES_SUFFIX = ".tombstones.npy"
+MARKER_SUFFIX = ".generation"
+
+def marker_path(faiss_filepath: str) -> str:
+    return faiss_filepath + MARKER_SUFFIX
+
+def generation_path(faiss_filepath: str, generation: int) -> str:
+    root, ext = os.path.splitext(faiss_filepath)
+    return f"{root}.g{generation:06d}{ext}"
+
+def read_marker(faiss_filepath: str) -> int | None:
+    """
+    The published generation number, or None if no generation was published.
+    """
+    try:
+        with open(marker_path(faiss_filepath)) as file:
+            return int(file.read().strip())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.error(f"Unreadable generation marker for {faiss_filepath}, ignoring it.")
+        return None
+
+def current_generation(faiss_filepath: str) -> tuple[int, str] | None:
+    """
+    (generation, file path) of the index to read, or None if there is none.
+    An index written before generations is generation 0, the file itself.
+    """
+    generation = read_marker(faiss_filepath)
+    if generation is None:
+        return (0, faiss_filepath) if os.path.exists(faiss_filepath) else None
+    path = generation_path(faiss_filepath, generation)
+    return (generation, path) if os.path.exists(path) else None
+
+def reserve_generation(faiss_filepath: str) -> tuple[int, str]:
+    """
+    Claim the next generation number by creating its file exclusively, so two
+    processes saving at once never write the same file.
+    """
+    os.makedirs(os.path.dirname(faiss_filepath) or ".", exist_ok=True)
+    generation = (read_marker(faiss_filepath) or 0) + 1
+    while True:
+        path = generation_path(faiss_filepath, generation)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return generation, path
+        except FileExistsError:
+            generation += 1
+
+def fsync_file(path: str) -> None:
+    with open(path, "rb") as file:
+        os.fsync(file.fileno())
+
+def publish_generation(faiss_filepath: str, generation: int) -> bool:
+    """
+    Make a fully written generation current by atomically replacing the
+    marker. A generation older than the published one is not published.
+    """
+    published = read_marker(faiss_filepath)
+    if published is not None and published >= generation:
+        logger.warning(f"Generation {generation} of {faiss_filepath} superseded by {published}, not publishing it.")
+        return False
+    marker = marker_path(faiss_filepath)
+    temporary = f"{marker}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        file.write(str(generation))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, marker)
+    return True
+
+def _generation_files(faiss_filepath: str):
+    # (generation, path) of every generation file and tombstones sidecar on disk.
+    directory = os.path.dirname(faiss_filepath) or "."
+    root, ext = os.path.splitext(os.path.basename(faiss_filepath))
+    pattern = re.compile(re.escape(root) + r"\.g(\d+)" + re.escape(ext) + r"(" + re.escape(TOMBSTONES_SUFFIX) + r")?(\.tmp)?$")
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            yield int(match.group(1)), os.path.join(directory, name)
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        # Windows refuses to delete a file another process still maps.
+        logger.warning(f"Could not remove {path}: {e}")
+
+def prune_generations(faiss_filepath: str, keep: int) -> None:
+    """
+    Delete all but the newest keep generations up to the published one, and
+    the file from before generations. A process still serving an old
+    generation keeps its mapping; the pages are freed once it moves on.
+    """
+    published = read_marker(faiss_filepath)
+    if published is None:
+        return
+    for generation, path in _generation_files(faiss_filepath):
+        if generation <= published - keep:
+            _remove(path)
+    for path in (faiss_filepath, faiss_filepath + TOMBSTONES_SUFFIX):
+        if os.path.exists(path):
+            _remove(path)
+
+def remove_index_files(faiss_filepath: str) -> None:
+    """
+    Delete an index: the marker first, so readers stop finding it, then every generation.
+    """
+    for path in (marker_path(faiss_filepath), faiss_filepath, faiss_filepath + TOMBSTONES_SUFFIX):
+        _remove(path)
+    for _, path in _generation_files(faiss_filepath):
+        _remove(path)
@@ -0,0 +1,97 @@
+from app.config import RAGConfig
+from app.rag.faiss.vector_store import VectorStore
+from app.rag.faiss import index_files
+import asyncio
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FaissIndexHolder:
+    """
+    Process-wide holder for a FAISS index used to serve searches, one per
+    index file (see ShardManager for the shard each file belongs to).
+
+    The current generation of the index is read once, memory-mapped when
+    faiss_mmap is on so every worker process shares its pages, and kept. A
+    newly published generation, written by this process or another, is read
+    in a worker thread and swapped in by replacing a single reference, so
+    searches that already hold the previous store finish against it
+    undisturbed.
+    """
+    _instances = {}
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, faiss_filepath: str | None = None):
+        faiss_filepath = faiss_filepath or RAGConfig().faiss_filepath
+        if faiss_filepath not in cls._instances:
+            with cls._instance_lock:
+                if faiss_filepath not in cls._instances:
+                    cls._instances[faiss_filepath] = cls(faiss_filepath)
+        return cls._instances[faiss_filepath]
+
+    def __init__(self, faiss_filepath: str | None = None):
+        self.faiss_filepath = faiss_filepath or RAGConfig().faiss_filepath
+        self.generation = 0
+        self._store = None
+        # (generation, file) of the index file the store was read from.
+        self._loaded_file = None
+        self._reload_lock = threading.Lock()
+        self._reload_task = None
+
+    def get_store(self) -> VectorStore | None:
+        """
+        Return the store currently serving searches, or None if no index is loaded.
+        """
+        return self._store
+
+    def _swap(self, store: VectorStore | None) -> None:
+        self._store = store
+        self._loaded_file = (store.generation, store.generation_file) if store is not None else None
+        self.generation += 1
+
+    def load(self, force: bool = False) -> bool:
+        """
+        Read the current index generation and swap it in. Returns True if a new
+        store was installed. Without force, it is only read when a generation
+        other than the loaded one has been published.
+        """
+        with self._reload_lock:
+            current = index_files.current_generation(self.faiss_filepath)
+            if current is None:
+                if self._store is not None:
+                    logger.info(f"FAISS index file removed, unloading: {self.faiss_filepath}")
+                    self._swap(None)
+                    return True
+                logger.warning(f"FAISS index file not found: {self.faiss_filepath}")
+                return False
+            if not force and self._store is not None and current == self._loaded_file:
+                return False
+            store = VectorStore.from_file(self.faiss_filepath, mmap=RAGConfig().faiss_mmap)
+            self._swap(store)
+            logger.info(f"Loaded FAISS index {store.generation_file} (generation {store.generation}) with {store.index.ntotal} vectors.")
+            return True
+
+    async def reload(self, force: bool = True) -> bool:
+        """
+        Load the index in a worker thread so the event loop keeps serving queries.
+        """
+        return await asyncio.to_thread(self.load, force)
+
+    def reload_in_background(self) -> asyncio.Task:
+        """
+        Schedule a reload on the running loop without waiting for it.
+        """
+        # Keep a reference so the task is not garbage collected mid-flight.
+        self._reload_task = asyncio.create_task(self.reload())
+        return self._reload_task
+
+    def unload(self) -> None:
+        """
+        Drop the in-memory index, e.g. after the index file has been deleted.
+        """
+        with self._reload_lock:
+            self._swap(None)
+        logger.info(f"Unloaded in-memory FAISS index {self.faiss_filepath}.")
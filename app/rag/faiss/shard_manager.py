@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from app.config import RAGConfig
+from app.rag.faiss.index_holder import FaissIndexHolder
+from app.rag.faiss.vector_store import VectorStore
+import threading
+import asyncio
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ShardManager:
+    """
+    Registry of the index shards, one per repository. Each shard has its own
+    index file, served by its own FaissIndexHolder, and is built and refreshed
+    on its own. The default repository's shard is faiss_filepath; the others
+    are <name>.faiss in faiss_shard_dir.
+
+    Shards are loaded and unloaded at runtime. At most max_loaded_shards are
+    resident; loading another unloads the least recently searched one.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        config = RAGConfig()
+        self.default_repository = config.default_repository
+        self.faiss_filepath = config.faiss_filepath
+        self.shard_dir = config.faiss_shard_dir
+        self.max_loaded = config.max_loaded_shards
+        # Repository name -> root path.
+        self.repositories = dict(config.repositories)
+        # Names of the resident shards, least recently searched first.
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def names(self) -> list[str]:
+        return list(self.repositories)
+
+    def resolve(self, repository: str | None) -> str:
+        """
+        The repository to act on: the given one, which must be registered, or the default.
+        """
+        repository = repository or self.default_repository
+        if repository not in self.repositories:
+            raise KeyError(f"Unknown repository: {repository}")
+        return repository
+
+    def register(self, name: str, root_path: str) -> None:
+        self.repositories[name] = root_path
+        logger.info(f"Registered repository {name} at {root_path}.")
+
+    def overlapping(self, name: str, root_path: str) -> str | None:
+        """
+        Another repository whose root contains, or lies inside, root_path. A file
+        belongs to a single shard, so roots must not overlap.
+        """
+        root_abs = os.path.abspath(root_path)
+        for other, other_root in self.repositories.items():
+            other_abs = os.path.abspath(other_root)
+            if other != name and os.path.commonpath([root_abs, other_abs]) in (root_abs, other_abs):
+                return other
+        return None
+
+    def index_path(self, repository: str) -> str:
+        if repository == self.default_repository:
+            return self.faiss_filepath
+        return os.path.join(self.shard_dir, f"{repository}.faiss")
+
+    def holder(self, repository: str | None = None) -> FaissIndexHolder:
+        return FaissIndexHolder.get_instance(self.index_path(self.resolve(repository)))
+
+    def repository_for_path(self, file_path: str) -> str | None:
+        """
+        The repository whose root contains file_path, the innermost one if roots nest.
+        """
+        file_abs = os.path.abspath(file_path)
+        found, found_root = None, ""
+        for name, root_path in self.repositories.items():
+            root_abs = os.path.abspath(root_path)
+            if file_abs.startswith(root_abs.rstrip(os.sep) + os.sep) and len(root_abs) > len(found_root):
+                found, found_root = name, root_abs
+        return found
+
+    def is_loaded(self, repository: str) -> bool:
+        return repository in self._loaded
+
+    async def load(self, repository: str | None = None) -> bool:
+        """
+        Make a shard resident, reading its index file unless the resident copy is
+        current. Returns True if a new store was installed.
+        """
+        repository = self.resolve(repository)
+        with self._lock:
+            self._loaded[repository] = None
+            self._loaded.move_to_end(repository)
+            evicted = []
+            while len(self._loaded) > self.max_loaded:
+                name, _ = self._loaded.popitem(last=False)
+                evicted.append(name)
+        for name in evicted:
+            self.holder(name).unload()
+            logger.info(f"Unloaded shard {name} to stay within {self.max_loaded} loaded shards.")
+        loaded = await self.holder(repository).reload(force=False)
+        if not self.is_loaded(repository):
+            # Unloaded again while its file was being read.
+            self.holder(repository).unload()
+        return loaded
+
+    def unload(self, repository: str) -> bool:
+        """
+        Drop a shard from memory. Returns False if it was not loaded.
+        """
+        repository = self.resolve(repository)
+        with self._lock:
+            if repository not in self._loaded:
+                return False
+            del self._loaded[repository]
+        self.holder(repository).unload()
+        return True
+
+    def refresh(self, repository: str) -> None:
+        """
+        Reload a shard whose index file was rewritten, if it is resident. An
+        unloaded shard reads the new file when it is next loaded.
+        """
+        if self.is_loaded(repository):
+            self.holder(repository).reload_in_background()
+
+    async def follow_generations(self, interval: float) -> None:
+        """
+        Swap in index generations published since they were loaded, e.g. by
+        another worker process's refresh, by polling each resident shard's
+        generation marker every interval seconds. Runs until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for name in list(self._loaded):
+                try:
+                    await self.holder(name).reload(force=False)
+                except Exception as e:
+                    logger.error(f"Reloading shard {name} failed: {e}")
+                if not self.is_loaded(name):
+                    # Unloaded while its new generation was being read.
+                    self.holder(name).unload()
+
+    def stores(self, repositories=None) -> list[tuple[str, VectorStore]]:
+        """
+        (name, store) of the resident shards among repositories, or of every
+        resident shard, marking them as recently searched.
+        """
+        with self._lock:
+            names = [name for name in self._loaded if repositories is None or name in repositories]
+            for name in names:
+                self._loaded.move_to_end(name)
+        stores = []
+        for name in names:
+            store = self.holder(name).get_store()
+            if store is not None:
+                stores.append((name, store))
+        return stores
+
+    def generation(self) -> tuple:
+        """
+        Version of the set of resident shards and of each one's index.
+        """
+        with self._lock:
+            names = sorted(self._loaded)
+        return tuple((name, self.holder(name).generation) for name in names)
+
+    def get_shard_info(self, repository: str) -> dict:
+        repository = self.resolve(repository)
+        store = self.holder(repository).get_store() if self.is_loaded(repository) else None
+        return {
+            "name": repository,
+            "root_path": self.repositories[repository],
+            "index_path": self.index_path(repository),
+            "loaded": self.is_loaded(repository),
+            "vectors": store.index.ntotal if store is not None else None
+        }
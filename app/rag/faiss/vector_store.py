@@ -1,6 +1,7 @@
 import faiss
 import numpy as np
 from app.config import RAGConfig
+from app.rag.faiss import index_files
 import os
 import logging
 
@@ -8,47 +9,346 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class VectorStore:
-    def __init__(self, dimension: int, M=32):
+    def __init__(self, dimension: int, index=None, index_type: str | None = None, expected_size: int | None = None,
+                 faiss_filepath: str | None = None):
+        config = RAGConfig()
         self.dimension = dimension
-        self.index = faiss.IndexHNSWFlat(dimension, M, faiss.METRIC_INNER_PRODUCT)
-        self.faiss_filepath = RAGConfig().faiss_filepath
+        self.ef_search = config.hnsw_ef_search
+        self.nprobe = config.ivf_nprobe
+        # Vectors are addressed by their chunk vector_id rather than by insertion order.
+        self.index = index if index is not None else self._new_index(index_type or config.faiss_index_type, expected_size)
+        inner = self._inner_index()
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efConstruction = config.hnsw_ef_construction
+        self.faiss_filepath = faiss_filepath or config.faiss_filepath
+        self.keep_generations = config.faiss_keep_generations
+        # The immutable generation file this index was read from, if any.
+        self.generation = None
+        self.generation_file = None
+        # IDs of deleted vectors still present in an HNSW graph, excluded from every search.
+        self.tombstones = set()
+        self._search_params = None
+
+    @classmethod
+    def from_file(cls, faiss_filepath: str, mmap: bool = False):
+        """
+        Read the current generation of an index synchronously and wrap it in a
+        VectorStore. With mmap, the index's vectors, codes and graph are mapped
+        read-only from the file and paged in lazily, so processes mapping the
+        same generation share its pages. A mapped store serves searches only.
+        """
+        current = index_files.current_generation(faiss_filepath)
+        if current is None:
+            raise FileNotFoundError(f"FAISS index file not found: {faiss_filepath}")
+        generation, path = current
+        index = None
+        if mmap:
+            # IO_FLAG_MMAP alone only maps on-disk inverted lists; MMAP_IFC maps the
+            # storage of every index type. Older FAISS builds only have the former.
+            for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+                flag = getattr(faiss, flag_name, None)
+                if flag is None:
+                    continue
+                try:
+                    index = faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+                    break
+                except RuntimeError as e:
+                    logger.warning(f"Could not read {path} with {flag_name}: {e}")
+            if index is None:
+                logger.warning(f"Could not memory-map {path}, reading it fully.")
+        if index is None:
+            index = faiss.read_index(path)
+        store = cls(dimension=index.d, index=index, faiss_filepath=faiss_filepath)
+        store.generation, store.generation_file = generation, path
+        store._load_tombstones()
+        return store
+
+    def _new_index(self, index_type: str, expected_size: int | None):
+        """
+        Build an empty index from the factory string configured for index_type.
+        Types that need training fall back to flat when the corpus is too small
+        to train them, and IVF list counts shrink to keep ~39 points per list.
+        """
+        config = RAGConfig()
+        if index_type not in config.faiss_index_factories:
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        ivf_nlist = config.ivf_nlist
+        if index_type == "ivf_pq" and expected_size is not None:
+            if expected_size < config.ivf_min_train_points:
+                logger.info(f"{expected_size} vectors are too few to train IVF-PQ, using a flat index.")
+                index_type = "flat"
+            else:
+                ivf_nlist = max(1, min(ivf_nlist, expected_size // 39))
+        factory = config.faiss_index_factories[index_type].format(
+            hnsw_m=config.hnsw_m, ivf_nlist=ivf_nlist, pq_m=config.pq_m
+        )
+        logger.info(f"Creating FAISS index '{factory}' ({index_type}).")
+        return faiss.index_factory(self.dimension, factory, faiss.METRIC_INNER_PRODUCT)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.index.is_trained
+
+    def train_sync(self, vectors: np.ndarray):
+        """
+        Train codebooks (IVF centroids, PQ/SQ quantizers) on a sample of vectors.
+        """
+        vectors = self._normalize(vectors)
+        logger.info(f"Training FAISS index on {vectors.shape[0]} vectors.")
+        self.index.train(vectors)
+
+    @property
+    def tombstones_filepath(self) -> str:
+        return (self.generation_file or self.faiss_filepath) + index_files.TOMBSTONES_SUFFIX
+
+    def _load_tombstones(self):
+        if os.path.exists(self.tombstones_filepath):
+            self.tombstones = set(np.load(self.tombstones_filepath).tolist())
+        else:
+            self.tombstones = set()
+        self._search_params = None
+
+    def _save_tombstones(self, path: str):
+        # A file object, so np.save doesn't append its own .npy suffix.
+        with open(path, "wb") as file:
+            np.save(file, np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones)))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _inner_index(self):
+        if isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            return faiss.downcast_index(self.index.index)
+        return self.index
+
+    @property
+    def supports_removal(self) -> bool:
+        """
+        Flat and IVF indexes can drop vectors; HNSW graphs need tombstones.
+        """
+        return self.is_id_mapped and not isinstance(self._inner_index(), faiss.IndexHNSW)
+
+    @property
+    def dead_ratio(self) -> float:
+        """
+        Fraction of vectors in the index that are tombstoned.
+        """
+        if self.index.ntotal == 0:
+            return 0.0
+        return len(self.tombstones) / self.index.ntotal
+
+    def _make_search_params(self, selector=None):
+        """
+        Per-query knobs for the index type: efSearch for HNSW, nprobe for IVF.
+        """
+        inner = self._inner_index()
+        if isinstance(inner, faiss.IndexHNSW):
+            # HNSW only accepts its own parameter type.
+            params = faiss.SearchParametersHNSW(efSearch=self.ef_search)
+        elif isinstance(inner, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(nprobe=self.nprobe)
+        else:
+            params = faiss.SearchParameters()
+        if selector is not None:
+            params.sel = selector
+        return params
+
+    def _get_search_params(self):
+        """
+        Build search parameters whose ID selector skips tombstoned vectors during
+        graph traversal, so a search still returns k live results. Cached until
+        the tombstone set changes.
+        """
+        if self._search_params is None:
+            if self.tombstones:
+                dead_ids = np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones))
+                batch_selector = faiss.IDSelectorBatch(dead_ids.size, faiss.swig_ptr(dead_ids))
+                selector = faiss.IDSelectorNot(batch_selector)
+                # The selectors are referenced from C++ only; keep them alive with the params.
+                self._search_params = (self._make_search_params(selector), selector, batch_selector, dead_ids)
+            else:
+                self._search_params = (self._make_search_params(),)
+        return self._search_params[0]
         
+    def _make_filtered_search_params(self, allowed_ids: np.ndarray):
+        """
+        Build search parameters restricted to allowed_ids, minus tombstones.
+        Vector ids are handed out by a counter, so they are dense and a bitmap
+        over [0, max id] is both the smallest selector and the fastest to test
+        during HNSW traversal or IVF list scans. Returns None if no id survives.
+        """
+        allowed_ids = np.asarray(allowed_ids, dtype=np.int64)
+        if self.tombstones and allowed_ids.size:
+            dead_ids = np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones))
+            allowed_ids = allowed_ids[~np.isin(allowed_ids, dead_ids)]
+        allowed_ids = allowed_ids[allowed_ids >= 0]
+        if allowed_ids.size == 0:
+            return None
+        mask = np.zeros(int(allowed_ids.max()) + 1, dtype=bool)
+        mask[allowed_ids] = True
+        # Bit i % 8 of byte i // 8 marks id i, as IDSelectorBitmap expects.
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(bitmap.size, faiss.swig_ptr(bitmap))
+        # The selector only points at the bitmap; keep both alive with the params.
+        return (self._make_search_params(selector), selector, bitmap)
+
     def _normalize(self, vectors: np.ndarray) -> np.ndarray:
         norms = np.linalg.norm(vectors, axis=1, keepdims=True)
         return vectors / np.clip(norms, 1e-10, None)
     
+    @property
+    def is_id_mapped(self) -> bool:
+        """
+        True if vectors are stored under external IDs: an ID map, or IVF, which keeps IDs natively.
+        """
+        return isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexIVF))
+
+    def stored_ids(self) -> np.ndarray:
+        """
+        IDs of every vector in an ID-addressed index, tombstoned ones included.
+        """
+        if isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            return faiss.vector_to_array(self.index.id_map)
+        invlists = self.index.invlists
+        ids = [np.array([], dtype=np.int64)]
+        for list_no in range(invlists.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                list_ids = invlists.get_ids(list_no)
+                ids.append(faiss.rev_swig_ptr(list_ids, size).copy())
+                invlists.release_ids(list_no, list_ids)
+        return np.concatenate(ids)
+
+    def missing_ids(self, ids) -> list[int]:
+        """
+        The IDs among ids without a live vector in the index.
+        """
+        ids = np.fromiter((int(vector_id) for vector_id in ids), dtype=np.int64)
+        if ids.size == 0:
+            return []
+        missing = ids[~np.isin(ids, self.stored_ids())].tolist()
+        return missing + [vector_id for vector_id in ids.tolist() if vector_id in self.tombstones]
+
     async def clear_index(self):
         self.index.reset()
+        self.tombstones = set()
+        self._search_params = None
         logger.info("Cleared FAISS index.")
 
     async def load_index(self):
-        if os.path.exists(self.faiss_filepath):
-            self.index = faiss.read_index(self.faiss_filepath)
-            logger.info(f"Loaded FAISS index from {self.faiss_filepath}.")
+        current = index_files.current_generation(self.faiss_filepath)
+        if current is not None:
+            self.generation, self.generation_file = current
+            self.index = faiss.read_index(self.generation_file)
+            self._load_tombstones()
+            logger.info(f"Loaded FAISS index from {self.generation_file}.")
         else:
             logger.warning(f"FAISS index file not found: {self.faiss_filepath}")
 
-    async def add_vectors(self, vectors: np.ndarray):
+    async def add_vectors(self, vectors: np.ndarray, ids: np.ndarray | None = None):
+        self.add_vectors_sync(vectors, ids)
+
+    def add_vectors_sync(self, vectors: np.ndarray, ids: np.ndarray | None = None):
+        """
+        Synchronous implementation of add_vectors, for callers running it in a worker thread.
+        """
         if vectors.ndim == 1:
             vectors = vectors.reshape(1, -1)
         vectors = self._normalize(vectors)
         logger.info(f"Adding {vectors.shape[0]} vectors to FAISS index.")
-        self.index.add(vectors)
-        
+        if not self.index.is_trained:
+            raise RuntimeError("FAISS index must be trained before vectors are added.")
+        if ids is not None:
+            self.index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+        else:
+            self.index.add(vectors)
+
+    async def remove_vectors(self, ids: list[int]) -> int:
+        """
+        Remove vectors by ID. Flat and IVF indexes drop them right away. HNSW
+        graphs can't drop nodes, so there deleted vectors are tombstoned: they
+        stay in the graph but are filtered inside every search until compaction.
+        Returns the number of removed or newly tombstoned IDs.
+        """
+        if not ids:
+            return 0
+        if self.supports_removal:
+            removed = self.index.remove_ids(np.asarray(list(ids), dtype=np.int64))
+            logger.info(f"Removed {removed} vectors from FAISS index.")
+            return removed
+        new_ids = set(int(vector_id) for vector_id in ids) - self.tombstones
+        if new_ids:
+            self.tombstones |= new_ids
+            self._search_params = None
+            logger.info(f"Tombstoned {len(new_ids)} vectors, dead ratio is now {self.dead_ratio:.2%}.")
+        return len(new_ids)
+
+    def compact(self) -> int:
+        """
+        Rebuild the graph from the live vectors only and clear the tombstones.
+        The index is cloned and reset, so its type, trained quantizer and HNSW
+        settings carry over. Returns the number of vectors dropped. Runs
+        synchronously; call it off the event loop.
+        """
+        if not self.tombstones:
+            return 0
+        if not isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            logger.warning("Cannot compact a FAISS index that is not ID-mapped, rebuild it instead.")
+            return 0
+        inner = self._inner_index()
+        ids = faiss.vector_to_array(self.index.id_map)
+        vectors = inner.reconstruct_n(0, self.index.ntotal)
+        live = ~np.isin(ids, np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones)))
+        new_inner = faiss.clone_index(inner)
+        new_inner.reset()
+        new_index = faiss.IndexIDMap2(new_inner)
+        if live.any():
+            new_index.add_with_ids(vectors[live], ids[live])
+        dropped = int(ids.size - live.sum())
+        self.index = new_index
+        self.tombstones = set()
+        self._search_params = None
+        logger.info(f"Compacted FAISS index: dropped {dropped} dead vectors, {self.index.ntotal} remain.")
+        return dropped
 
     async def search(self, query_vector: np.ndarray, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
-        await self.load_index()
+        return self.search_sync(query_vector, k)
+
+    def search_sync(self, query_vector: np.ndarray, k: int = 5, allowed_ids: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Synchronous implementation of search, for callers running it on an executor thread.
+        With allowed_ids, only those vectors are considered, inside the index traversal.
+        """
         if query_vector.ndim == 1:
             query_vector = query_vector.reshape(1, -1)
         query_vector = self._normalize(query_vector)
-        distances, indices = self.index.search(query_vector, k)
-        return distances, indices
+        if allowed_ids is None:
+            return self.index.search(query_vector, k, params=self._get_search_params())
+        filtered_params = self._make_filtered_search_params(allowed_ids)
+        if filtered_params is None:
+            return (np.zeros((query_vector.shape[0], k), dtype=np.float32),
+                    np.full((query_vector.shape[0], k), -1, dtype=np.int64))
+        return self.index.search(query_vector, k, params=filtered_params[0])
     
     async def save_index(self):
+        """
+        Write the index as a new immutable generation: the tombstones and a
+        temporary index file are written and synced, the index is renamed into
+        place, and only then is the generation marker switched to it. Readers
+        never see a partly written file, and old generations stay readable
+        until pruned.
+        """
         # if os.path.exists(self.faiss_filepath):
         #     os.remove(self.faiss_filepath)
-        faiss.write_index(self.index, self.faiss_filepath)
-        logger.info(f"Saved FAISS index to {self.faiss_filepath}.")
+        generation, path = index_files.reserve_generation(self.faiss_filepath)
+        temporary = path + ".tmp"
+        self._save_tombstones(path + index_files.TOMBSTONES_SUFFIX)
+        faiss.write_index(self.index, temporary)
+        index_files.fsync_file(temporary)
+        os.replace(temporary, path)
+        self.generation, self.generation_file = generation, path
+        if index_files.publish_generation(self.faiss_filepath, generation):
+            index_files.prune_generations(self.faiss_filepath, self.keep_generations)
+        logger.info(f"Saved FAISS index to {path} (generation {generation}).")
         # if os.path.exists(self.faiss_filepath):
         # # Load existing index
         #     existing_index = faiss.read_index(self.faiss_filepath)
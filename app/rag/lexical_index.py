@@ -0,0 +1,387 @@
+from app.beans.chunks import Chunks
+from app.beans.search_filter import SearchFilter
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.config import RAGConfig
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import asyncio
+import logging
+import math
+import re
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Splits snake_case, camelCase and HTTPServer-style acronyms into words.
+_SUBWORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+# A single dotted name, e.g. "get_last_vector_id", "CronTrigger", "faiss.IndexIDMap2".
+_SYMBOL_QUERY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+# Chunk writes are applied here, off the event loop, one at a time and in order.
+_UPDATE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexical-index")
+
+def split_identifier(identifier: str) -> list[str]:
+    """
+    Lowercased words of an identifier: "getLastVectorId" -> ["get", "last", "vector", "id"].
+    """
+    return [word.lower() for word in _SUBWORD_PATTERN.findall(identifier)]
+
+def tokenize_code(text: str) -> list[str]:
+    """
+    Tokens for BM25: every identifier in full, plus its words when it has several.
+    """
+    tokens = []
+    for identifier in _IDENTIFIER_PATTERN.findall(text or ""):
+        tokens.append(identifier.lower())
+        words = split_identifier(identifier)
+        if len(words) > 1:
+            tokens.extend(words)
+    return tokens
+
+def is_symbol_query(query: str) -> bool:
+    """
+    True if the query is clearly an identifier rather than prose: a single
+    name that is dotted, snake_case, or has an inner capital.
+    """
+    query = query.strip()
+    if not _SYMBOL_QUERY_PATTERN.match(query):
+        return False
+    return "." in query or "_" in query.strip("_") or any(c.isupper() for c in query[1:])
+
+class _TrieNode:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+
+class SymbolTrie:
+    """
+    Prefix trie over lowercased symbol names.
+    """
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def insert(self, symbol: str) -> None:
+        node = self.root
+        for char in symbol:
+            node = node.children.setdefault(char, _TrieNode())
+        node.terminal = True
+
+    def remove(self, symbol: str) -> None:
+        path = [self.root]
+        for char in symbol:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].terminal = False
+        # Prune branches that no longer lead to any symbol.
+        for depth in range(len(symbol), 0, -1):
+            node = path[depth]
+            if node.terminal or node.children:
+                break
+            del path[depth - 1].children[symbol[depth - 1]]
+
+    def with_prefix(self, prefix: str, limit: int):
+        """
+        Yield up to limit symbols starting with prefix, shortest first.
+        """
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return
+        level = [(prefix, node)]
+        found = 0
+        while level and found < limit:
+            next_level = []
+            for symbol, node in level:
+                if node.terminal:
+                    yield symbol
+                    found += 1
+                    if found == limit:
+                        return
+                next_level.extend((symbol + char, child) for char, child in node.children.items())
+            level = next_level
+
+class LexicalIndex:
+    """
+    In-process inverted index over chunk names, the identifiers tree-sitter
+    found in each chunk, and the tokenized chunk content. Documents are chunk
+    bodies keyed by vector_id, indexed once however many places they occur in;
+    the occurrences are tracked only for filtering.
+
+    Symbol lookups go through exact-name maps and a prefix trie; free-text
+    lookups are scored with BM25. The index follows TreeSitterChunksDAO writes
+    on a worker thread, in write order, so it is current shortly after a parse
+    has flushed its chunks; version counts the writes applied. Writes made by
+    other worker processes arrive through the DAO's change log. It is built
+    from the chunk store once at startup.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+                    TreeSitterChunksDAO.listeners.append(cls._instance)
+        return cls._instance
+
+    def __init__(self):
+        config = RAGConfig()
+        self.k1 = config.bm25_k1
+        self.b = config.bm25_b
+        self.ready = False
+        self.version = 0
+        self._lock = threading.Lock()
+        self._build_task = None
+        self._clear()
+
+    def _clear(self):
+        self.postings = {}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        # vector_id -> {occurrence key: (file_path, type, repository)}
+        self.doc_occurrences = {}
+        self.doc_symbols = {}
+        self.total_length = 0
+        # Lowercased symbol -> vector ids, split by whether it names the chunk or only occurs in it.
+        self.name_docs = {}
+        self.identifier_docs = {}
+        self.trie = SymbolTrie()
+
+    async def build(self, dao: TreeSitterChunksDAO, batch_size: int = 1000) -> None:
+        """
+        Index every stored chunk. Writes that land meanwhile are applied as usual.
+        """
+        count = 0
+        async for chunks in dao.get_chunks_by_batch(batch_size):
+            await asyncio.get_running_loop().run_in_executor(_UPDATE_EXECUTOR, self.add_chunks, chunks)
+            count += len(chunks)
+        self.ready = True
+        logger.info(f"Built lexical index over {count} chunks, {len(self.postings)} terms, {len(self.name_docs) + len(self.identifier_docs)} symbols.")
+
+    def build_in_background(self, dao: TreeSitterChunksDAO) -> asyncio.Task:
+        """
+        Schedule build on the running loop; searches use vectors alone until it is ready.
+        """
+        # Keep a reference so the task is not garbage collected mid-flight.
+        self._build_task = asyncio.create_task(self.build(dao))
+        self._build_task.add_done_callback(self._log_build_failure)
+        return self._build_task
+
+    @staticmethod
+    def _log_build_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Building the lexical index failed: {task.exception()}")
+
+    @staticmethod
+    def _occurrence_key(chunk: Chunks):
+        return chunk.occurrence_id or (chunk.file_path, tuple(chunk.start_point or ()))
+
+    def add_chunks(self, chunks: list[Chunks]) -> None:
+        """
+        Index chunk occurrences. A body already indexed only gains the occurrence,
+        so adding the same occurrence twice is harmless. New bodies are tokenized
+        before the lock is taken, so searches are not held up meanwhile.
+        """
+        terms_by_id = {}
+        for chunk in chunks:
+            if chunk.vector_id is None:
+                continue
+            vector_id = int(chunk.vector_id)
+            if vector_id not in self.doc_lengths and vector_id not in terms_by_id:
+                terms_by_id[vector_id] = Counter(tokenize_code(chunk.content))
+        with self._lock:
+            for chunk in chunks:
+                if chunk.vector_id is None:
+                    continue
+                vector_id = int(chunk.vector_id)
+                if vector_id not in self.doc_lengths:
+                    terms = terms_by_id.get(vector_id)
+                    self._add(vector_id, chunk, terms if terms is not None else Counter(tokenize_code(chunk.content)))
+                    self.doc_occurrences[vector_id] = {}
+                self.doc_occurrences[vector_id][self._occurrence_key(chunk)] = (chunk.file_path, chunk.type, chunk.repository)
+            self.version += 1
+
+    def _add(self, vector_id: int, chunk: Chunks, terms: Counter):
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[vector_id] = tf
+        length = sum(terms.values())
+        self.doc_terms[vector_id] = tuple(terms)
+        self.doc_lengths[vector_id] = length
+        self.total_length += length
+        # Chunks stored before identifiers were recorded fall back to a regex scan.
+        identifiers = chunk.identifiers if chunk.identifiers is not None else _IDENTIFIER_PATTERN.findall(chunk.content or "")
+        symbols = []
+        if chunk.name:
+            symbols.append((self.name_docs, chunk.name.lower()))
+        symbols.extend((self.identifier_docs, identifier.lower()) for identifier in set(identifiers))
+        for docs, symbol in symbols:
+            if symbol not in self.name_docs and symbol not in self.identifier_docs:
+                self.trie.insert(symbol)
+            docs.setdefault(symbol, set()).add(vector_id)
+        self.doc_symbols[vector_id] = tuple(symbols)
+
+    def remove_vector_ids(self, vector_ids: list[int]) -> None:
+        with self._lock:
+            for vector_id in vector_ids:
+                if int(vector_id) in self.doc_lengths:
+                    self._remove(int(vector_id))
+            self.version += 1
+
+    def remove_chunks(self, chunks: list[Chunks]) -> None:
+        """
+        Drop chunk occurrences, and the body once its last occurrence is gone.
+        """
+        with self._lock:
+            for chunk in chunks:
+                if chunk.vector_id is None:
+                    continue
+                vector_id = int(chunk.vector_id)
+                occurrences = self.doc_occurrences.get(vector_id)
+                if occurrences is None:
+                    continue
+                occurrences.pop(self._occurrence_key(chunk), None)
+                if not occurrences:
+                    self._remove(vector_id)
+            self.version += 1
+
+    def _remove(self, vector_id: int):
+        for term in self.doc_terms.pop(vector_id):
+            postings = self.postings[term]
+            del postings[vector_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(vector_id)
+        self.doc_occurrences.pop(vector_id, None)
+        for docs, symbol in self.doc_symbols.pop(vector_id):
+            holders = docs.get(symbol)
+            if holders is None:
+                continue
+            holders.discard(vector_id)
+            if not holders:
+                del docs[symbol]
+                if symbol not in self.name_docs and symbol not in self.identifier_docs:
+                    self.trie.remove(symbol)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+            self.version += 1
+
+    @staticmethod
+    def _apply(update, *args) -> None:
+        # Queue a write behind the ones before it; the DAO calls listeners on the event loop.
+        future = _UPDATE_EXECUTOR.submit(update, *args)
+        future.add_done_callback(LexicalIndex._log_update_failure)
+
+    @staticmethod
+    def _log_update_failure(future) -> None:
+        if future.exception() is not None:
+            logger.error(f"Updating the lexical index failed: {future.exception()}")
+
+    # TreeSitterChunksDAO listener interface.
+    def chunks_added(self, chunks: list[Chunks]) -> None:
+        self._apply(self.add_chunks, chunks)
+
+    def chunks_removed(self, chunks: list[Chunks]) -> None:
+        self._apply(self.remove_chunks, chunks)
+
+    def chunks_cleared(self) -> None:
+        self._apply(self.clear)
+
+    def chunks_reset(self, dao: TreeSitterChunksDAO) -> None:
+        # Writes were missed: start over from the chunk store.
+        if self._build_task is not None:
+            self._build_task.cancel()
+        self.ready = False
+        self._apply(self.clear)
+        self.build_in_background(dao)
+
+    def _allowed(self, vector_id: int, search_filter: SearchFilter | None) -> bool:
+        if search_filter is None or search_filter.is_empty():
+            return True
+        return any(
+            search_filter.matches_attributes(file_path, chunk_type, repository)
+            for file_path, chunk_type, repository in self.doc_occurrences[vector_id].values()
+        )
+
+    def search_bm25(self, query: str, k: int, search_filter: SearchFilter | None = None) -> list[tuple[int, float]]:
+        """
+        Top k (vector_id, score) pairs by BM25 over the query's code tokens.
+        """
+        with self._lock:
+            doc_count = len(self.doc_lengths)
+            if doc_count == 0:
+                return []
+            average_length = self.total_length / doc_count or 1.0
+            scores = {}
+            for term in set(tokenize_code(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for vector_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[vector_id] / average_length)
+                    scores[vector_id] = scores.get(vector_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            return [(vector_id, score) for vector_id, score in ranked if self._allowed(vector_id, search_filter)][:k]
+
+    def lookup_symbol(self, query: str, k: int, search_filter: SearchFilter | None = None) -> list[tuple[int, float]]:
+        """
+        Top k (vector_id, score) pairs for an identifier query. Chunks named by
+        the symbol come first, then chunks using it, then prefix matches, with
+        BM25 over the symbol's words to fill up. Scores only order the results.
+        """
+        symbol = query.strip().lower()
+        # "module.function" is looked up by its last part.
+        symbol = symbol.rsplit(".", 1)[-1]
+        tiers = []
+        with self._lock:
+            tiers.append(self.name_docs.get(symbol, ()))
+            tiers.append(self.identifier_docs.get(symbol, ()))
+            prefixed = [found for found in self.trie.with_prefix(symbol, k * 4) if found != symbol]
+            tiers.append([vector_id for found in prefixed for vector_id in self.name_docs.get(found, ())])
+            tiers.append([vector_id for found in prefixed for vector_id in self.identifier_docs.get(found, ())])
+            results = []
+            seen = set()
+            for tier_rank, tier in enumerate(tiers):
+                # Within a tier, shorter chunks are the more specific match.
+                for vector_id in sorted(tier, key=lambda vector_id: self.doc_lengths[vector_id]):
+                    if vector_id in seen or not self._allowed(vector_id, search_filter):
+                        continue
+                    seen.add(vector_id)
+                    results.append((vector_id, float(len(tiers) - tier_rank)))
+                    if len(results) == k:
+                        return results
+        for vector_id, score in self.search_bm25(query, k, search_filter):
+            if vector_id not in seen:
+                seen.add(vector_id)
+                results.append((vector_id, score / (1 + score)))
+                if len(results) == k:
+                    break
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "documents": len(self.doc_lengths),
+            "terms": len(self.postings),
+            "symbols": len(set(self.name_docs) | set(self.identifier_docs))
+        }
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int, rrf_k: int = 60) -> list[tuple[int, float]]:
+    """
+    Fuse ranked id lists: each id scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, vector_id in enumerate(ranking, start=1):
+            scores[vector_id] = scores.get(vector_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from app.config import RAGConfig
+import threading
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live and hit/miss counters.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl_seconds is None or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+class QueryCache:
+    """
+    Process-wide caches for the search path: query embeddings, and search
+    results keyed by (query, k, filters). Results are tagged with the FAISS
+    index generation and the chunk store generation; when either moves on,
+    the result cache is dropped, since any cached hit list may be stale.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        config = RAGConfig()
+        self.embeddings = LRUCache(config.query_embedding_cache_size, config.query_cache_ttl_seconds)
+        self.results = LRUCache(config.query_result_cache_size, config.query_cache_ttl_seconds)
+        self._results_generation = None
+        self._generation_lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.split())
+
+    @staticmethod
+    def _freeze(value):
+        """
+        Turn filter dicts and lists into hashable, order-independent tuples.
+        """
+        if isinstance(value, dict):
+            return tuple(sorted((key, QueryCache._freeze(item)) for key, item in value.items() if item is not None))
+        if isinstance(value, (list, tuple, set)):
+            return tuple(sorted(QueryCache._freeze(item) for item in value))
+        return value
+
+    def result_key(self, query: str, k: int, filters: dict | None = None) -> tuple:
+        return (self.normalize_query(query), k, self._freeze(filters or {}))
+
+    def _check_generation(self, generation: tuple) -> None:
+        with self._generation_lock:
+            if generation != self._results_generation:
+                if self._results_generation is not None:
+                    logger.info(f"Index or chunk store changed ({self._results_generation} -> {generation}), clearing search result cache.")
+                self.results.clear()
+                self._results_generation = generation
+
+    def get_results(self, key: tuple, generation: tuple):
+        self._check_generation(generation)
+        return self.results.get(key)
+
+    def put_results(self, key: tuple, generation: tuple, results) -> None:
+        # Results computed against a generation that has since moved on are not kept.
+        with self._generation_lock:
+            if generation != self._results_generation:
+                return
+        self.results.put(key, results)
+
+    def stats(self) -> dict:
+        return {
+            "query_embeddings": self.embeddings.stats(),
+            "search_results": self.results.stats(),
+            "generation": self._results_generation
+        }
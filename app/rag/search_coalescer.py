@@ -0,0 +1,97 @@
+from app.config import RAGConfig
+from app.rag.vector_embedding import VectorEmbedding
+import asyncio
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SearchCoalescer:
+    """
+    Coalesces concurrent searches into micro-batches.
+
+    Requests are held until search_batch_window_ms has passed since the first
+    one arrived, or search_max_batch_size are waiting, and are then run as one
+    VectorEmbedding.search_batch call: one encode and one FAISS search on the
+    search executor thread. Each waiting request gets its own slice of the
+    result back. Requests are validated before they are queued, and if a batch
+    still fails its requests are retried one by one, so one bad request never
+    fails the others.
+    """
+    def __init__(self, vector_embedding: VectorEmbedding, window_ms: float | None = None, max_batch_size: int | None = None):
+        config = RAGConfig()
+        self.window_seconds = (window_ms if window_ms is not None else config.search_batch_window_ms) / 1000
+        self.max_batch_size = max_batch_size or config.search_max_batch_size
+        self.vector_embedding = vector_embedding
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def search(self, query: str, k: int = 5, filters: dict | None = None) -> list:
+        """
+        Queue one search and wait for the batch it lands in. Returns (chunk, score, distance) triples.
+        """
+        request = {"query": query, "k": k, "filters": filters}
+        # Raises ValueError to this caller alone.
+        self.vector_embedding.parse_search_request(request)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list):
+        # Requests whose caller has gone away (e.g. client disconnect) are dropped.
+        batch = [(request, future) for request, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            results = await self.vector_embedding.search_batch([request for request, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0][1], e)
+                return
+            logger.error(f"Batched search of {len(batch)} queries failed, searching them one by one: {e}")
+            for request, future in batch:
+                if future.done():
+                    continue
+                try:
+                    result = (await self.vector_embedding.search_batch([request]))[0]
+                except Exception as request_error:
+                    self._fail(future, request_error)
+                    continue
+                if not future.done():
+                    future.set_result(result)
+            return
+        logger.info(f"Served {len(batch)} coalesced searches in one batch.")
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(future: asyncio.Future, error: Exception):
+        logger.error(f"Search failed: {error}")
+        if not future.done():
+            future.set_exception(error)
+
+    async def close(self):
+        """
+        Run any waiting requests and let in-flight batches finish, for shutdown.
+        """
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
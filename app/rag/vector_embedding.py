@@ -2,80 +2,505 @@ import numpy as np
 from app.config import RAGConfig
 from app.beans.embedding_model import EmbeddingModelSingleton
 from app.rag.faiss.vector_store import VectorStore
+from app.rag.faiss.shard_manager import ShardManager
+from app.rag.faiss import index_files
+from app.rag.embedding_batcher import TokenBudgetBatcher
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.query_cache import QueryCache
+from app.rag.chunk_attributes import ChunkAttributeIndex
+from app.rag.lexical_index import LexicalIndex, is_symbol_query, reciprocal_rank_fusion
+from app.beans.chunks import Chunks
+from app.beans.search_filter import SearchFilter
 from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO
+from app.db.index_shards_DAO import IndexShardsDAO
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
 import logging
-import os
+import heapq
+import copy
+import time
 logging.basicConfig(level=logging.INFO)
+
+_END_OF_STREAM = None
+# Query encoding and FAISS searches run here, off the event loop.
+_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=RAGConfig().search_executor_threads, thread_name_prefix="search")
+# A search over several shards runs one FAISS search per shard here, in parallel.
+_SHARD_EXECUTOR = ThreadPoolExecutor(max_workers=RAGConfig().shard_search_threads, thread_name_prefix="shard-search")
+
+def merge_shard_hits(shard_hits: list[tuple[np.ndarray, np.ndarray]], k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Merge one query's (distances, indices) from several shards, each best first,
+    into the overall top k. A body indexed in several shards is kept once.
+    """
+    rankings = [
+        [(-float(distance), int(vector_id)) for distance, vector_id in zip(distances, indices) if vector_id != -1]
+        for distances, indices in shard_hits
+    ]
+    distances, indices, seen = [], [], set()
+    for negated_distance, vector_id in heapq.merge(*rankings):
+        if vector_id in seen:
+            continue
+        seen.add(vector_id)
+        distances.append(-negated_distance)
+        indices.append(vector_id)
+        if len(indices) == k:
+            break
+    return np.array(distances, dtype=np.float32), np.array(indices, dtype=np.int64)
+
 class VectorEmbedding:
-    def __init__(self):
-        self.model_name = RAGConfig().embedding_model
+    def __init__(self, tree_sitter_dao: TreeSitterChunksDAO | None = None):
+        config = RAGConfig()
+        self.model_name = config.embedding_model
         self.model = EmbeddingModelSingleton.get_model(self.model_name)
+        self.batcher = TokenBudgetBatcher(
+            self.model,
+            max_tokens_per_batch=config.embedding_max_tokens_per_batch,
+            max_batch_size=config.embedding_max_batch_size
+        )
+        self.embedding_cache = EmbeddingCache.get_instance(
+            config.embedding_cache_dir,
+            self.model_name,
+            self.model.get_sentence_embedding_dimension(),
+            config.embedding_cache_max_entries
+        )
         self.faiss_index = None
-        self.tree_sitter_dao = TreeSitterChunksDAO()
+        self.progress = {}
+        self.tree_sitter_dao = tree_sitter_dao or TreeSitterChunksDAO()
+        self.shards = ShardManager.get_instance()
+        self.index_shards_dao = IndexShardsDAO()
+        self.query_cache = QueryCache.get_instance()
+        self.chunk_attributes = ChunkAttributeIndex.get_instance()
+        self.lexical_index = LexicalIndex.get_instance()
 
-    async def load_faiss_index(self, dimension):
-        index_path = RAGConfig().faiss_filepath
-        if os.path.exists(index_path):
-            self.faiss_index = VectorStore(dimension=dimension)
+    async def load_faiss_index(self, dimension, repository: str | None = None):
+        index_path = self.shards.index_path(self.shards.resolve(repository))
+        self.faiss_index = VectorStore(dimension=dimension, faiss_filepath=index_path)
+        if index_files.current_generation(index_path) is not None:
             await self.faiss_index.load_index()
-        else:
-            self.faiss_index = VectorStore(dimension=dimension)
+
+    async def _index_saved(self, repository: str) -> None:
+        # Record the shard's new size and swap the rewritten file in if the shard is resident.
+        await self.index_shards_dao.record_build(repository, self.faiss_index.index.ntotal)
+        self.shards.refresh(repository)
     
     async def embed_text(self, text: str) -> list[float]:
-        return self.model.encode([text], convert_to_numpy=True)
+        return await self.embed_texts([text])
+
+    async def embed_texts(self, texts: list[str]) -> np.ndarray:
+        return await asyncio.get_running_loop().run_in_executor(_SEARCH_EXECUTOR, self.encode_queries, texts)
+
+    def encode_queries(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed several queries, encoding all the ones not in the query cache with one model.encode call.
+        Runs synchronously; call it on the search executor.
+        """
+        keys = [(self.model_name, QueryCache.normalize_query(text)) for text in texts]
+        embeddings = [self.query_cache.embeddings.get(key) for key in keys]
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            encoded = self.model.encode([texts[positions[0]] for positions in missing.values()], convert_to_numpy=True)
+            for (key, positions), embedding in zip(missing.items(), encoded):
+                embedding = embedding.reshape(1, -1)
+                embedding.setflags(write=False)
+                self.query_cache.embeddings.put(key, embedding)
+                for i in positions:
+                    embeddings[i] = embedding
+        return np.vstack(embeddings)
+
+    def search_generation(self) -> tuple:
+        """
+        Version of everything a search result depends on: the loaded shards, the
+        chunk store, and the lexical index, which applies chunk writes shortly after them.
+        """
+        return (self.shards.generation(), TreeSitterChunksDAO.generation, self.lexical_index.ready, self.lexical_index.version)
 
-    async def clear_faiss_index(self):
-        index_path = RAGConfig().faiss_filepath
-        if os.path.exists(index_path):
-            os.remove(index_path)
+    def encode_chunks(self, chunks: list) -> np.ndarray:
+        """
+        Embed chunks, reusing cached embeddings for content seen before and
+        encoding only the misses. Runs synchronously; call it off the event loop.
+        """
+        content_hashes = [
+            chunk.hash if isinstance(chunk.hash, str) else Chunks.compute_hash(chunk.content)
+            for chunk in chunks
+        ]
+        embeddings, missing = self.embedding_cache.get_many(content_hashes)
+        if missing:
+            encoded = self.batcher.encode([chunks[i].content for i in missing])
+            embeddings[missing] = encoded
+            self.embedding_cache.put_many([content_hashes[i] for i in missing], encoded)
+        return embeddings
 
-    async def add_embedding_to_faiss(self, text: str):
+    async def clear_faiss_index(self, repository: str | None = None):
+        index_path = self.shards.index_path(self.shards.resolve(repository))
+        index_files.remove_index_files(index_path)
+        self.shards.holder(repository).unload()
+
+    async def add_embedding_to_faiss(self, text: str, vector_id: int, repository: str | None = None):
         logging.info(f"Adding embedding for text: {text[:30]}...")
+        repository = self.shards.resolve(repository)
         embeddings = await self.embed_text(text)
-        await self.load_faiss_index(embeddings.shape[1])
+        await self.load_faiss_index(embeddings.shape[1], repository)
         if self.faiss_index is not None:
-            await self.faiss_index.add_vectors(embeddings)
+            await self.faiss_index.add_vectors(embeddings, ids=[vector_id])
         await self.faiss_index.save_index()
-        
+        await self._index_saved(repository)
     
-    async def create_vector_store(self):
-        # Load or create index ONCE
-        self.faiss_index = VectorStore(dimension=384)
-        all_chunks = []
-        async for chunk_batch in self.tree_sitter_dao.get_chunks_by_batch(batch_size=100):
-            for chunk in chunk_batch:
-                logging.info(f"debug chunk: {chunk.vector_id}: {chunk.name}...")
-                if chunk.content:
-                    all_chunks.append(chunk.content)
-        if all_chunks:
-            embeddings = self.model.encode(all_chunks, convert_to_numpy=True)
-            await self.faiss_index.add_vectors(embeddings)
+    async def create_vector_store(self, job=None, repository: str | None = None):
+        """
+        Rebuild one repository's shard from its stored chunks with a three-stage
+        pipeline: Mongo read-ahead, encoding in a worker thread, and index adds,
+        joined by bounded queues. Memory stays at a few batches whatever the
+        corpus size, and reading, encoding and adding overlap. Progress is
+        reported to job, a JobManager Job, when given.
+        """
+        config = RAGConfig()
+        repository = self.shards.resolve(repository)
+        # One vector per distinct body in the repository; duplicate chunks share it.
+        total = await self.tree_sitter_dao.count_bodies(repository)
+        self.faiss_index = VectorStore(
+            dimension=self.model.get_sentence_embedding_dimension(),
+            expected_size=total,
+            faiss_filepath=self.shards.index_path(repository)
+        )
+        read_queue = asyncio.Queue(maxsize=config.embedding_queue_depth)
+        add_queue = asyncio.Queue(maxsize=config.embedding_queue_depth)
+        self.progress = {"total": total, "read": 0, "embedded": 0, "chunks_per_second": 0.0}
+        if job is not None:
+            job.start_stage("embed", total=total)
+        start_time = time.perf_counter()
+
+        async def read_stage():
+            async for chunk_batch in self.tree_sitter_dao.get_bodies_by_batch(batch_size=config.embedding_batch_size, repository=repository):
+                self.progress["read"] += len(chunk_batch)
+                chunk_batch = [chunk for chunk in chunk_batch if chunk.content and chunk.vector_id is not None]
+                if chunk_batch:
+                    await read_queue.put(chunk_batch)
+            await read_queue.put(_END_OF_STREAM)
+
+        async def encode_stage():
+            while (chunk_batch := await read_queue.get()) is not _END_OF_STREAM:
+                embeddings = await asyncio.to_thread(self.encode_chunks, chunk_batch)
+                await add_queue.put((embeddings, [chunk.vector_id for chunk in chunk_batch]))
+            await add_queue.put(_END_OF_STREAM)
+
+        async def add_batch(embeddings, vector_ids):
+            await asyncio.to_thread(self.faiss_index.add_vectors_sync, embeddings, vector_ids)
+            self.progress["embedded"] += len(vector_ids)
+            if job is not None:
+                job.advance(len(vector_ids))
+            elapsed = time.perf_counter() - start_time
+            self.progress["chunks_per_second"] = round(self.progress["embedded"] / elapsed, 1) if elapsed > 0 else 0.0
+            logging.info(
+                f"Embedded {self.progress['embedded']}/{total} chunks "
+                f"({self.progress['chunks_per_second']} chunks/s)"
+            )
+
+        async def train_and_add(held_back):
+            await asyncio.to_thread(self.faiss_index.train_sync, np.vstack([embeddings for embeddings, _ in held_back]))
+            for embeddings, vector_ids in held_back:
+                await add_batch(embeddings, vector_ids)
+
+        async def add_stage():
+            # Index types with codebooks are trained on the first faiss_train_size
+            # vectors, which are held back until training is done.
+            held_back = []
+            held_count = 0
+            while (item := await add_queue.get()) is not _END_OF_STREAM:
+                if self.faiss_index.is_trained:
+                    await add_batch(*item)
+                    continue
+                held_back.append(item)
+                held_count += len(item[1])
+                if held_count >= config.faiss_train_size:
+                    await train_and_add(held_back)
+                    held_back = []
+            if held_back:
+                await train_and_add(held_back)
+
+        stages = [asyncio.create_task(stage()) for stage in (read_stage, encode_stage, add_stage)]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            for stage in stages:
+                stage.cancel()
+            raise
         await self.faiss_index.save_index()
+        await asyncio.to_thread(self.embedding_cache.flush)
+        logging.info(f"Embedding cache: {self.embedding_cache.stats()}")
+        logging.info(f"Shard {repository} built with {self.faiss_index.index.ntotal} vectors in {time.perf_counter() - start_time:.2f}s.")
+        await self._index_saved(repository)
+
+    async def apply_delta(self, added_chunks: list, removed_vector_ids: list[int], job=None, repository: str | None = None,
+                          expected_vector_ids: list[int] | None = None):
+        """
+        Embed and add only the new chunks and remove the vectors of deleted ones
+        in one repository's shard, then save the index and swap it in.
+        expected_vector_ids are vectors the chunk store already records for the
+        shard, e.g. of the chunks a re-index kept; any the index lacks, because
+        an earlier delta was interrupted before it was saved, are embedded too.
+        """
+        repository = self.shards.resolve(repository)
+        if not added_chunks and not removed_vector_ids and not expected_vector_ids:
+            logging.info("No vector changes to apply.")
+            return
+        await self.load_faiss_index(self.model.get_sentence_embedding_dimension(), repository)
+        if not self.faiss_index.is_id_mapped or not self.faiss_index.is_trained:
+            # Indexes written before vectors were ID-addressed can't take a delta, and
+            # index types with codebooks need the whole corpus to train on.
+            logging.info("Existing FAISS index can't take a delta, rebuilding it from all chunks.")
+            await self.create_vector_store(job, repository)
+            return
+        added_chunks = [chunk for chunk in added_chunks if chunk.content]
+        if expected_vector_ids:
+            pending = set(expected_vector_ids) - {chunk.vector_id for chunk in added_chunks} - set(removed_vector_ids)
+            missing = await asyncio.to_thread(self.faiss_index.missing_ids, pending)
+            if missing:
+                logging.info(f"Shard {repository} lacks {len(missing)} vectors of stored chunks, embedding them.")
+                added_chunks += [chunk for chunk in await self.tree_sitter_dao.get_bodies_by_vector_ids(missing) if chunk.content]
+        if not added_chunks and not removed_vector_ids:
+            logging.info("No vector changes to apply.")
+            return
+        if any(chunk.vector_id in self.faiss_index.tombstones for chunk in added_chunks):
+            # A reused ID must not resurrect its dead vector: drop the dead ones first.
+            await asyncio.to_thread(self.faiss_index.compact)
+        await self.faiss_index.remove_vectors(removed_vector_ids)
+        if added_chunks:
+            if job is not None:
+                job.start_stage("embed", total=len(added_chunks))
+            embeddings = await asyncio.to_thread(self.encode_chunks, added_chunks)
+            await self.faiss_index.add_vectors(embeddings, ids=[chunk.vector_id for chunk in added_chunks])
+            if job is not None:
+                job.advance(len(added_chunks))
+        if self.faiss_index.dead_ratio >= RAGConfig().faiss_compaction_threshold:
+            await asyncio.to_thread(self.faiss_index.compact)
+        await self.faiss_index.save_index()
+        await asyncio.to_thread(self.embedding_cache.flush)
+        logging.info(f"Applied vector delta to shard {repository}: +{len(added_chunks)} / -{len(removed_vector_ids)}.")
+        await self._index_saved(repository)
+
+    async def remove_vectors(self, vector_ids: list[int], repository: str | None = None):
+        """
+        Tombstone the vectors of deleted chunks so searches stop returning them.
+        """
+        await self.apply_delta([], vector_ids, None, repository)
+
+    async def compact_faiss_index(self, force: bool = False, repository: str | None = None) -> int:
+        """
+        Rebuild a shard's HNSW graph without tombstoned vectors once their share
+        of the index reaches faiss_compaction_threshold (or always, with force).
+        Returns the number of vectors dropped.
+        """
+        repository = self.shards.resolve(repository)
+        index_path = self.shards.index_path(repository)
+        if index_files.current_generation(index_path) is None:
+            return 0
+        self.faiss_index = await asyncio.to_thread(VectorStore.from_file, index_path)
+        dead_ratio = self.faiss_index.dead_ratio
+        if not force and dead_ratio < RAGConfig().faiss_compaction_threshold:
+            logging.info(f"FAISS dead ratio {dead_ratio:.2%} is below the compaction threshold, skipping.")
+            return 0
+        dropped = await asyncio.to_thread(self.faiss_index.compact)
+        await self.faiss_index.save_index()
+        await self._index_saved(repository)
+        return dropped
     
-    async def search_embeddings(self, query: str, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+    async def search_embeddings(self, query: str, k: int = 5, repository: str | None = None) -> tuple[np.ndarray, np.ndarray]:
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        k = min(k, RAGConfig().search_max_k)
         query_embedding = await self.embed_text(query)
         logging.info(f"Searching for query: {query} with embedding shape: {query_embedding.shape}")
-        await self.load_faiss_index(query_embedding.shape[1])
-        logging.info(f"FAISS index total vectors: {self.faiss_index.index.ntotal}")
-        if self.faiss_index is not None:
-            distances, indices = await self.faiss_index.search(query_embedding, k)
-            logging.info(f"indices: {indices}, distances: {distances}")
-            return distances, indices
-        return np.array([]), np.array([])
-
-    async def search(self, query: str, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
-        distances, indices = await self.search_embeddings(query, k)
-        if indices.size == 0:
+        # Serve from the resident shard; never touch the index file on the query path.
+        stores = self.shards.stores([self.shards.resolve(repository)])
+        store = stores[0][1] if stores else None
+        if store is None:
+            logging.warning("No FAISS index loaded, returning no results.")
             return np.array([]), np.array([])
-        op = []
-        for i in range(len(indices[0])):
-            vector_id = int(indices[0][i])
-            if vector_id == -1:
-                logging.warning(f"Invalid vector ID: {vector_id} at index {i}, skipping.")
-                continue  # skip invalid result
-            chunk = await self.tree_sitter_dao.get_chunk_by_vector_id(vector_id)
-            if chunk:
-                logging.info(f"Found chunk: {chunk.name} in file: {chunk.file_path}")
-                op.append((chunk.get_chunk_content(), float(distances[0][i])))
-        return op
\ No newline at end of file
+        logging.info(f"FAISS index total vectors: {store.index.ntotal}")
+        distances, indices = await asyncio.get_running_loop().run_in_executor(
+            _SEARCH_EXECUTOR, store.search_sync, query_embedding, k
+        )
+        logging.info(f"indices: {indices}, distances: {distances}")
+        return distances, indices
+
+    async def search(self, query: str, k: int = 5, filters: dict | None = None) -> list[tuple[str, float | None]]:
+        results = await self.search_batch([{"query": query, "k": k, "filters": filters}])
+        return [(chunk.get_chunk_content(), distance) for chunk, _, distance in results[0]]
+
+    def _encode_and_search(self, texts: list[str], groups: list[tuple]) -> list[tuple[np.ndarray, np.ndarray] | None]:
+        """
+        Encode all texts in one call, then run one multi-row search per group of
+        (rows, k, allowed_ids, stores). A group over several shard stores fans
+        out one search per shard on the shard executor and merges each row's
+        top k. Returns (distances, indices) aligned with texts, None for rows in
+        no group.
+        """
+        embeddings = self.encode_queries(texts)
+        hits = [None] * len(texts)
+        for rows, k, allowed_ids, stores in groups:
+            if len(stores) == 1:
+                distances, indices = stores[0].search_sync(embeddings[rows], k, allowed_ids=allowed_ids)
+            else:
+                futures = [_SHARD_EXECUTOR.submit(store.search_sync, embeddings[rows], k, allowed_ids) for store in stores]
+                shard_hits = [future.result() for future in futures]
+                merged = [
+                    merge_shard_hits([(distances[position], indices[position]) for distances, indices in shard_hits], k)
+                    for position in range(len(rows))
+                ]
+                distances = [row_distances for row_distances, _ in merged]
+                indices = [row_indices for _, row_indices in merged]
+            for row, row_distances, row_indices in zip(rows, distances, indices):
+                hits[row] = (row_distances, row_indices)
+        return hits
+
+    @staticmethod
+    def _lexical_search(lexical: LexicalIndex, requests: list[tuple], k: int) -> list[list[tuple[int, float]]]:
+        return [lexical.search_bm25(query, max(k, request_k), search_filter) for _, query, request_k, search_filter, _ in requests]
+
+    @staticmethod
+    def parse_search_request(request: dict) -> tuple[str, int, SearchFilter]:
+        """
+        The query, result count (capped at search_max_k) and filter of one
+        search_batch request. Raises ValueError for a request that can't be run.
+        """
+        query = request.get("query", "")
+        if not isinstance(query, str):
+            raise ValueError(f"query must be a string, got {type(query).__name__}")
+        k = request.get("k")
+        try:
+            k = 5 if k is None else int(k)
+        except (TypeError, ValueError):
+            raise ValueError(f"k must be an integer, got {k!r}")
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        filters = request.get("filters") or {}
+        if not isinstance(filters, dict):
+            raise ValueError(f"filters must be an object, got {type(filters).__name__}")
+        for field in ("repository", "language", "path_prefix", "chunk_type"):
+            value = filters.get(field)
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if value is not None and not all(isinstance(item, str) for item in values):
+                raise ValueError(f"filter {field} must be a string or a list of strings")
+        return query, min(k, RAGConfig().search_max_k), SearchFilter(filters)
+
+    async def search_batch(self, queries: list[dict]) -> list[list[tuple[Chunks, float, float | None]]]:
+        """
+        Run several searches at once. Each query is a dict with "query", and
+        optionally "k" and "filters" (see SearchFilter). Uncached queries are
+        encoded in one model call, searched with one multi-row FAISS search per
+        distinct filter, fanned out across the loaded shards the filter selects,
+        and hydrated with one DAO round trip. Queries that look
+        like identifiers are answered from the lexical index alone; others fuse
+        vector and BM25 hits by reciprocal rank when hybrid_search is on.
+        Returns (chunk, score, distance) lists aligned with queries, best first,
+        one per distinct body with every matching place it occurs in
+        chunk.locations. The score orders the results: the inner product for
+        vector-only results and the fused or lexical rank score otherwise. The
+        distance is always the inner product, or None if the chunk was not a
+        vector hit.
+        """
+        config = RAGConfig()
+        generation = self.search_generation()
+        results = [None] * len(queries)
+        pending = []
+        for i, request in enumerate(queries):
+            query, k, search_filter = self.parse_search_request(request)
+            cache_key = self.query_cache.result_key(query, k, search_filter.get_filter_info())
+            cached = self.query_cache.get_results(cache_key, generation)
+            if cached is not None:
+                results[i] = list(cached)
+            else:
+                pending.append((i, query, k, search_filter, cache_key))
+        if not pending:
+            return results
+
+        lexical = self.lexical_index if self.lexical_index.ready else None
+        hybrid = lexical is not None and config.hybrid_search
+        # Ranked (vector_id, score) lists, one per pending query.
+        ranked = [None] * len(pending)
+        # {vector_id: inner product} of each pending query's vector hits.
+        vector_distances = [{} for _ in pending]
+        semantic = []
+        for row, (i, query, k, search_filter, cache_key) in enumerate(pending):
+            # Identifier queries are answered from the symbol index without running the model.
+            if lexical is not None and is_symbol_query(query):
+                symbol_hits = lexical.lookup_symbol(query, k, search_filter)
+                if symbol_hits:
+                    ranked[row] = symbol_hits
+                    continue
+            semantic.append(row)
+
+        # Serve from the resident shards; never touch an index file on the query path.
+        # Filters compile to the set of allowed vector ids, applied inside the
+        # FAISS traversal. Queries sharing a filter are searched together, across
+        # the shards of the repositories it selects.
+        groups = {}
+        for position, row in enumerate(semantic):
+            # The last part of the result cache key is the normalized filter.
+            search_filter, cache_key = pending[row][3], pending[row][4]
+            groups.setdefault(cache_key[-1], (search_filter, []))[1].append(position)
+        search_groups = []
+        for search_filter, positions in groups.values():
+            stores = self.shards.stores(search_filter.repository)
+            if search_filter.repository is not None and len(stores) < len(search_filter.repository):
+                skipped = sorted(search_filter.repository - {name for name, _ in stores})
+                logging.warning(f"Shards not loaded, not searched: {skipped}")
+            if not stores:
+                continue
+            if not search_filter.is_empty():
+                await self.chunk_attributes.ensure_built(self.tree_sitter_dao)
+            allowed_ids = None if search_filter.is_empty() else self.chunk_attributes.allowed_ids(search_filter)
+            fetch_k = max(pending[semantic[position]][2] for position in positions)
+            if hybrid:
+                fetch_k = max(fetch_k, config.hybrid_candidates)
+            search_groups.append((positions, fetch_k, allowed_ids, [store for _, store in stores]))
+        if semantic and not search_groups:
+            logging.warning("No FAISS shard loaded, searching lexically only.")
+        if search_groups:
+            hits = await asyncio.get_running_loop().run_in_executor(
+                _SEARCH_EXECUTOR, self._encode_and_search, [pending[row][1] for row in semantic], search_groups
+            )
+            shard_count = len({id(store) for _, _, _, stores in search_groups for store in stores})
+            logging.info(f"Searched {len(semantic)} queries in {len(search_groups)} filter groups across {shard_count} shards.")
+            for row, hit in zip(semantic, hits):
+                if hit is not None:
+                    distances, indices = hit
+                    ranked[row] = [(int(vector_id), float(distance)) for vector_id, distance in zip(indices, distances) if vector_id != -1]
+                    vector_distances[row] = dict(ranked[row])
+        # Queries no shard answered fall back to BM25 alone.
+        lexical_rows = semantic if hybrid else [row for row in semantic if ranked[row] is None]
+        if lexical_rows and lexical is not None:
+            lexical_hits = await asyncio.get_running_loop().run_in_executor(
+                _SEARCH_EXECUTOR, self._lexical_search, lexical, [pending[row] for row in lexical_rows], config.hybrid_candidates
+            )
+            for row, lexical_ranking in zip(lexical_rows, lexical_hits):
+                if ranked[row] is None:
+                    ranked[row] = lexical_ranking
+                else:
+                    ranked[row] = reciprocal_rank_fusion(
+                        [[vector_id for vector_id, _ in ranked[row]], [vector_id for vector_id, _ in lexical_ranking]],
+                        pending[row][2],
+                        config.rrf_k
+                    )
+
+        # Hydrate every hit of every query in one round trip. A hit is a distinct
+        # body; it expands to every occurrence that matches the query's filter.
+        ranked = [(hits or [])[:pending[row][2]] for row, hits in enumerate(ranked)]
+        hit_ids = list(dict.fromkeys(vector_id for hits in ranked for vector_id, _ in hits))
+        occurrences = await self.tree_sitter_dao.get_occurrences_by_vector_ids(hit_ids)
+        for row, ((i, query, k, search_filter, cache_key), hits) in enumerate(zip(pending, ranked)):
+            op = []
+            for vector_id, score in hits:
+                # The attribute map can lag a write by one search; recheck the hydrated chunks.
+                matching = [chunk for chunk in occurrences.get(vector_id, ()) if search_filter.matches(chunk)]
+                if not matching:
+                    continue
+                chunk = copy.copy(matching[0])
+                chunk.locations = [occurrence.get_location() for occurrence in matching]
+                op.append((chunk, score, vector_distances[row].get(vector_id)))
+            results[i] = op
+            self.query_cache.put_results(cache_key, generation, tuple(op))
+        return results
@@ -0,0 +1,54 @@
+import asyncio
+from app.beans.chunks import Chunks
+from app.beans.search_filter import SearchFilter
+from app.rag.chunk_attributes import ChunkAttributeIndex
+
+def occurrence(occurrence_id: str, vector_id: int, file_path: str, chunk_type: str = "function_definition", repository: str = "codebase") -> Chunks:
+    return Chunks(occurrence_id=occurrence_id, vector_id=vector_id, file_path=file_path, type=chunk_type, repository=repository)
+
+def allowed(index: ChunkAttributeIndex, **filters) -> list[int]:
+    return index.allowed_ids(SearchFilter(filters)).tolist()
+
+class StoredAttributes:
+    # Stands in for the DAO's attribute scan at startup.
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def get_chunk_attributes(self):
+        for row in self.rows:
+            yield row
+
+def test_writes_are_applied_without_a_rebuild():
+    index = ChunkAttributeIndex()
+    index.chunks_added([occurrence("a", 1, "src/app.py"), occurrence("b", 2, "src/util.js"), occurrence("c", 3, "lib/app.py")])
+    assert allowed(index, language="python") == [1, 3]
+    assert allowed(index, path_prefix="src/") == [1, 2]
+    index.chunks_removed([occurrence("a", 1, "src/app.py")])
+    assert allowed(index, language="python") == [3]
+    index.chunks_added([occurrence("d", 4, "src/new.py")])
+    assert allowed(index, language="python") == [3, 4]
+    # The freed slot is reused rather than growing the arrays.
+    assert len(index.slots) == 3 and index.vector_ids.shape[0] == 1024
+
+def test_shared_body_stays_allowed_while_a_matching_occurrence_remains():
+    index = ChunkAttributeIndex()
+    index.chunks_added([occurrence("a", 7, "src/a.py"), occurrence("b", 7, "tests/a.py")])
+    index.chunks_removed([occurrence("a", 7, "src/a.py")])
+    assert allowed(index, path_prefix="src/") == []
+    assert allowed(index, path_prefix="tests/") == [7]
+
+def test_growth_and_clear():
+    index = ChunkAttributeIndex()
+    index.chunks_added([occurrence(str(i), i, f"f{i % 3}.py", repository=f"r{i % 2}") for i in range(3000)])
+    assert len(allowed(index, repository="r1")) == 1500
+    index.chunks_cleared()
+    assert allowed(index, language="python") == []
+
+def test_build_merges_with_writes_made_meanwhile():
+    index = ChunkAttributeIndex()
+    index.chunks_added([occurrence("new", 9, "src/new.py")])
+    dao = StoredAttributes([("old", 1, "src/old.py", "class_definition", "codebase"), ("new", 9, "src/new.py", "function_definition", "codebase")])
+    asyncio.run(index.ensure_built(dao))
+    assert index.ready
+    assert allowed(index, language="python") == [1, 9]
+    assert allowed(index, chunk_type="class_definition") == [1]
@@ -0,0 +1,123 @@
+import asyncio
+import uuid
+import gridfs
+import pymongo
+import pytest
+from app.beans.chunks import Chunks
+from app.config import RAGConfig
+from app.db import mongodb
+from app.db.mongodb import MongoClientPool
+from app.db.tree_sitter_chunks_DAO import TreeSitterChunksDAO, LEGACY_COLLECTION_NAME, BODY_FIELDS
+
+# These run against the MongoDB in RAGConfig, in a throwaway database.
+try:
+    pymongo.MongoClient(RAGConfig().mongo_uri, serverSelectionTimeoutMS=1000).admin.command("ping")
+except pymongo.errors.PyMongoError:
+    pytest.skip("MongoDB is not reachable", allow_module_level=True)
+
+@pytest.fixture
+def run(monkeypatch):
+    class Config(RAGConfig):
+        def __init__(self):
+            super().__init__()
+            self.db_name = f"rag_test_{uuid.uuid4().hex}"
+    monkeypatch.setattr(mongodb, "RAGConfig", Config)
+    monkeypatch.setattr(TreeSitterChunksDAO, "listeners", [])
+    monkeypatch.setattr(TreeSitterChunksDAO, "_indexes_ensured", False)
+    monkeypatch.setattr(TreeSitterChunksDAO, "_change_log_ensured", False)
+
+    def run_test(test):
+        # The shared client is bound to the loop it was first used on, so each test gets its own.
+        async def run_and_clean_up():
+            dao = TreeSitterChunksDAO()
+            try:
+                await test(dao)
+            finally:
+                await dao.client.drop_database(dao.db_name)
+                await MongoClientPool.close()
+        asyncio.run(run_and_clean_up())
+    return run_test
+
+def chunk(content: str, file_path: str, repository: str = "r1", vector_id: int | None = None) -> Chunks:
+    return Chunks(content=content, file_path=file_path, repository=repository, type="function_definition",
+                  start_point=[0, 0], end_point=[1, 0], vector_id=vector_id)
+
+def test_identical_chunks_share_one_body(run):
+    async def test(dao):
+        new = await dao.insert_chunks([chunk("def f(): pass", "a.py"), chunk("def f(): pass", "b.py"), chunk("def g(): pass", "c.py")])
+        assert sorted(new_chunk.file_path for new_chunk in new) == ["a.py", "c.py"]
+        a, b = await dao.get_chunks_by_file("a.py"), await dao.get_chunks_by_file("b.py")
+        assert a[0].vector_id == b[0].vector_id and a[0].content == b[0].content == "def f(): pass"
+        assert a[0].hash == Chunks.compute_hash("def f(): pass")
+        assert await dao.bodies.count_documents({}) == 2
+        assert await dao.collection.count_documents({}) == 3
+        # Occurrences don't carry the body.
+        assert await dao.collection.count_documents({"$or": [{field: {"$exists": True}} for field in BODY_FIELDS]}) == 0
+        # The body is new to another repository's shard, under the same vector ID.
+        [other] = await dao.insert_chunks([chunk("def f(): pass", "a.py", repository="r2")])
+        assert other.vector_id == a[0].vector_id
+        assert await dao.insert_chunks([chunk("def f(): pass", "d.py")]) == []
+    run(test)
+
+def test_body_is_deleted_with_its_last_occurrence(run):
+    async def test(dao):
+        await dao.insert_chunks([chunk("shared", "a.py"), chunk("shared", "b.py"), chunk("shared", "a.py", repository="r2")])
+        [vector_id] = {found.vector_id for found in await dao.get_chunks_by_file("a.py")}
+        # b.py still holds it in r1.
+        assert await dao.delete_chunks_by_file("b.py") == []
+        assert await dao.delete_chunks_by_repository("r1") == [vector_id]
+        assert await dao.bodies.count_documents({}) == 1
+        assert await dao.delete_chunks_by_repository("r2") == [vector_id]
+        assert await dao.bodies.count_documents({}) == 0
+    run(test)
+
+def test_compressed_and_gridfs_bodies_round_trip(run):
+    async def test(dao):
+        dao.compression_min_bytes = 16
+        compressed, large = "x = 1\n" * 100, "\n".join(f"y{i} = {i}" for i in range(20000))
+        dao.inline_max_bytes = len(compressed)
+        await dao.insert_chunks([chunk(compressed, "a.py"), chunk(large, "b.py")])
+        assert (await dao.bodies.find_one({"_id": Chunks.compute_hash(compressed)}))["compression"] == "zlib"
+        assert "gridfs_id" in await dao.bodies.find_one({"_id": Chunks.compute_hash(large)})
+        assert [found.content for found in await dao.get_chunks_by_file("a.py")] == [compressed]
+        assert [found.content for found in await dao.get_chunks_by_file("b.py")] == [large]
+        await dao.delete_chunks_by_file("b.py")
+        assert await dao.gridfs_files.count_documents({}) == 0
+    run(test)
+
+def test_inline_chunks_are_split_into_occurrences_and_bodies(run):
+    async def test(dao):
+        # Written before bodies were shared, with the per-process hash() earlier versions stored.
+        await dao.collection.insert_many([
+            {"file_path": "a.py", "content": "same", "hash": 123, "vector_id": 1, "repository": "r1"},
+            {"file_path": "b.py", "content": "other", "hash": 456, "vector_id": 2, "repository": "r1"},
+            {"file_path": "c.py", "content": "same", "hash": 789, "vector_id": 3, "repository": "r1"},
+        ])
+        assert await dao.migrate_inline_chunks(batch_size=2) == [3]
+        occurrences = {document["file_path"]: document async for document in dao.collection.find({})}
+        assert occurrences["a.py"]["hash"] == occurrences["c.py"]["hash"] == Chunks.compute_hash("same")
+        assert [occurrences[path]["vector_id"] for path in ("a.py", "b.py", "c.py")] == [1, 2, 1]
+        assert not any(field in document for document in occurrences.values() for field in BODY_FIELDS)
+        assert [found.content for found in await dao.get_chunks_by_file("c.py")] == ["same"]
+        assert await dao.bodies.count_documents({}) == 2
+        # Nothing is left to migrate.
+        assert await dao.migrate_inline_chunks() == []
+    run(test)
+
+def test_legacy_gridfs_chunks_are_migrated(run):
+    async def test(dao):
+        legacy = gridfs.AsyncGridFSBucket(dao.db, bucket_name=LEGACY_COLLECTION_NAME + "_gridfs")
+        for file_path, content, vector_id in (("d.py", "new", None), ("a.py", "same", 0), ("b.py", "same", 1), ("c.py", "other", 2)):
+            metadata = {"file_path": file_path, "hash": 42, "vector_id": vector_id, "repository": "r1"}
+            await legacy.upload_from_stream(file_path, content.encode("utf-8"), metadata=metadata)
+        assert await dao.migrate_legacy_chunks(batch_size=3) == [1]
+        occurrences = {document["file_path"]: document async for document in dao.collection.find({})}
+        assert [occurrences[path]["vector_id"] for path in ("a.py", "b.py", "c.py")] == [0, 0, 2]
+        # A chunk that was never indexed gets an ID no legacy chunk had.
+        assert occurrences["d.py"]["vector_id"] > 2
+        for file_path, document in occurrences.items():
+            [found] = await dao.get_chunks_by_file(file_path)
+            assert document["hash"] == Chunks.compute_hash(found.content)
+        assert await dao.db[LEGACY_COLLECTION_NAME + "_gridfs.files"].count_documents({}) == 0
+        assert await dao.migrate_legacy_chunks() == []
+    run(test)
@@ -0,0 +1,66 @@
+import csv
+import pytest
+from app.config import RAGConfig
+from app.helpers import file_parser
+from app.helpers.file_parser import FileParser
+
+@pytest.fixture
+def max_bytes(monkeypatch):
+    # Sets data_chunk_max_bytes for the parser under test.
+    def set_max_bytes(value: int):
+        class Config(RAGConfig):
+            def __init__(self):
+                super().__init__()
+                self.data_chunk_max_bytes = value
+        monkeypatch.setattr(file_parser, "RAGConfig", Config)
+    return set_max_bytes
+
+def write_csv(tmp_path, rows: list[list[str]]) -> str:
+    path = tmp_path / "data.csv"
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        csv.writer(file).writerows(rows)
+    return str(path)
+
+def test_rows_are_windowed_under_the_limit(tmp_path, max_bytes):
+    max_bytes(60)
+    rows = [["id", "name", "score"]] + [[str(i), f"name {i}", str(i * 1.5)] for i in range(50)]
+    chunks = list(FileParser(write_csv(tmp_path, rows)).parse_csv())
+    assert len(chunks) > 1
+    lines = []
+    for chunk in chunks:
+        header, *window = chunk.content.split("\n")
+        # Every window repeats the header so it reads on its own.
+        assert header == "id, name, score"
+        assert len(chunk.content) <= 60
+        assert chunk.type == "csv_rows" and chunk.hash == chunk.compute_hash(chunk.content)
+        lines.extend(window)
+    assert lines == [", ".join(row) for row in rows[1:]]
+    # Windows cover the file's lines back to back.
+    assert chunks[0].start_point == (1, 0) and chunks[-1].end_point == (50, 0)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.start_point[0] == previous.end_point[0] + 1
+
+def test_row_larger_than_the_limit_gets_its_own_window(tmp_path, max_bytes):
+    max_bytes(30)
+    rows = [["id", "text"], ["1", "short"], ["2", "x" * 100], ["3", "short"]]
+    chunks = list(FileParser(write_csv(tmp_path, rows)).parse_csv())
+    assert [chunk.content for chunk in chunks] == ["id, text\n1, short", "id, text\n2, " + "x" * 100, "id, text\n3, short"]
+
+def test_quoted_fields_spanning_lines(tmp_path, max_bytes):
+    rows = [["id", "text"], ["1", "first\nsecond, with a comma"], ["2", "say \"hi\""], ["3", "a\nb\nc"]]
+    path = write_csv(tmp_path, rows)
+    max_bytes(4096)
+    [chunk] = FileParser(path).parse_csv()
+    assert chunk.content == "id, text\n1, first\nsecond, with a comma\n2, say \"hi\"\n3, a\nb\nc"
+    assert (chunk.start_point, chunk.end_point) == ((1, 0), (6, 0))
+    # Split one row per window, the row ranges follow the file's lines.
+    max_bytes(1)
+    chunks = list(FileParser(path).parse_csv())
+    assert [(chunk.start_point[0], chunk.end_point[0]) for chunk in chunks] == [(1, 2), (3, 3), (4, 6)]
+
+def test_empty_and_header_only_files(tmp_path, max_bytes):
+    max_bytes(4096)
+    path = tmp_path / "empty.csv"
+    path.write_text("")
+    assert list(FileParser(str(path)).parse_csv()) == []
+    assert list(FileParser(write_csv(tmp_path, [["id", "text"]])).parse_csv()) == []
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+from app.rag.embedding_cache import EmbeddingCache
+
+DIMENSION = 8
+
+def vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((count, DIMENSION), dtype=np.float32)
+
+def open_cache(tmp_path, max_entries: int = 1000) -> EmbeddingCache:
+    return EmbeddingCache(str(tmp_path), "test-model", DIMENSION, max_entries)
+
+def file_state(cache: EmbeddingCache) -> dict:
+    return {
+        path: (os.path.getmtime(path), os.path.getsize(path))
+        for path in (cache.records_path, cache.keys_path, cache.last_used_path) if os.path.exists(path)
+    }
+
+def test_entries_survive_reopening(tmp_path):
+    cache = open_cache(tmp_path)
+    stored = vectors(3)
+    cache.put_many(["a", "b", "c"], stored)
+    cache.flush()
+    found, missing = open_cache(tmp_path).get_many(["c", "x", "a"])
+    assert missing == [1]
+    np.testing.assert_array_equal(found[[0, 2]], stored[[2, 0]])
+
+def test_record_overwritten_after_metadata_was_saved_is_a_miss(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a", "b"], vectors(2))
+    cache.flush()
+    # Another entry lands in a's slot, but the crash loses the metadata saying so.
+    slot = cache.slots[cache._key("a")]
+    cache.records[slot] = (cache._key("z"), 0, vectors(1, seed=1)[0])
+    cache.records.flush()
+    reopened = open_cache(tmp_path)
+    _, missing = reopened.get_many(["a", "b"])
+    assert missing == [0]
+    # The stale slot is freed, not served again.
+    assert reopened._key("a") not in reopened.slots
+
+def test_read_only_cache_never_writes_the_files(tmp_path):
+    writer = open_cache(tmp_path)
+    writer.put_many(["a"], vectors(1))
+    writer.flush()
+    before = file_state(writer)
+    reader = open_cache(tmp_path)
+    reader.set_writable(False)
+    found, missing = reader.get_many(["a", "b"])
+    assert missing == [1]
+    np.testing.assert_array_equal(found[0], vectors(1)[0])
+    reader.put_many(["b"], vectors(1, seed=2))
+    reader.flush()
+    reader.compact()
+    assert file_state(writer) == before
+    _, missing = open_cache(tmp_path).get_many(["b"])
+    assert missing == [0]
+
+def test_flush_without_changes_leaves_files_alone(tmp_path):
+    cache = open_cache(tmp_path, max_entries=10)
+    cache.put_many([str(i) for i in range(1500)], vectors(1500))
+    # Save the metadata as is, leaving most of the file free after eviction.
+    cache.records.flush()
+    cache._save_metadata()
+    reopened = open_cache(tmp_path, max_entries=10)
+    assert len(reopened.free_slots) > 1024
+    before = file_state(reopened)
+    reopened.flush()
+    assert file_state(reopened) == before
+    # Once something changes, the flush compacts.
+    reopened.put_many(["late"], vectors(1, seed=3))
+    reopened.flush()
+    assert reopened.keys.shape[0] <= 11
+
+def test_compact_keeps_live_entries(tmp_path):
+    cache = open_cache(tmp_path, max_entries=100)
+    stored = vectors(300)
+    cache.put_many([str(i) for i in range(300)], stored)
+    cache.compact()
+    live = [key for key in map(str, range(300)) if cache._key(key) in cache.slots]
+    assert 0 < len(live) <= 100
+    found, missing = open_cache(tmp_path, max_entries=100).get_many(live)
+    assert missing == []
+    np.testing.assert_array_equal(found, stored[[int(key) for key in live]])
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import numpy as np
+from app.rag.faiss import index_files
+from app.rag.faiss.index_holder import FaissIndexHolder
+from app.rag.faiss.vector_store import VectorStore
+
+DIMENSION = 8
+
+def saved_store(faiss_filepath: str, count: int) -> VectorStore:
+    store = VectorStore(DIMENSION, index_type="flat", faiss_filepath=faiss_filepath)
+    store.add_vectors_sync(np.random.default_rng(count).random((count, DIMENSION), dtype=np.float32), np.arange(count))
+    asyncio.run(store.save_index())
+    return store
+
+def test_marker_points_at_the_newest_published_generation(tmp_path):
+    faiss_filepath = str(tmp_path / "index.faiss")
+    assert index_files.current_generation(faiss_filepath) is None
+    first, first_path = index_files.reserve_generation(faiss_filepath)
+    second, second_path = index_files.reserve_generation(faiss_filepath)
+    # Reserving creates the file, so a second writer gets the next number.
+    assert (first, second) == (1, 2) and os.path.exists(first_path)
+    assert index_files.publish_generation(faiss_filepath, second)
+    # A slower writer finishing an older generation doesn't roll the marker back.
+    assert not index_files.publish_generation(faiss_filepath, first)
+    assert index_files.current_generation(faiss_filepath) == (2, second_path)
+    assert index_files.reserve_generation(faiss_filepath)[0] == 3
+
+def test_index_from_before_generations_is_generation_zero(tmp_path):
+    faiss_filepath = str(tmp_path / "index.faiss")
+    open(faiss_filepath, "wb").close()
+    assert index_files.current_generation(faiss_filepath) == (0, faiss_filepath)
+    generation, _ = index_files.reserve_generation(faiss_filepath)
+    index_files.publish_generation(faiss_filepath, generation)
+    index_files.prune_generations(faiss_filepath, keep=3)
+    assert not os.path.exists(faiss_filepath)
+
+def test_unreadable_marker_is_ignored(tmp_path):
+    faiss_filepath = str(tmp_path / "index.faiss")
+    with open(index_files.marker_path(faiss_filepath), "w") as file:
+        file.write("garbage")
+    assert index_files.read_marker(faiss_filepath) is None
+
+def test_saves_prune_all_but_the_newest_generations(tmp_path):
+    faiss_filepath = str(tmp_path / "index.faiss")
+    for count in range(1, 6):
+        store = saved_store(faiss_filepath, count)
+    assert store.generation == 5
+    kept = sorted(name for name in os.listdir(tmp_path) if name.endswith(".faiss"))
+    assert kept == [f"index.g{generation:06d}.faiss" for generation in range(5 - store.keep_generations + 1, 6)]
+    index_files.remove_index_files(faiss_filepath)
+    assert os.listdir(tmp_path) == []
+
+def test_holder_swaps_in_a_new_generation_only_once_published(tmp_path):
+    faiss_filepath = str(tmp_path / "index.faiss")
+    holder = FaissIndexHolder(faiss_filepath)
+    assert not holder.load()
+    saved_store(faiss_filepath, 10)
+    assert holder.load()
+    serving = holder.get_store()
+    assert serving.index.ntotal == 10 and serving.generation == 1
+    # Nothing new was published.
+    assert not holder.load()
+    # A generation written but not yet published stays invisible.
+    generation, _ = index_files.reserve_generation(faiss_filepath)
+    assert not holder.load()
+    assert holder.get_store() is serving
+    saved_store(faiss_filepath, 20)
+    assert holder.load()
+    assert holder.get_store().index.ntotal == 20 and holder.get_store().generation == generation + 1
+    # A search that took the previous store still runs against it.
+    assert serving.index.ntotal == 10
+    _, ids = serving.search_sync(np.ones(DIMENSION, dtype=np.float32), 3)
+    assert (ids >= 0).all()
+    index_files.remove_index_files(faiss_filepath)
+    assert holder.load() and holder.get_store() is None
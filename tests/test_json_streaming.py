@@ -0,0 +1,71 @@
+import io
+import json
+import random
+import pytest
+from app.helpers.file_parser import iter_json_lines, json_lines
+
+def whole_document_lines(document, max_bytes: int) -> list[str]:
+    # What streaming must produce: json_lines over the decoded document's members.
+    if isinstance(document, dict):
+        return [line for key, value in document.items() for line in json_lines(key, value, max_bytes)]
+    if isinstance(document, list):
+        return [line for index, value in enumerate(document) for line in json_lines(f"[{index}]", value, max_bytes)]
+    return list(json_lines("$", document, max_bytes))
+
+def stream(text: str, max_bytes: int = 4096, read_size: int = 1 << 16) -> list[str]:
+    return list(iter_json_lines(io.StringIO(text), max_bytes, read_size))
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 5, 7, 64])
+@pytest.mark.parametrize("document", [
+    {"data": [1.5, -2.25, 3e-7, -25000000000.0, 1E+20, 0, -0.0]},
+    {"k1": [{"k3": {"k1": {"k1": -25000000000.0}}}]},
+    [12345678901234567890, 1.0e10, -1, 42],
+    -123.456e-7,
+    {"quote": "a \"quoted\" word", "escapes": "tab\tnew\nline \\ back", "unicode": "café 😀"},
+    {"literals": [True, False, None], "empty": {}, "nothing": []},
+    "just a string",
+])
+def test_values_split_across_reads(document, read_size):
+    for ensure_ascii in (True, False):
+        text = json.dumps(document, ensure_ascii=ensure_ascii)
+        assert stream(text, read_size=read_size) == whole_document_lines(document, 4096)
+
+def test_float_cut_at_default_read_size():
+    # Every offset of the float array lands on some read boundary for one of the key lengths.
+    for padding in range(5):
+        document = {"d" + "x" * padding: [1.5] * 20000}
+        assert stream(json.dumps(document)) == whole_document_lines(document, 4096)
+
+def test_escaped_string_split_across_reads():
+    value = "\\" * 7 + "\"" + "\\u00e9" * 3
+    document = {"s": value, "t": [value, value]}
+    text = json.dumps(document)
+    for read_size in range(1, 12):
+        assert stream(text, read_size=read_size) == whole_document_lines(document, 4096)
+
+def test_large_containers_are_streamed_by_member():
+    document = {"items": [{"id": i, "name": f"item {i}", "tags": ["a", "b"]} for i in range(2000)], "total": 2000}
+    lines = stream(json.dumps(document, indent=2), max_bytes=256, read_size=100)
+    assert lines == whole_document_lines(document, 256)
+    assert lines[0] == 'items[0]: {"id": 0, "name": "item 0", "tags": ["a", "b"]}'
+    assert lines[-1] == "total: 2000"
+
+def test_random_documents_match_whole_decode():
+    generator = random.Random(7)
+    scalars = [0, -1, 2.5, -25000000000.0, 1e-7, 12345678901, True, False, None, "", 'a"b\\cé\n']
+    def value(depth):
+        roll = generator.random()
+        if depth > 3 or roll < 0.4:
+            return generator.choice(scalars + [generator.uniform(-1e6, 1e6), generator.randint(-10**12, 10**12)])
+        if roll < 0.7:
+            return [value(depth + 1) for _ in range(generator.randint(0, 5))]
+        return {f"k{i}": value(depth + 1) for i in range(generator.randint(0, 5))}
+    for _ in range(300):
+        document = value(0)
+        text = json.dumps(document, indent=generator.choice([None, 1]))
+        read_size = generator.choice([1, 2, 3, 7, 16])
+        assert stream(text, max_bytes=64, read_size=read_size) == whole_document_lines(document, 64)
+
+def test_malformed_document_raises():
+    with pytest.raises(ValueError):
+        stream('{"a": [1, 2', read_size=3)
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from app.rag.search_coalescer import SearchCoalescer
+from app.rag.vector_embedding import VectorEmbedding
+
+class BatchSearcher:
+    # Stands in for VectorEmbedding: fails any batch holding a query it can't run.
+    parse_search_request = staticmethod(VectorEmbedding.parse_search_request)
+
+    def __init__(self):
+        self.batches = []
+
+    async def search_batch(self, queries: list[dict]) -> list:
+        self.batches.append([request["query"] for request in queries])
+        if any(request["query"] == "boom" for request in queries):
+            raise RuntimeError("search failed")
+        return [[request["query"]] for request in queries]
+
+def test_invalid_request_fails_only_its_caller():
+    async def run():
+        searcher = BatchSearcher()
+        coalescer = SearchCoalescer(searcher, window_ms=50, max_batch_size=8)
+        with pytest.raises(ValueError):
+            await coalescer.search(["not", "a", "string"], 5)
+        with pytest.raises(ValueError):
+            await coalescer.search("query", 0)
+        with pytest.raises(ValueError):
+            await coalescer.search("query", 5, {"path_prefix": [1, 2]})
+        assert searcher.batches == []
+    asyncio.run(run())
+
+def test_failed_batch_is_retried_per_request():
+    async def run():
+        searcher = BatchSearcher()
+        coalescer = SearchCoalescer(searcher, window_ms=50, max_batch_size=8)
+        results = await asyncio.gather(
+            coalescer.search("a", 5), coalescer.search("boom", 5), coalescer.search("b", 5),
+            return_exceptions=True
+        )
+        assert results[0] == ["a"] and results[2] == ["b"]
+        assert isinstance(results[1], RuntimeError)
+        assert searcher.batches[0] == ["a", "boom", "b"]
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import asyncio
+import numpy as np
+from app.rag.faiss.vector_store import VectorStore
+
+DIMENSION = 16
+
+def vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((count, DIMENSION), dtype=np.float32) - 0.5
+
+def hnsw_store(tmp_path, count: int = 200) -> tuple[VectorStore, np.ndarray]:
+    store = VectorStore(DIMENSION, index_type="hnsw_flat", faiss_filepath=str(tmp_path / "index.faiss"))
+    stored = vectors(count)
+    store.add_vectors_sync(stored, np.arange(100, 100 + count))
+    return store, stored
+
+def found_ids(store: VectorStore, queries: np.ndarray, k: int) -> set[int]:
+    _, ids = store.search_sync(queries, k)
+    return set(ids[ids >= 0].tolist())
+
+def test_tombstoned_vectors_are_never_returned(tmp_path):
+    store, stored = hnsw_store(tmp_path)
+    assert not store.supports_removal
+    removed = asyncio.run(store.remove_vectors([100, 101, 102, 102]))
+    assert removed == 3
+    # Tombstoning an id twice doesn't count it again.
+    assert asyncio.run(store.remove_vectors([101])) == 0
+    assert store.index.ntotal == 200
+    assert store.dead_ratio == 3 / 200
+    # Each removed vector's own query would rank it first.
+    assert found_ids(store, stored[:3], 10).isdisjoint({100, 101, 102})
+    assert store.missing_ids([100, 103, 999]) == [999, 100]
+
+def test_compact_drops_tombstoned_vectors(tmp_path):
+    store, stored = hnsw_store(tmp_path)
+    asyncio.run(store.remove_vectors(list(range(100, 150))))
+    assert store.compact() == 50
+    assert store.index.ntotal == 150
+    assert store.tombstones == set() and store.dead_ratio == 0.0
+    assert set(store.stored_ids().tolist()) == set(range(150, 300))
+    # The live vectors are still found after the rebuild.
+    _, ids = store.search_sync(stored[50:60], 1)
+    assert ids[:, 0].tolist() == list(range(150, 160))
+    # Nothing to compact the second time.
+    assert store.compact() == 0
+
+def test_tombstones_are_saved_with_their_generation(tmp_path):
+    store, stored = hnsw_store(tmp_path)
+    asyncio.run(store.remove_vectors([100, 105]))
+    asyncio.run(store.save_index())
+    reloaded = VectorStore.from_file(store.faiss_filepath)
+    assert reloaded.tombstones == {100, 105}
+    assert found_ids(reloaded, stored[[0, 5]], 10).isdisjoint({100, 105})
+    # Compacting and saving again publishes a generation without tombstones.
+    store.compact()
+    asyncio.run(store.save_index())
+    reloaded = VectorStore.from_file(store.faiss_filepath)
+    assert reloaded.generation == 2
+    assert reloaded.tombstones == set() and reloaded.index.ntotal == 198
+
+def test_flat_index_removes_vectors_outright(tmp_path):
+    store = VectorStore(DIMENSION, index_type="flat", faiss_filepath=str(tmp_path / "index.faiss"))
+    stored = vectors(20)
+    store.add_vectors_sync(stored, np.arange(20))
+    assert store.supports_removal
+    assert asyncio.run(store.remove_vectors([3, 4])) == 2
+    assert store.index.ntotal == 18 and store.tombstones == set()
+    assert 3 not in found_ids(store, stored[3:4], 5)